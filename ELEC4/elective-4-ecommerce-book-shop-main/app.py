@@ -5,45 +5,174 @@ from modules.customer import customer_bp
 from modules.product import product_bp
 from modules.category import category_bp
 from modules.admin_orders import admin_orders_bp
+from modules.api import api_bp, init_api
+from modules.catalog_io import init_catalog_io
+from database.connection import init_db
+from database.instrumentation import init_instrumentation
+from database.migrate import init_migrations
+from modules.pagination import init_pagination
+from modules.streaming import init_streaming
+from modules.images import init_images
+from modules.uploads import init_uploads
+from modules.sales import init_sales
+from modules.jobs import init_jobs
+from modules.holds import init_holds
+from modules.stock import init_stock
+from modules.orders import init_orders
+from modules.http_cache import init_http_cache, conditional
+from modules.sessions import init_sessions
+from modules.fragments import init_templates
 import os
 
 
-app = Flask(__name__)
-app.secret_key = "secret123"  # Change this in production!
+# =====================================
+# APP FACTORY
+# =====================================
+# `flask run` finds create_app() on its own; production servers load
+# wsgi.py, which builds the app once in the master before forking.
 
-@app.route('/')
-def landing():
-    return render_template('index.html')
 
-# File Upload Config
-app.config['UPLOAD_FOLDER'] = 'static/img'
-app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
+def create_app(config=None):
+    """Build the app; `config` overrides are applied last (benchmarks, scripts)."""
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SECRET_KEY", "secret123")  # Set SECRET_KEY in production!
 
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    # Sessions ('sqlite' / 'redis' = server-side with an in-process LRU, 'cookie' = signed cookie)
+    app.config['SESSION_BACKEND'] = os.environ.get('SESSION_BACKEND', 'sqlite')
+    app.config['SESSION_SQLITE_PATH'] = os.environ.get(
+        'SESSION_SQLITE_PATH', os.path.join(app.instance_path, 'sessions.db'))
+    app.config['SESSION_REDIS_URL'] = os.environ.get('SESSION_REDIS_URL', 'redis://localhost:6379/1')
+    app.config['SESSION_LRU_SIZE'] = 10000  # per worker; 0 when Redis is shared by several hosts
+    init_sessions(app)
 
-# Register Blueprints
-app.register_blueprint(auth_bp)
-app.register_blueprint(admin_bp, url_prefix="/admin")
-app.register_blueprint(customer_bp, url_prefix="/customer")
-app.register_blueprint(product_bp, url_prefix="/product")
-app.register_blueprint(category_bp, url_prefix="/category")
-app.register_blueprint(admin_orders_bp, url_prefix="/admin")
+    # Templates (compiled bytecode kept on disk; {% cache %} fragments in a per-process LRU)
+    app.config['TEMPLATE_BYTECODE_CACHE_DIR'] = os.path.join(app.instance_path, 'jinja-cache')  # '' = off
+    app.config['FRAGMENT_CACHE_MAXSIZE'] = 10000  # fragments per worker; 0 = off
+    init_templates(app)
 
+    @app.route('/')
+    def landing():
+        return conditional('landing', lambda: render_template('index.html'))
 
-# Prevent cached pages after logout
+    # File Upload Config
+    app.config['UPLOAD_FOLDER'] = 'static/img'
+    app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
 
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-@app.after_request
-def add_no_cache_headers(response):
-    response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0"
-    response.headers["Pragma"] = "no-cache"
-    response.headers["Expires"] = "0"
-    return response
+    # Product Images (content-hashed names, resized + WebP variants for srcset)
+    app.config['IMAGE_WIDTHS'] = (160, 320, 640)
+    app.config['IMAGE_WORKERS'] = 2
+    app.config['IMAGE_VARIANT_RECHECK'] = 30  # seconds before a half-built variant set is looked at again
+    init_images(app)
+
+    # Payment Proof Uploads (spooled, published after the order commits)
+    app.config['PAYMENT_PROOF_MAX_BYTES'] = 5 * 1024 * 1024
+    app.config['MAX_CONTENT_LENGTH'] = 8 * 1024 * 1024  # whole request, checked by werkzeug
+    init_uploads(app)
+
+    # Database Pool Config (one pooled connection per request)
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 10))
+    app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+    init_db(app)
+
+    # SQL Instrumentation (Server-Timing header, slow query log, /admin/db_stats)
+    app.config['SLOW_QUERY_MS'] = 100
+    init_instrumentation(app)
+
+    # Schema Migrations (`flask db-migrate`, `flask db-status`, `flask db-verify`)
+    app.config['EXPLAIN_MIN_ROWS'] = 1000  # db-verify fails full scans of tables this big
+    init_migrations(app)
+
+    # Search Index Config
+    app.config['SEARCH_MAX_RESULTS'] = 500
+    app.config['SEARCH_INDEX_MAX_AGE'] = 300  # seconds before a background rebuild
+
+    # Facet Counts (in-stock books per author/category, updated by the write routes)
+    app.config['FACET_INDEX_MAX_AGE'] = 300  # seconds before a background rebuild
+    app.config['FACET_AUTHOR_LIMIT'] = 20  # author links shown in the shop
+
+    # Listing Page Sizes (keyset pagination, ?limit= is clamped to MAX_PAGE_SIZE)
+    app.config['PAGE_SIZE'] = 24
+    app.config['MAX_PAGE_SIZE'] = 100
+    init_pagination(app)
+
+    # Streamed Admin Listings (?all=1: every row, read and sent incrementally)
+    app.config['STREAM_FETCH_SIZE'] = 500  # rows per fetch from the unbuffered cursor
+    app.config['STREAM_CHUNK_BYTES'] = 16384  # HTML per write to the client
+    init_streaming(app)
+
+    # Catalog Cache Config ('memory' = per-process LRU, 'redis' = shared server)
+    app.config['CATALOG_CACHE_BACKEND'] = os.environ.get('CATALOG_CACHE_BACKEND', 'memory')
+    app.config['CATALOG_CACHE_REDIS_URL'] = os.environ.get('CATALOG_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    app.config['CATALOG_CACHE_TTL'] = 60
+    app.config['CATALOG_CACHE_MAXSIZE'] = 1024
+
+    # Password Hashing (runs in a bounded process pool, off the request thread)
+    app.config['PASSWORD_HASH_METHOD'] = 'scrypt:32768:8:1'  # changing it rehashes on next login
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    app.config['PASSWORD_HASH_MAX_PENDING'] = 32
+    app.config['PASSWORD_HASH_TIMEOUT'] = 10.0
+
+    # Background Jobs (`flask jobs-worker`, `flask jobs-status`; queued in the jobs table)
+    app.config['JOBS_IN_PROCESS_WORKER'] = os.environ.get('JOBS_IN_PROCESS_WORKER', '1') == '1'  # a thread per web process
+    app.config['JOBS_POLL_INTERVAL'] = 1.0  # seconds between polls when idle
+    app.config['JOBS_MAX_ATTEMPTS'] = 5  # retried with exponential backoff, then 'failed'
+    app.config['JOBS_LEASE_SECONDS'] = 300  # a claimed job is requeued if its worker dies
+    init_jobs(app)
+
+    # Stock Holds (checkout reserves the cart until the order is placed; `flask reap-holds`)
+    app.config['STOCK_HOLD_SECONDS'] = 600  # how long checkout holds the cart's stock
+    app.config['STOCK_HOLD_BLOCK'] = 10  # units a process takes at once for holds on a product; 0 = off
+    app.config['STOCK_ALLOTMENT_SECONDS'] = 60  # an unused block goes back to stock after this
+    app.config['STOCK_HOLD_REAP_INTERVAL'] = 15  # seconds, in the job worker; 0 = only via `flask reap-holds`
+    init_holds(app)
+
+    # Sharded Stock (`flask shard-stock <product_id>` splits a bestseller's stock over N rows)
+    app.config['STOCK_SHARDS'] = 8  # default shard count for `flask shard-stock`
+    app.config['STOCK_SHARD_SYNC_INTERVAL'] = 2  # seconds between copying shard totals to products.stock (job worker)
+    init_stock(app)
+
+    # Order Status Changes (ship/deliver/decline/cancel, one order or ticked in bulk)
+    app.config['ORDER_BULK_MAX'] = 1000  # most orders one bulk action may touch
+    init_orders(app)
+
+    # Sales Rollups (applied and compacted into sales_reports by the job worker)
+    init_sales(app)
+
+    # Bulk Catalog Import/Export (`flask import-products`, `flask export-products`, admin pages)
+    app.config['CATALOG_IMPORT_CHUNK_SIZE'] = 1000  # rows per multi-row upsert/transaction
+    app.config['CATALOG_EXPORT_CHUNK_SIZE'] = 1000
+    app.config['CATALOG_IMPORT_MAX_BYTES'] = 200 * 1024 * 1024  # upload limit for the import page only
+    init_catalog_io(app)
+
+    # JSON API (/api/v1, gzip or brotli when accepted and the body is large enough)
+    app.config['API_COMPRESS_MIN_BYTES'] = 512
+    app.config['API_GZIP_LEVEL'] = 6
+    app.config['API_BROTLI_QUALITY'] = 5  # only if the brotli package is installed
+    init_api(app)
+
+    # Register Blueprints
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(admin_bp, url_prefix="/admin")
+    app.register_blueprint(customer_bp, url_prefix="/customer")
+    app.register_blueprint(product_bp, url_prefix="/product")
+    app.register_blueprint(category_bp, url_prefix="/category")
+    app.register_blueprint(admin_orders_bp, url_prefix="/admin")
+    app.register_blueprint(api_bp, url_prefix="/api/v1")
+
+    # HTTP Caching (no-store unless opted in, so pages are never kept after logout;
+    # fingerprinted static files are immutable, public catalog pages revalidate by ETag)
+    app.config['STATIC_IMMUTABLE_MAX_AGE'] = 365 * 24 * 3600
+    app.config['STATIC_MAX_AGE'] = 300  # unfingerprinted static URLs
+    app.config['CATALOG_MAX_AGE'] = 60  # same as CATALOG_CACHE_TTL
+    init_http_cache(app)
+
+    if config:
+        app.config.update(config)
+    return app
 
 
 if __name__ == "__main__":
-    print("\n=== Available Routes ===")
-    for rule in app.url_map.iter_rules():
-        print(f"{rule.endpoint:30} {rule.rule}")
-    print("========================\n")
-    app.run(debug=True)
+    # Development only (`flask routes` lists the URL map)
+    create_app().run(debug=True)
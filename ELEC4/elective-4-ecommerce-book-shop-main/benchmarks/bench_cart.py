@@ -0,0 +1,108 @@
+"""Cart-heavy load: many shoppers hammering add_to_cart at once.
+
+Needs the book_ecommerce database with migration 0001 applied. Seeds a
+handful of products and shoppers, runs the clicks, reports throughput,
+latency and statements per click, then deletes what it created.
+
+Run from the app folder:
+    python -m benchmarks.bench_cart --shoppers 50 --clicks 20 --threads 32
+"""
+import argparse
+import random
+import time
+
+from app import create_app
+from database.connection import get_db_connection, get_pool
+from benchmarks.common import logged_in_client, run_concurrently, summarize, print_table
+
+app = create_app()
+
+
+def seed(shoppers, products):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    tag = f"bench-cart-{int(time.time() * 1000)}"
+    cursor.executemany(
+        "INSERT INTO products (title, author, price, stock) VALUES (%s, 'Bench', 100.00, 1000000)",
+        [(f"{tag}-{i}",) for i in range(products)])
+    cursor.execute("SELECT product_id FROM products WHERE title LIKE %s", (f"{tag}-%",))
+    product_ids = [row[0] for row in cursor.fetchall()]
+    cursor.executemany("""
+        INSERT INTO users (name, email, password, role, status)
+        VALUES (%s, %s, 'x', 'customer', 'active')
+    """, [(f"Shopper {i}", f"{tag}-{i}@bench.local") for i in range(shoppers)])
+    cursor.execute("SELECT user_id FROM users WHERE email LIKE %s", (f"{tag}-%",))
+    user_ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    conn.close()
+    return product_ids, user_ids
+
+
+def cleanup(product_ids, user_ids):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    users = ','.join(['%s'] * len(user_ids))
+    products = ','.join(['%s'] * len(product_ids))
+    cursor.execute(f"DELETE FROM cart WHERE user_id IN ({users})", user_ids)
+    cursor.execute(f"DELETE FROM users WHERE user_id IN ({users})", user_ids)
+    cursor.execute(f"DELETE FROM products WHERE product_id IN ({products})", product_ids)
+    cursor.close()
+    conn.close()
+
+
+def count_statements(client, product_id):
+    """Statements issued by one add_to_cart, read from the MySQL session."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+    before = int(cursor.fetchone()[1])
+    client.post('/customer/add_to_cart', data={'product_id': product_id, 'quantity': 1})
+    cursor.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+    after = int(cursor.fetchone()[1])
+    cursor.close()
+    conn.close()
+    # minus the second SHOW itself
+    return after - before - 1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shoppers', type=int, default=50)
+    parser.add_argument('--products', type=int, default=20)
+    parser.add_argument('--clicks', type=int, default=20, help="add_to_cart calls per shopper")
+    parser.add_argument('--threads', type=int, default=32)
+    args = parser.parse_args()
+
+    app.config['DB_POOL_SIZE'] = args.threads + 2
+    with app.app_context():
+        get_pool()
+
+    product_ids, user_ids = seed(args.shoppers, args.products)
+    try:
+        clients = {user_id: logged_in_client(app, user_id) for user_id in user_ids}
+        rng = random.Random(1)
+        jobs = []
+        for _ in range(args.clicks):
+            for user_id in user_ids:
+                data = {'product_id': rng.choice(product_ids), 'quantity': 1}
+                jobs.append(lambda c=clients[user_id], d=data: c.post('/customer/add_to_cart', data=d))
+
+        wall, results = run_concurrently(jobs, args.threads)
+        failures = sum(1 for response, _ in results if response.status_code != 200)
+        latency = summarize([ms for _, ms in results])
+
+        # First click of a session also sums the cart; later ones don't
+        probe = logged_in_client(app, user_ids[0])
+        first = count_statements(probe, product_ids[0])
+        steady = count_statements(probe, product_ids[0])
+
+        print_table(
+            ['clicks', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'failed', 'stmts (1st)', 'stmts (after)'],
+            [[len(jobs), f"{len(jobs) / wall:.1f}", f"{latency['p50']:.1f}", f"{latency['p95']:.1f}",
+              f"{latency['p99']:.1f}", failures, first, steady]])
+    finally:
+        cleanup(product_ids, user_ids)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Concurrent checkouts on one SKU: no overselling, and throughput by threads.
+
+Needs the book_ecommerce database. Every run seeds its own product,
+buyers and carts, fires all place_order requests at once, checks the
+result, and deletes what it created.
+
+It also checks that those place_order calls ran side by side instead of
+queueing on a shared row: "in flight" is the average number of requests
+running at once (summed latency over wall time), and "lock waits" is how
+many InnoDB row-lock waits (a server-wide counter, so run it on an idle
+database) each checkout caused. With --hold every buyer goes through the
+checkout page first, so place_order only turns its own holds into the
+order; give it enough --stock for every buyer and the waits should stay
+near zero. --shards spreads the product's stock over that many rows.
+
+Run from the app folder:
+    python -m benchmarks.bench_checkout --buyers 300 --stock 100 --threads 1,8,32,64
+    python -m benchmarks.bench_checkout --buyers 300 --stock 300 --threads 32 --hold
+"""
+import argparse
+import time
+
+from app import create_app
+from database.connection import get_db_connection, get_pool
+from modules.stock import shard_stock
+from benchmarks.common import logged_in_client, run_concurrently, summarize, print_table
+
+app = create_app()
+
+
+def seed(buyers, stock, qty, shards):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    tag = f"bench-{int(time.time() * 1000)}"
+    cursor.execute(
+        "INSERT INTO products (title, author, price, stock) VALUES (%s, 'Bench', 100.00, %s)",
+        (tag, stock))
+    product_id = cursor.lastrowid
+
+    cursor.executemany("""
+        INSERT INTO users (name, email, password, role, status)
+        VALUES (%s, %s, 'x', 'customer', 'active')
+    """, [(f"Buyer {i}", f"{tag}-{i}@bench.local") for i in range(buyers)])
+    cursor.execute("SELECT user_id FROM users WHERE email LIKE %s ORDER BY user_id", (f"{tag}-%",))
+    user_ids = [row[0] for row in cursor.fetchall()]
+
+    cursor.executemany("INSERT INTO cart (user_id, product_id, quantity) VALUES (%s, %s, %s)",
+                       [(user_id, product_id, qty) for user_id in user_ids])
+    cursor.close()
+    if shards:
+        shard_stock(conn, product_id, shards)
+    conn.close()
+    return tag, product_id, user_ids
+
+
+def row_lock_waits():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SHOW GLOBAL STATUS LIKE 'Innodb_row_lock_waits'")
+    waits = int(cursor.fetchone()[1])
+    cursor.close()
+    conn.close()
+    return waits
+
+
+def verify(product_id, user_ids):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT IF(p.stock_shards > 0, COALESCE(SUM(s.stock), 0), p.stock)
+            + (SELECT COALESCE(SUM(quantity), 0) FROM stock_holds WHERE product_id = p.product_id)
+        FROM products p
+        LEFT JOIN product_stock_shards s ON s.product_id = p.product_id
+        WHERE p.product_id = %s
+        GROUP BY p.product_id
+    """, (product_id,))
+    remaining = int(cursor.fetchone()[0])
+    cursor.execute("SELECT COALESCE(SUM(quantity), 0) FROM order_items WHERE product_id = %s", (product_id,))
+    sold = int(cursor.fetchone()[0])
+    cursor.close()
+    conn.close()
+    return remaining, sold
+
+
+def cleanup(tag, product_id, user_ids):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    ids = ','.join(['%s'] * len(user_ids))
+    cursor.execute(f"DELETE FROM payments WHERE order_id IN (SELECT order_id FROM orders WHERE user_id IN ({ids}))", user_ids)
+    cursor.execute("DELETE FROM order_items WHERE product_id = %s", (product_id,))
+    cursor.execute(f"DELETE FROM orders WHERE user_id IN ({ids})", user_ids)
+    cursor.execute(f"DELETE FROM cart WHERE user_id IN ({ids})", user_ids)
+    cursor.execute("DELETE FROM stock_holds WHERE product_id = %s", (product_id,))
+    cursor.execute("DELETE FROM product_stock_shards WHERE product_id = %s", (product_id,))
+    cursor.execute(f"DELETE FROM users WHERE user_id IN ({ids})", user_ids)
+    cursor.execute("DELETE FROM products WHERE product_id = %s", (product_id,))
+    cursor.close()
+    conn.close()
+
+
+def run(buyers, stock, qty, threads, hold, shards):
+    tag, product_id, user_ids = seed(buyers, stock, qty, shards)
+    try:
+        clients = [logged_in_client(app, user_id) for user_id in user_ids]
+        if hold:
+            for client in clients:
+                client.post('/customer/checkout')
+        form = {'customer_name': 'Bench', 'address': 'Bench St', 'payment_method': 'COD'}
+        jobs = [lambda c=c: c.post('/customer/place_order', data=form) for c in clients]
+        waits_before = row_lock_waits()
+        wall, results = run_concurrently(jobs, threads)
+        lock_waits = row_lock_waits() - waits_before
+
+        remaining, sold = verify(product_id, user_ids)
+        expected_sold = min(buyers * qty, (stock // qty) * qty)
+        ok = remaining >= 0 and sold == expected_sold and remaining == stock - sold
+        latencies = [ms for _, ms in results]
+        latency = summarize(latencies)
+        in_flight = sum(latencies) / 1000 / wall
+        return [threads, buyers, f"{buyers / wall:.1f}", f"{latency['p50']:.1f}",
+                f"{latency['p99']:.1f}", f"{in_flight:.1f}", f"{lock_waits / buyers:.2f}",
+                sold, remaining, 'OK' if ok else 'OVERSOLD/MISMATCH']
+    finally:
+        cleanup(tag, product_id, user_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--buyers', type=int, default=300)
+    parser.add_argument('--stock', type=int, default=100)
+    parser.add_argument('--qty', type=int, default=1, help="units per cart")
+    parser.add_argument('--threads', default='1,8,32,64')
+    parser.add_argument('--hold', action='store_true', help="go through the checkout page (stock holds) first")
+    parser.add_argument('--shards', type=int, default=0, help="stock shards for the product")
+    args = parser.parse_args()
+
+    # Every concurrent request needs its own pooled connection
+    thread_counts = [int(t) for t in args.threads.split(',')]
+    app.config['DB_POOL_SIZE'] = max(thread_counts) + 2
+    with app.app_context():
+        get_pool()
+
+    rows = [run(args.buyers, args.stock, args.qty, t, args.hold, args.shards) for t in thread_counts]
+    print_table(['threads', 'checkouts', 'req/s', 'p50 ms', 'p99 ms', 'in flight',
+                 'lock waits', 'sold', 'left', 'check'], rows)
+
+
+if __name__ == '__main__':
+    main()
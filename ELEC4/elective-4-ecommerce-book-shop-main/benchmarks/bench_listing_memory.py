@@ -0,0 +1,121 @@
+"""Peak memory of the full admin listings: buffered vs. streamed.
+
+For the user, product and order listings, renders every row two ways,
+each in a fresh process so peak RSS is its own:
+  - buffered: fetchall() + render_template(), what the listings did
+    before ?all=1 existed
+  - streamed: GET <listing>?all=1 (unbuffered cursor + stream_template),
+    reading the body chunk by chunk like a client would
+and reports rows, time to first byte, total time and peak RSS over the
+process's RSS after warm-up.
+
+Needs a seeded database (more rows, bigger difference):
+    python -m benchmarks.seed --products 100000 --users 50000 --orders 500000
+
+Run from the app folder:
+    python -m benchmarks.bench_listing_memory
+    python -m benchmarks.bench_listing_memory --listings orders
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from flask import render_template
+
+from app import create_app
+from database.connection import get_db_connection
+from benchmarks.common import logged_in_client, print_table
+
+LISTINGS = {
+    'users': ('/admin/users', 'admin/manage_users.html', 'users', """
+        SELECT user_id, name, email, phone, status FROM users
+        WHERE role = 'customer' ORDER BY user_id DESC
+    """),
+    'products': ('/product/admin/products', 'admin/manage_products.html', 'products', """
+        SELECT p.product_id, p.title, p.author, p.description, p.price,
+               p.stock, p.image, c.category_name
+        FROM products p LEFT JOIN categories c ON p.category_id = c.category_id
+        ORDER BY p.product_id
+    """),
+    'orders': ('/admin/orders', 'process_orders.html', 'orders', """
+        SELECT o.order_id, o.total_amount, o.status, o.order_date,
+               u.name AS customer_name, u.email
+        FROM orders o JOIN users u ON o.user_id = u.user_id
+        ORDER BY o.order_date DESC, o.order_id DESC
+    """),
+}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def buffered(app, listing):
+    url, template, name, sql = LISTINGS[listing]
+    with app.test_request_context(url):
+        started = time.perf_counter()
+        cursor = get_db_connection().cursor(dictionary=True)
+        cursor.execute(sql)
+        rows = cursor.fetchall()
+        cursor.close()
+        body = render_template(template, page=None, categories=[], statuses=(), **{name: rows}).encode()
+        # Nothing reaches the client until the whole page exists
+        elapsed = (time.perf_counter() - started) * 1000
+        return len(rows), len(body), elapsed, elapsed
+
+
+def streamed(app, listing):
+    url, _, _, _ = LISTINGS[listing]
+    client = logged_in_client(app, user_id=1, role='admin', name='Bench Admin')
+    started = time.perf_counter()
+    response = client.get(url + '?all=1', buffered=False)
+    first_byte, size, rows = None, 0, 0
+    for chunk in response.response:
+        if first_byte is None:
+            first_byte = (time.perf_counter() - started) * 1000
+        chunk = chunk if isinstance(chunk, bytes) else chunk.encode()
+        size += len(chunk)
+        rows += chunk.count(b'<tr>')
+    response.close()
+    # Minus the header row
+    return rows - 1, size, first_byte, (time.perf_counter() - started) * 1000
+
+
+def child(listing, mode):
+    app = create_app({'SQL_INSTRUMENTATION': False, 'JOBS_IN_PROCESS_WORKER': False})
+    # Warm up (imports, template compile, pool) on one page of the listing
+    logged_in_client(app, user_id=1, role='admin', name='Bench Admin').get(LISTINGS[listing][0])
+    baseline = peak_rss_mb()
+
+    rows, size, first_byte, total = (streamed if mode == 'streamed' else buffered)(app, listing)
+    print(json.dumps({'rows': rows, 'bytes': size, 'first_byte_ms': first_byte, 'total_ms': total,
+                      'peak_mb': peak_rss_mb() - baseline}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--listings', default='users,products,orders')
+    parser.add_argument('--child', nargs=2, metavar=('LISTING', 'MODE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    rows = []
+    for listing in args.listings.split(','):
+        for mode in ('buffered', 'streamed'):
+            out = subprocess.run([sys.executable, '-m', 'benchmarks.bench_listing_memory', '--child', listing, mode],
+                                 capture_output=True, text=True, check=True)
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            rows.append([listing, mode, result['rows'], f"{result['bytes'] / 1048576:.1f}",
+                         f"{result['first_byte_ms']:.0f}", f"{result['total_ms']:.0f}", f"{result['peak_mb']:.1f}"])
+    print_table(['listing', 'mode', 'rows', 'html MB', 'first byte ms', 'total ms', 'peak RSS +MB'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Login storm: password verification inline vs. in the hashing pool.
+
+Simulates --threads request threads each verifying passwords, the work
+auth.login does per POST, and reports throughput and p50/p99 latency.
+A probe thread meanwhile times a cheap request-sized task every 10 ms to
+show how much the storm slows unrelated requests in the same worker.
+
+Run from the app folder:
+    python -m benchmarks.bench_login --logins 200 --threads 16 --workers 2,4
+"""
+import argparse
+import os
+import threading
+import time
+
+from werkzeug.security import generate_password_hash
+
+from modules.hashing import PasswordHasher, DEFAULT_METHOD
+from benchmarks.common import run_concurrently, summarize, print_table
+
+
+def probe(stop, samples):
+    while not stop.is_set():
+        started = time.perf_counter()
+        sum(i * i for i in range(2000))  # stand-in for rendering a small page
+        samples.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.01)
+
+
+def run(label, hasher, pwhash, logins, threads):
+    samples = []
+    stop = threading.Event()
+    prober = threading.Thread(target=probe, args=(stop, samples))
+    prober.start()
+
+    hasher.verify(pwhash, 'warm-up')  # start the pool outside the timing
+    jobs = [lambda: hasher.verify(pwhash, 'correct horse') for _ in range(logins)]
+    wall, results = run_concurrently(jobs, threads)
+
+    stop.set()
+    prober.join()
+    hasher.shutdown()
+
+    assert all(ok for (ok, _), _ in results)
+    latency = summarize([ms for _, ms in results])
+    other = summarize(samples)
+    return [label, f"{logins / wall:.1f}", f"{latency['p50']:.1f}", f"{latency['p99']:.1f}",
+            f"{other['p50']:.2f}", f"{other['p99']:.2f}"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--workers', default=f"2,{os.cpu_count() or 2}")
+    parser.add_argument('--method', default=DEFAULT_METHOD)
+    args = parser.parse_args()
+
+    pwhash = generate_password_hash('correct horse', args.method)
+    rows = [run('inline', PasswordHasher(args.method, workers=0), pwhash, args.logins, args.threads)]
+    for workers in sorted({int(w) for w in args.workers.split(',')}):
+        hasher = PasswordHasher(args.method, workers=workers, max_pending=args.threads * 2, timeout=60)
+        rows.append(run(f"pool x{workers}", hasher, pwhash, args.logins, args.threads))
+
+    print(f"{args.logins} logins, {args.threads} request threads, {args.method}\n")
+    print_table(['mode', 'logins/s', 'p50 ms', 'p99 ms', 'other p50 ms', 'other p99 ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
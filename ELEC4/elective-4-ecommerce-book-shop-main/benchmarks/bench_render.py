@@ -0,0 +1,140 @@
+"""Catalog grid render time with and without {% cache %} card fragments.
+
+Renders customer/shop.html and customer/home.html with 1k, 10k and 50k
+products in one grid (far more than a page, to make the per-card cost
+visible) and reports, per template and size:
+  - uncached: fragment cache off, every card rendered
+  - cold:     empty fragment cache, every card rendered and stored
+  - warm:     every card a cache hit (the steady state)
+plus a product-changed render where 1% of the cards have a new updated_at.
+
+Cold start: compiling every template in a fresh environment, without and
+with the on-disk bytecode cache.
+
+Needs no database.
+
+Run from the app folder:
+    python -m benchmarks.bench_render
+    python -m benchmarks.bench_render --sizes 1000,10000 --repeat 5
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from jinja2 import FileSystemBytecodeCache
+
+from app import create_app
+from modules.fragments import FragmentCacheExtension, clear_fragments, fragment_backend
+from modules.pagination import Page
+from benchmarks.common import print_table
+
+TEMPLATES = {
+    'shop': ('customer/shop.html', 'products'),
+    'home': ('customer/home.html', 'books'),
+}
+
+
+def sample_image(app):
+    """A real cover, so image_variants() does the same work as in production."""
+    folder = os.path.join(app.static_folder, 'img')
+    for name in sorted(os.listdir(folder)):
+        if os.path.isfile(os.path.join(folder, name)):
+            return f'/static/img/{name}'
+    return None
+
+
+def make_products(count, image):
+    base = datetime(2025, 1, 1)
+    return [{
+        'product_id': i,
+        'title': f'Book {i}',
+        'author': f'Author {i % 500}',
+        'price': Decimal('199.00') + i % 300,
+        'stock': i % 25,
+        'image': image,
+        'category_name': f'Category {i % 12}',
+        'updated_at': base + timedelta(seconds=i),
+    } for i in range(1, count + 1)]
+
+
+def render_ms(app, template, context, repeat):
+    samples = []
+    for _ in range(repeat):
+        with app.test_request_context('/customer/shop'):
+            started = time.perf_counter()
+            app.jinja_env.get_template(template).render(**context)
+            samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def grid_rows(app, sizes, repeat):
+    image = sample_image(app)
+    backend = fragment_backend()
+    rows = []
+    for size in sizes:
+        products = make_products(size, image)
+        for label, (template, name) in TEMPLATES.items():
+            context = {name: products, 'page': Page(products), 'categories': [], 'authors': [],
+                       'selected_author': ''}
+
+            backend.maxsize = 0
+            uncached = render_ms(app, template, context, repeat)
+
+            backend.maxsize = size * len(TEMPLATES)
+            clear_fragments()
+            cold = render_ms(app, template, context, 1)
+            warm = render_ms(app, template, context, repeat)
+
+            # 1% of the products changed since the last render
+            for product in products[::100]:
+                product['updated_at'] += timedelta(hours=1)
+            changed = render_ms(app, template, context, 1)
+
+            rows.append([label, size, f"{uncached:.1f}", f"{cold:.1f}", f"{warm:.1f}", f"{changed:.1f}",
+                         f"{uncached / warm:.1f}x" if warm else '-'])
+    return rows
+
+
+def compile_all_ms(app, bytecode_dir):
+    env = app.create_jinja_environment()
+    env.add_extension(FragmentCacheExtension)
+    env.bytecode_cache = FileSystemBytecodeCache(bytecode_dir) if bytecode_dir else None
+    names = [n for n in env.list_templates() if n.endswith('.html')]
+    started = time.perf_counter()
+    for name in names:
+        env.get_template(name)
+    return (time.perf_counter() - started) * 1000, len(names)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1000,10000,50000')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(',')]
+
+    workdir = tempfile.mkdtemp(prefix='bench-render-')
+    try:
+        app = create_app({'SQL_INSTRUMENTATION': False, 'JOBS_IN_PROCESS_WORKER': False})
+
+        print_table(['grid', 'products', 'uncached ms', 'cold ms', 'warm ms', '1% changed ms', 'warm speedup'],
+                    grid_rows(app, sizes, args.repeat))
+        print()
+
+        no_cache, count = compile_all_ms(app, None)
+        compile_all_ms(app, workdir)  # fill the bytecode cache
+        cached, _ = compile_all_ms(app, workdir)
+        print_table(['cold start', 'templates', 'ms'],
+                    [['compile from source', count, f"{no_cache:.1f}"],
+                     ['load bytecode cache', count, f"{cached:.1f}"]])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Search latency at catalog scale: inverted index vs. a LIKE-style scan.
+
+Run from the app folder:
+    python -m benchmarks.bench_search --products 100000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from modules.search import SearchIndex
+
+WORDS = (
+    "shadow river garden silent empire winter stone glass forgotten crown "
+    "midnight ocean paper haven secret letter journey island mirror dragon "
+    "history kingdom summer house broken city storm light dark memory song "
+    "queen hunter fire moon star road lost wild heart iron golden silver"
+).split()
+SURNAMES = (
+    "smith garcia tolkien rowling austen orwell morrison murakami atwood "
+    "dickens christie king martin gaiman pratchett le-guin herbert asimov"
+).split()
+
+
+def make_products(count, seed=42):
+    rng = random.Random(seed)
+    products = []
+    for product_id in range(1, count + 1):
+        title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 5)))
+        # A unique token per title so exact lookups are selective
+        title += f" vol{product_id}"
+        author = f"{rng.choice(SURNAMES).title()} {rng.choice(WORDS).title()}"
+        products.append({'product_id': product_id, 'title': title, 'author': author})
+    return products
+
+
+def like_scan(products, term):
+    """What `title LIKE %term% OR author LIKE %term%` does: touch every row."""
+    term = term.lower()
+    return [p['product_id'] for p in products
+            if term in p['title'].lower() or term in p['author'].lower()]
+
+
+def measure(fn, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'p50': statistics.median(timings),
+        'p99': timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+        'mean': statistics.fmean(timings),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    products = make_products(args.products)
+
+    index = SearchIndex('bench', 'product_id', {'title': 2.0, 'author': 1.0})
+    started = time.perf_counter()
+    index.build(products)
+    print(f"Indexed {len(index):,} products in {time.perf_counter() - started:.2f}s")
+
+    def typo(word):
+        i = rng.randrange(len(word))
+        return word[:i] + word[i + 1:]
+
+    workloads = {
+        'exact (selective)': [f"vol{rng.randint(1, args.products)}" for _ in range(args.queries)],
+        'exact (common)': [rng.choice(WORDS) for _ in range(args.queries)],
+        'prefix': [rng.choice(WORDS)[:3] for _ in range(args.queries)],
+        'typo': [typo(rng.choice([w for w in WORDS if len(w) >= 5])) for _ in range(args.queries)],
+        'two terms': [f"{rng.choice(WORDS)} {rng.choice(SURNAMES)}" for _ in range(args.queries)],
+    }
+
+    print(f"\n{'workload':20} {'index p50':>10} {'index p99':>10} {'scan p50':>10}  (ms)")
+    for name, queries in workloads.items():
+        indexed = measure(lambda q: index.search(q, limit=500), queries)
+        # The scan is slow; a handful of queries is enough for its median
+        scanned = measure(lambda q: like_scan(products, q), queries[:10])
+        print(f"{name:20} {indexed['p50']:10.3f} {indexed['p99']:10.3f} {scanned['p50']:10.3f}")
+
+
+if __name__ == '__main__':
+    main()
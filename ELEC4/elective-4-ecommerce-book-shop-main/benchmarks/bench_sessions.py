@@ -0,0 +1,105 @@
+"""Auth-check overhead per request for each session backend.
+
+Every request opens (and may save) the session before the view runs, so
+the cost of `is_customer()` is really the cost of the session interface.
+Logged-in clients hit a tiny view that only checks the role; the same
+view without a cookie is the baseline. Reports p50/p95 per request, the
+overhead over the baseline, the cookie size and that revocation works.
+
+Needs no database (the probe view doesn't query).
+
+Run from the app folder:
+    python -m benchmarks.bench_sessions --users 200 --requests 5000
+    python -m benchmarks.bench_sessions --redis redis://localhost:6379/15
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from flask import session
+from flask.sessions import SecureCookieSessionInterface
+
+from app import create_app
+from modules.sessions import RedisStore, SQLiteStore, ServerSessionInterface, VersionBoard, revoke_user_sessions
+from benchmarks.common import logged_in_client, summarize, print_table
+
+
+def make_app(interface):
+    app = create_app({'SQL_INSTRUMENTATION': False})
+    app.session_interface = interface
+
+    @app.route('/_bench/auth')
+    def bench_auth():
+        if 'user_id' in session and session.get('role') == 'customer':
+            return 'ok'
+        return 'denied', 403
+
+    return app
+
+
+def timed_requests(clients, count, rng):
+    samples = []
+    for _ in range(count):
+        client = rng.choice(clients)
+        started = time.perf_counter()
+        response = client.get('/_bench/auth')
+        samples.append((time.perf_counter() - started) * 1000)
+        response.close()
+    return samples
+
+
+def run(label, interface, users, requests, rng):
+    app = make_app(interface)
+    clients = [logged_in_client(app, 1000 + i) for i in range(users)]
+    for client in clients:  # warm up (and fill the LRU, if any)
+        client.get('/_bench/auth')
+
+    anonymous = summarize(timed_requests([app.test_client()], requests, rng))
+    authed = summarize(timed_requests(clients, requests, rng))
+
+    cookie = clients[0].get_cookie(app.config['SESSION_COOKIE_NAME'])
+    revoked = ''
+    if isinstance(interface, ServerSessionInterface):
+        with app.test_request_context():
+            revoke_user_sessions(1000)
+        revoked = 'yes' if clients[0].get('/_bench/auth').status_code == 403 else 'NO'
+    return [label, f"{authed['p50'] * 1000:.0f}", f"{authed['p95'] * 1000:.0f}",
+            f"{(authed['mean'] - anonymous['mean']) * 1000:+.0f}", len(cookie.value) if cookie else 0,
+            revoked or 'n/a']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--redis', help="also benchmark a Redis-protocol server at this URL")
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-sessions-')
+
+    def sqlite(name, lru_size):
+        return ServerSessionInterface(SQLiteStore(os.path.join(workdir, f'{name}.db')),
+                                      VersionBoard(os.path.join(workdir, f'{name}.versions')), lru_size=lru_size)
+
+    variants = [
+        ('signed cookie', SecureCookieSessionInterface()),
+        ('sqlite', sqlite('plain', 0)),
+        ('sqlite + LRU', sqlite('lru', 10000)),
+    ]
+    if args.redis:
+        versions = VersionBoard(os.path.join(workdir, 'redis.versions'))
+        variants += [
+            ('redis', ServerSessionInterface(RedisStore(args.redis), versions, lru_size=0)),
+            ('redis + LRU', ServerSessionInterface(RedisStore(args.redis), versions, lru_size=10000)),
+        ]
+
+    rows = [run(label, interface, args.users, args.requests, random.Random(args.seed))
+            for label, interface in variants]
+    print_table(['backend', 'p50 us', 'p95 us', 'vs no cookie us', 'cookie bytes', 'revocable'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Checkout throughput on one hot product: product row vs. sharded stock.
+
+Every "order" is a transaction that takes 1 unit with take_stock() and
+then holds its locks for --work-ms, standing in for the rest of
+place_order (order, items and payment INSERTs, the queued jobs, then the
+commit). Besides the stock it takes (a shard, the product row or the
+process's allotment), place_order locks only the buyer's own cart and
+hold rows and reads prices without a lock, so the stock rows are the
+only ones concurrent checkouts of one SKU share.
+With the stock on the product row those transactions queue on its lock;
+with N shards up to N of them run at once.
+
+bench_checkout runs the real place_order end to end.
+
+Creates a throwaway product (description 'bench-seed') and deletes it at
+the end. Checks that exactly one unit per successful order was taken.
+
+Run from the app folder:
+    python -m benchmarks.bench_stock_contention
+    python -m benchmarks.bench_stock_contention --threads 64 --orders 5000 --shards 4,8,16
+"""
+import argparse
+import time
+import uuid
+
+from app import create_app
+from database.connection import get_db_connection
+from modules.stock import shard_stock, stock_total, take_stock
+from benchmarks.common import print_table, run_concurrently, summarize
+
+app = create_app({'SQL_INSTRUMENTATION': False, 'JOBS_IN_PROCESS_WORKER': False,
+                  'STOCK_SHARD_SYNC_INTERVAL': 0})
+
+
+def create_product(stock):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO products (title, author, description, price, stock)
+            VALUES (%s, 'Bench', 'bench-seed', 1.00, %s)
+        """, (f"bench-contention-{uuid.uuid4().hex[:12]}", stock))
+        conn.commit()
+        return cursor.lastrowid
+    finally:
+        cursor.close()
+
+
+def delete_product(product_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM products WHERE product_id = %s", (product_id,))
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def reset_stock(product_id, stock, shards):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("UPDATE products SET stock = %s, stock_shards = 0 WHERE product_id = %s", (stock, product_id))
+        cursor.execute("DELETE FROM product_stock_shards WHERE product_id = %s", (product_id,))
+        conn.commit()
+    finally:
+        cursor.close()
+    shard_stock(conn, product_id, shards)
+
+
+def order(product_id, work_ms):
+    def run():
+        with app.app_context():
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True)
+            try:
+                conn.start_transaction()
+                if not take_stock(cursor, product_id, 1):
+                    conn.rollback()
+                    return False
+                time.sleep(work_ms / 1000)
+                conn.commit()
+                return True
+            except Exception:
+                conn.rollback()
+                return False
+            finally:
+                cursor.close()
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--shards', default='4,8,16', help="shard counts to compare with the product row")
+    parser.add_argument('--work-ms', type=float, default=5.0, help="time each order holds its locks")
+    args = parser.parse_args()
+    app.config['DB_POOL_SIZE'] = args.threads + 2
+
+    stock = args.orders * 2
+    rows = []
+    with app.app_context():
+        product_id = create_product(stock)
+    try:
+        for shards in [0] + [int(s) for s in args.shards.split(',')]:
+            with app.app_context():
+                reset_stock(product_id, stock, shards)
+            wall, results = run_concurrently([order(product_id, args.work_ms)] * args.orders, args.threads)
+            ok = sum(1 for result, _ in results if result)
+            with app.app_context():
+                cursor = get_db_connection().cursor(dictionary=True)
+                left = stock_total(cursor, product_id)
+                cursor.close()
+            stats = summarize([latency for _, latency in results])
+            rows.append([f"{shards} shards" if shards else 'product row', ok, args.orders - ok,
+                         f"{ok / wall:.0f}", f"{stats['p50']:.1f}", f"{stats['p95']:.1f}",
+                         'ok' if stock - left == ok else f"MISMATCH ({stock - left} taken)"])
+    finally:
+        with app.app_context():
+            delete_product(product_id)
+
+    print(f"{args.orders} orders on {args.threads} threads, {args.work_ms} ms of work per order")
+    print_table(['stock', 'orders', 'failed', 'orders/s', 'p50 ms', 'p95 ms', 'units taken'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Development server vs. pre-forked gunicorn on the customer journey.
+
+Starts each server on a free port, logs seeded customers in over HTTP and
+runs the customer journey (home, shop search, product, add_to_cart, cart,
+checkout, place_order, my_orders) against it with the same concurrency,
+then prints per-endpoint latency and overall req/s side by side.
+
+Needs a seeded database (python -m benchmarks.seed) and gunicorn.
+
+Run from the app folder:
+    python -m benchmarks.bench_wsgi --customers 40 --iterations 5 --threads 32
+    python -m benchmarks.bench_wsgi --workers 4 --worker-threads 8
+"""
+import argparse
+import importlib.util
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from app import create_app
+from benchmarks.common import run_concurrently, print_table
+from benchmarks.load import (SEED_PASSWORD, HttpClient, Recorder, customer_journey, load_fixtures,
+                             report)
+
+SERVERS = ('dev server', 'gunicorn')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def server_command(name, port, workers, worker_threads):
+    return {
+        # What `python app.py` runs, minus the reloader process
+        'dev server': [sys.executable, '-m', 'flask', '--app', 'app:create_app', '--debug', 'run',
+                       '--port', str(port), '--no-reload', '--with-threads'],
+        'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                     '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+                     '--threads', str(worker_threads), 'wsgi:app'],
+    }[name]
+
+
+def wait_until_up(url, proc, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}")
+        try:
+            with urllib.request.urlopen(url + '/login', timeout=2) as response:
+                response.read()
+                return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def run_journeys(url, users, product_ids, iterations, threads, seed):
+    clients = [HttpClient(url, email, SEED_PASSWORD) for _, email in users]
+    recorder = Recorder()
+    jobs = [lambda c=client, r=random.Random(seed + i): [customer_journey(c, recorder, r, product_ids)
+                                                         for _ in range(iterations)]
+            for i, client in enumerate(clients)]
+    wall, _ = run_concurrently(jobs, threads)
+    endpoints = report(recorder.samples, wall)
+    total = sum(s['count'] for s in endpoints.values())
+    return endpoints, total / wall
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--customers', type=int, default=40)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=32, help="concurrent clients")
+    parser.add_argument('--workers', type=int, default=None, help="gunicorn workers (default: its config)")
+    parser.add_argument('--worker-threads', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    if importlib.util.find_spec('gunicorn') is None:
+        raise SystemExit("gunicorn is not installed (pip install gunicorn)")
+
+    users, _, product_ids, _ = load_fixtures(create_app(), args.customers)
+    workers = args.workers or int(subprocess.check_output(
+        [sys.executable, '-c', "import runpy; print(runpy.run_path('gunicorn.conf.py')['workers'])"],
+        text=True))
+
+    results = {}
+    for name in SERVERS:
+        port = free_port()
+        url = f'http://127.0.0.1:{port}'
+        proc = subprocess.Popen(server_command(name, port, workers, args.worker_threads),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_up(url, proc)
+            results[name] = run_journeys(url, users, product_ids, args.iterations, args.threads, args.seed)
+        finally:
+            proc.send_signal(signal.SIGTERM)  # gunicorn drains in-flight requests first
+            try:
+                proc.wait(timeout=40)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    names = list(results)
+    rows = []
+    for endpoint in results[names[0]][0]:
+        row = [endpoint]
+        for name in names:
+            stats = results[name][0].get(endpoint, {})
+            row += [f"{stats.get('p50_ms', 0):.1f}", f"{stats.get('p95_ms', 0):.1f}", stats.get('errors', 0)]
+        rows.append(row)
+    headers = ['endpoint']
+    for name in names:
+        headers += [f'{name} p50', f'{name} p95', 'err']
+    print_table(headers, rows)
+    print()
+    for name in names:
+        print(f"{name:10}: {results[name][1]:.1f} req/s")
+    if len(names) == 2 and results[names[0]][1]:
+        print(f"gunicorn ({workers} workers x {args.worker_threads} threads) = "
+              f"{results[names[1]][1] / results[names[0]][1]:.2f}x the dev server")
+
+
+if __name__ == '__main__':
+    main()
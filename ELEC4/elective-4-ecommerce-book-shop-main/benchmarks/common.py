@@ -0,0 +1,65 @@
+"""Shared helpers for the benchmark scripts."""
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples_ms):
+    return {
+        'count': len(samples_ms),
+        'mean': statistics.fmean(samples_ms) if samples_ms else 0.0,
+        'p50': percentile(samples_ms, 50),
+        'p95': percentile(samples_ms, 95),
+        'p99': percentile(samples_ms, 99),
+    }
+
+
+def logged_in_client(app, user_id, role='customer', name='Bench User'):
+    """A test client whose session belongs to the given user."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['role'] = role
+        session['name'] = name
+    return client
+
+
+def run_concurrently(jobs, threads):
+    """Run callables on a thread pool, all released at the same moment.
+
+    Returns (wall_seconds, [(result, latency_ms), ...]).
+    """
+    start_gate = threading.Barrier(min(threads, len(jobs)) or 1)
+
+    def timed(job, gate):
+        if gate:
+            try:
+                start_gate.wait(timeout=30)
+            except threading.BrokenBarrierError:
+                pass
+        started = time.perf_counter()
+        result = job()
+        return result, (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [pool.submit(timed, job, i < threads) for i, job in enumerate(jobs)]
+        results = [f.result() for f in futures]
+    return time.perf_counter() - started, results
+
+
+def print_table(headers, rows):
+    widths = [max([len(str(h))] + [len(str(r[i])) for r in rows]) for i, h in enumerate(headers)]
+    print('  '.join(str(h).rjust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print('  '.join(str(v).rjust(w) for v, w in zip(row, widths)))
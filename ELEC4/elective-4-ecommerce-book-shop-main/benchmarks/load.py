@@ -0,0 +1,320 @@
+"""Scripted customer and admin journeys against the real blueprints.
+
+Customers go home -> shop search -> product page -> add_to_cart -> cart
+-> checkout -> place_order -> my_orders; admins go dashboard -> orders ->
+users -> product search. Reports req/s, p50/p95/p99 and DB queries per
+request (from the Server-Timing header) per endpoint, saves the run to
+benchmarks/results/ and compares it with the previous run.
+
+Needs a seeded database (python -m benchmarks.seed).
+
+Run from the app folder:
+    python -m benchmarks.load --customers 50 --admins 2 --iterations 5 --threads 16
+    python -m benchmarks.load --url http://127.0.0.1:8000 --admin-email admin@example.com --admin-password ...
+"""
+import argparse
+import glob
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+from benchmarks.bench_search import WORDS
+from benchmarks.common import logged_in_client, run_concurrently, summarize, print_table
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+SEED_EMAIL_DOMAIN = 'seed.bench.local'
+SEED_PASSWORD = 'bench'
+_SERVER_TIMING = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+
+# =====================================
+# CLIENTS
+# =====================================
+
+
+class InProcessClient:
+    """Flask test client: the full WSGI stack without a socket."""
+
+    def __init__(self, app, user_id, role):
+        self._client = logged_in_client(app, user_id, role)
+
+    def request(self, method, path, data=None):
+        response = self._client.open(path, method=method, data=data)
+        response.close()
+        return response.status_code, response.headers
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None  # measure each request on its own
+
+
+class HttpClient:
+    """Plain HTTP against a running server (flask run, gunicorn, ...)."""
+
+    def __init__(self, base_url, email, password):
+        self.base_url = base_url.rstrip('/')
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+        status, headers = self.request('POST', '/login', {'email': email, 'password': password})
+        # A failed login redirects back to /login
+        if status != 302 or urllib.parse.urlsplit(headers.get('Location', '')).path.endswith('/login'):
+            raise RuntimeError(f"login failed for {email} (HTTP {status})")
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self._opener.open(req, timeout=60) as response:
+                response.read()
+                return response.status, response.headers
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, e.headers
+
+
+# =====================================
+# JOURNEYS
+# =====================================
+
+
+class Recorder:
+    """Thread-safe per-endpoint samples: (latency ms, db ms, queries, ok)."""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def call(self, client, name, method, path, data=None):
+        started = time.perf_counter()
+        status, headers = client.request(method, path, data)
+        elapsed = (time.perf_counter() - started) * 1000
+        match = _SERVER_TIMING.search(headers.get('Server-Timing') or '')
+        db_ms, queries = (float(match.group(1)), int(match.group(2))) if match else (0.0, 0)
+        with self._lock:
+            self.samples.setdefault(name, []).append((elapsed, db_ms, queries, status < 400))
+        return status
+
+
+def customer_journey(client, recorder, rng, product_ids):
+    product_id = rng.choice(product_ids)
+    recorder.call(client, 'home', 'GET', '/customer/home')
+    recorder.call(client, 'shop search', 'GET', '/customer/shop?' + urllib.parse.urlencode({'search': rng.choice(WORDS)}))
+    recorder.call(client, 'product', 'GET', f'/customer/shop/{product_id}')
+    recorder.call(client, 'add_to_cart', 'POST', '/customer/add_to_cart',
+                  {'product_id': product_id, 'quantity': rng.randint(1, 2)})
+    recorder.call(client, 'cart', 'GET', '/customer/cart')
+    recorder.call(client, 'checkout', 'POST', '/customer/checkout', {})  # holds the cart
+    recorder.call(client, 'checkout page', 'GET', '/customer/checkout')
+    recorder.call(client, 'place_order', 'POST', '/customer/place_order',
+                  {'customer_name': 'Load Test', 'address': 'Bench St', 'payment_method': 'COD'})
+    recorder.call(client, 'my_orders', 'GET', '/customer/my_orders')
+
+
+def admin_journey(client, recorder, rng, product_ids):
+    recorder.call(client, 'admin dashboard', 'GET', '/admin/dashboard')
+    recorder.call(client, 'admin orders', 'GET', '/admin/orders')
+    recorder.call(client, 'admin orders pending', 'GET', '/admin/orders?status=Pending')
+    recorder.call(client, 'admin users', 'GET', '/admin/users')
+    recorder.call(client, 'admin product search', 'GET',
+                  '/product/admin/products?' + urllib.parse.urlencode({'search': rng.choice(WORDS)}))
+
+
+# =====================================
+# SETUP, REPORT, STORAGE
+# =====================================
+
+
+def load_fixtures(app, customers):
+    from database.connection import get_db_connection
+
+    with app.app_context():
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT user_id, email FROM users
+            WHERE email LIKE %s AND status = 'active'
+            ORDER BY user_id LIMIT %s
+        """, (f"%@{SEED_EMAIL_DOMAIN}", customers))
+        users = cursor.fetchall()
+        cursor.execute("SELECT user_id, email FROM users WHERE role = 'admin' ORDER BY user_id LIMIT 1")
+        admin = cursor.fetchone()
+        cursor.execute("""
+            SELECT product_id FROM products
+            WHERE description = 'bench-seed' AND stock > 1000
+            LIMIT 2000
+        """)
+        product_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT (SELECT COUNT(*) FROM products), (SELECT COUNT(*) FROM users),
+                   (SELECT COUNT(*) FROM orders), (SELECT COUNT(*) FROM order_items)
+        """)
+        scale = dict(zip(('products', 'users', 'orders', 'order_items'), cursor.fetchone()))
+        cursor.close()
+    if not users or not product_ids:
+        raise SystemExit("No seeded customers/products found; run python -m benchmarks.seed first")
+    return users, admin, product_ids, scale
+
+
+def report(samples, wall):
+    endpoints = {}
+    for name, entries in samples.items():
+        latency = summarize([e[0] for e in entries])
+        stats = {
+            'count': len(entries),
+            'rps': round(len(entries) / wall, 2),
+            'mean_ms': round(latency['mean'], 2),
+            'p50_ms': round(latency['p50'], 2),
+            'p95_ms': round(latency['p95'], 2),
+            'p99_ms': round(latency['p99'], 2),
+            'queries_per_req': round(sum(e[2] for e in entries) / len(entries), 2),
+            'db_ms_per_req': round(sum(e[1] for e in entries) / len(entries), 2),
+            'errors': sum(1 for e in entries if not e[3]),
+        }
+        endpoints[name] = stats
+    return endpoints
+
+
+def git_commit():
+    try:
+        sha = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                      stderr=subprocess.DEVNULL).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                             text=True, stderr=subprocess.DEVNULL).strip())
+        return sha, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+
+
+def save(result):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(RESULTS_DIR, f"{stamp}-{result['meta']['commit']}.json")
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+    return path
+
+
+def previous_result(mode, exclude=None):
+    """Most recent stored run of the same mode (in-process vs http)."""
+    for path in sorted(glob.glob(os.path.join(RESULTS_DIR, '*.json')), reverse=True):
+        if path == exclude:
+            continue
+        with open(path) as f:
+            result = json.load(f)
+        if result['meta'].get('mode') == mode:
+            return path, result
+    return None, None
+
+
+def _delta(new, old):
+    if not old:
+        return ''
+    return f"{(new - old) / old * 100:+.0f}%"
+
+
+def print_report(result, baseline=None):
+    base = (baseline or {}).get('endpoints', {})
+    rows = []
+    for name, s in result['endpoints'].items():
+        b = base.get(name, {})
+        rows.append([name, s['count'], f"{s['rps']:.1f}", f"{s['p50_ms']:.1f}", f"{s['p95_ms']:.1f}",
+                     f"{s['p99_ms']:.1f}", f"{s['queries_per_req']:.1f}", f"{s['db_ms_per_req']:.1f}",
+                     s['errors'], _delta(s['p95_ms'], b.get('p95_ms')),
+                     _delta(s['queries_per_req'], b.get('queries_per_req'))])
+    headers = ['endpoint', 'n', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'q/req', 'db ms', 'err']
+    if baseline:
+        headers += ['p95 vs prev', 'q/req vs prev']
+    else:
+        rows = [r[:9] for r in rows]
+    print_table(headers, rows)
+    total = result['total']
+    print(f"\n{total['requests']} requests in {total['wall_s']:.1f}s = {total['rps']:.1f} req/s "
+          f"({result['meta']['threads']} threads, commit {result['meta']['commit']}"
+          f"{' +dirty' if result['meta']['dirty'] else ''})")
+    if baseline:
+        print(f"compared with {baseline['meta']['commit']} ({baseline['meta']['timestamp']}): "
+              f"{_delta(total['rps'], baseline['total']['rps'])} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--customers', type=int, default=50, help="virtual customers")
+    parser.add_argument('--admins', type=int, default=2, help="virtual admins")
+    parser.add_argument('--iterations', type=int, default=5, help="journeys per virtual user")
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--url', help="benchmark a running server instead of the in-process app")
+    parser.add_argument('--admin-email', help="admin login for --url mode")
+    parser.add_argument('--admin-password')
+    parser.add_argument('--compare', help="result file to compare with (default: previous run)")
+    parser.add_argument('--no-save', action='store_true')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app({'DB_POOL_SIZE': args.threads + 2})
+    users, admin, product_ids, scale = load_fixtures(app, args.customers)
+    mode = 'http' if args.url else 'in-process'
+
+    def make_client(user_id, email, role):
+        if not args.url:
+            return InProcessClient(app, user_id, role)
+        if role == 'admin':
+            return HttpClient(args.url, args.admin_email, args.admin_password)
+        return HttpClient(args.url, email, SEED_PASSWORD)
+
+    # Sessions are set up before the clock starts
+    recorder = Recorder()
+    jobs = []
+    for i, (user_id, email) in enumerate(users):
+        client = make_client(user_id, email, 'customer')
+        rng = random.Random(args.seed + i)
+        jobs.append(lambda c=client, r=rng: [customer_journey(c, recorder, r, product_ids)
+                                             for _ in range(args.iterations)])
+    if admin and args.admins and (not args.url or args.admin_email):
+        for i in range(args.admins):
+            client = make_client(admin[0], admin[1], 'admin')
+            rng = random.Random(args.seed - i - 1)
+            jobs.append(lambda c=client, r=rng: [admin_journey(c, recorder, r, product_ids)
+                                                 for _ in range(args.iterations)])
+
+    wall, _ = run_concurrently(jobs, args.threads)
+
+    sha, dirty = git_commit()
+    endpoints = report(recorder.samples, wall)
+    requests_total = sum(s['count'] for s in endpoints.values())
+    result = {
+        'meta': {
+            'commit': sha, 'dirty': dirty, 'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'mode': mode, 'url': args.url, 'threads': args.threads, 'customers': len(users),
+            'admins': args.admins, 'iterations': args.iterations, 'scale': scale,
+            'python': platform.python_version(), 'cpus': os.cpu_count(),
+        },
+        'total': {'requests': requests_total, 'wall_s': round(wall, 3),
+                  'rps': round(requests_total / wall, 2)},
+        'endpoints': endpoints,
+    }
+
+    path = None if args.no_save else save(result)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    else:
+        _, baseline = previous_result(mode, exclude=path)
+    print_report(result, baseline)
+    if path:
+        print(f"saved {os.path.relpath(path)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""Seed book_ecommerce with a synthetic catalog, customers and order history.
+
+Seeded rows are recognisable (customers @seed.bench.local, products with
+description 'bench-seed', categories 'Seed: ...') and every run deletes
+the previous seed first, so runs are reproducible for a given --seed.
+Customers' password is "bench". Sales rollups are rebuilt at the end.
+
+Run from the app folder:
+    python -m benchmarks.seed --products 100000 --users 10000 --orders 200000
+    python -m benchmarks.seed --reset-only
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from database.connection import get_db_connection
+from benchmarks.bench_search import WORDS, SURNAMES
+from modules import sales
+
+app = create_app()
+
+SEED_EMAIL_DOMAIN = 'seed.bench.local'
+SEED_MARKER = 'bench-seed'
+PASSWORD = 'bench'
+BATCH = 5000
+ORDER_STATUSES = (('Delivered', 55), ('Shipped', 15), ('Pending', 20), ('Cancelled', 6), ('Declined', 4))
+
+
+def batched(rows, size=BATCH):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def insert_many(cursor, sql, rows):
+    for chunk in batched(rows):
+        cursor.executemany(sql, chunk)
+
+
+def reset(cursor):
+    """Delete everything a previous seed created."""
+    started = time.perf_counter()
+    cursor.execute("SELECT user_id FROM users WHERE email LIKE %s", (f"%@{SEED_EMAIL_DOMAIN}",))
+    user_ids = [row[0] for row in cursor.fetchall()]
+    for chunk in batched(user_ids, 1000):
+        ids = ','.join(['%s'] * len(chunk))
+        # orders/order_items/payments/cart cascade from users
+        cursor.execute(f"DELETE FROM users WHERE user_id IN ({ids})", chunk)
+    cursor.execute("DELETE FROM products WHERE description = %s", (SEED_MARKER,))
+    cursor.execute("DELETE FROM categories WHERE category_name LIKE 'Seed: %'")
+    print(f"reset: removed {len(user_ids)} seeded customers and their data "
+          f"({time.perf_counter() - started:.1f}s)")
+
+
+def _next_id(cursor, table, column):
+    cursor.execute(f"SELECT COALESCE(MAX({column}), 0) + 1 FROM {table}")
+    return cursor.fetchone()[0]
+
+
+def seed(cursor, products, users, orders, categories, rng):
+    started = time.perf_counter()
+
+    # Categories
+    first_category = _next_id(cursor, 'categories', 'category_id')
+    category_ids = list(range(first_category, first_category + categories))
+    insert_many(cursor, "INSERT INTO categories (category_id, category_name) VALUES (%s, %s)",
+                [(cid, f"Seed: {WORDS[i % len(WORDS)].title()} {i}") for i, cid in enumerate(category_ids)])
+
+    # Products: most in stock, some sold out so the shop filter matters
+    first_product = _next_id(cursor, 'products', 'product_id')
+    product_rows = []
+    prices = {}
+    for product_id in range(first_product, first_product + products):
+        title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).title()
+        author = f"{rng.choice(SURNAMES).title()} {rng.choice(WORDS).title()}"
+        price = round(rng.uniform(120, 1500), 2)
+        stock = 0 if rng.random() < 0.1 else rng.randint(50, 100000)
+        prices[product_id] = price
+        product_rows.append((product_id, rng.choice(category_ids), f"{title} #{product_id}", author,
+                             SEED_MARKER, price, stock))
+        if len(product_rows) >= BATCH or product_id == first_product + products - 1:
+            cursor.executemany("""
+                INSERT INTO products (product_id, category_id, title, author, description, price, stock)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, product_rows)
+            product_rows.clear()
+    print(f"  {products} products in {len(category_ids)} categories")
+
+    # Customers (one hash shared by all, scrypt per row would take hours)
+    password_hash = generate_password_hash(PASSWORD, app.config.get('PASSWORD_HASH_METHOD', 'scrypt'))
+    first_user = _next_id(cursor, 'users', 'user_id')
+    user_ids = list(range(first_user, first_user + users))
+    insert_many(cursor, """
+        INSERT INTO users (user_id, name, email, password, role, status)
+        VALUES (%s, %s, %s, %s, 'customer', %s)
+    """, [(uid, f"{rng.choice(WORDS).title()} {rng.choice(SURNAMES).title()}",
+           f"user{n}@{SEED_EMAIL_DOMAIN}", password_hash,
+           'inactive' if rng.random() < 0.05 else 'active')
+          for n, uid in enumerate(user_ids)])
+    print(f"  {users} customers")
+
+    # Order history over the last year
+    statuses, weights = zip(*ORDER_STATUSES)
+    product_ids = list(prices)
+    now = datetime.now()
+    order_id = _next_id(cursor, 'orders', 'order_id')
+    order_rows, item_rows, payment_rows = [], [], []
+
+    def flush():
+        insert_many(cursor, """
+            INSERT INTO orders (order_id, user_id, name, address, total_amount, payment_method, status, order_date)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, order_rows)
+        insert_many(cursor, """
+            INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (%s, %s, %s, %s)
+        """, item_rows)
+        insert_many(cursor, """
+            INSERT INTO payments (order_id, amount, method, proof, status, payment_date)
+            VALUES (%s, %s, %s, %s, 'Completed', %s)
+        """, payment_rows)
+        order_rows.clear(), item_rows.clear(), payment_rows.clear()
+
+    for _ in range(orders):
+        user_id = rng.choice(user_ids)
+        placed = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+        lines = rng.sample(product_ids, min(len(product_ids), rng.randint(1, 4)))
+        total = 50.00
+        for product_id in lines:
+            qty = rng.randint(1, 3)
+            total += prices[product_id] * qty
+            item_rows.append((order_id, product_id, qty, prices[product_id]))
+        method = 'COD' if rng.random() < 0.7 else 'Online'
+        order_rows.append((order_id, user_id, 'Seed Customer', 'Seed Street', round(total, 2), method,
+                           rng.choices(statuses, weights)[0], placed))
+        payment_rows.append((order_id, round(total, 2), method, 'COD' if method == 'COD' else None, placed))
+        order_id += 1
+        if len(order_rows) >= BATCH:
+            flush()
+    flush()
+    print(f"  {orders} orders")
+    print(f"seeded in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42, help="random seed (same seed, same data)")
+    parser.add_argument('--reset-only', action='store_true', help="just delete the previous seed")
+    parser.add_argument('--no-rollup', action='store_true', help="skip rebuilding sales rollups")
+    args = parser.parse_args()
+
+    with app.app_context():
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            reset(cursor)
+            if not args.reset_only:
+                # Autocommit per batch: a 1M-order seed is too big for one transaction
+                seed(cursor, args.products, args.users, args.orders, args.categories,
+                     random.Random(args.seed))
+            if not args.no_rollup:
+                started = time.perf_counter()
+                sales.rebuild(conn)
+                sales.compact(conn)
+                print(f"sales rollups rebuilt ({time.perf_counter() - started:.1f}s)")
+            cursor.execute("ANALYZE TABLE categories, products, users, orders, order_items, payments")
+            cursor.fetchall()
+        finally:
+            cursor.close()
+
+
+if __name__ == '__main__':
+    main()
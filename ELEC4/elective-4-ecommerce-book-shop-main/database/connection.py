@@ -1,12 +1,300 @@
+import os
+import queue
+import threading
+import time
+
 import mysql.connector
+from mysql.connector.errors import PoolError
+from flask import g, has_app_context, current_app
+
+from database.instrumentation import InstrumentedCursor
+
+
+# Defaults used when no Flask app config is available (scripts, shells).
+DEFAULT_CONFIG = {
+    'DB_HOST': 'localhost',
+    'DB_USER': 'root',
+    'DB_PASSWORD': '',
+    'DB_NAME': 'book_ecommerce',
+    'DB_POOL_SIZE': 10,
+    'DB_POOL_TIMEOUT': 5.0,
+    'DB_POOL_HEALTH_CHECK_INTERVAL': 30.0,
+    'SQL_INSTRUMENTATION': True,
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# =====================================
+# CONNECTION POOL
+# =====================================
+
+
+class ConnectionPool:
+    """Fixed-size pool of MySQL connections with health checks and metrics."""
+
+    def __init__(self, size, timeout, health_check_interval, **connect_args):
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.connect_args = connect_args
+
+        # LIFO so the most recently used (warmest) connection is reused first
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._health_check_failures = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+    def _connect(self):
+        return mysql.connector.connect(autocommit=True, **self.connect_args)
+
+    def _is_healthy(self, conn, idle_since):
+        """Ping connections that sat idle longer than the check interval."""
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except mysql.connector.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def acquire(self):
+        """Check out a connection, waiting up to `timeout` seconds for one."""
+        started = time.monotonic()
+        waited = False
+
+        while True:
+            try:
+                conn, idle_since = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        conn = self._connect()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                    break
+
+                # Pool exhausted - block until someone releases a connection
+                waited = True
+                remaining = self.timeout - (time.monotonic() - started)
+                try:
+                    if remaining <= 0:
+                        raise queue.Empty
+                    conn, idle_since = self._idle.get(timeout=remaining)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                        self._waits += 1
+                    raise PoolError(
+                        f"Timed out after {self.timeout}s waiting for a database connection")
+
+            if self._is_healthy(conn, idle_since):
+                break
+            with self._lock:
+                self._health_check_failures += 1
+            self._discard(conn)
+
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+            self._wait_time_total += elapsed
+            self._wait_time_max = max(self._wait_time_max, elapsed)
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back any open transaction."""
+        with self._lock:
+            self._in_use -= 1
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            if not conn.autocommit:
+                conn.autocommit = True
+        except mysql.connector.Error:
+            self._discard(conn)
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    def discard(self, conn):
+        """Close a checked-out connection instead of returning it to the pool."""
+        with self._lock:
+            self._in_use -= 1
+        self._discard(conn)
+
+    def close(self):
+        """Close every idle connection (worker shutdown)."""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'created': self._created,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'health_check_failures': self._health_check_failures,
+                'avg_checkout_ms': round(
+                    self._wait_time_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                'max_checkout_ms': round(self._wait_time_max * 1000, 3),
+            }
+
+
+class PooledConnection:
+    """Proxy around a pooled connection.
+
+    Existing routes call `conn.close()` when they are done. For a connection
+    bound to the app context that is a no-op: the connection is shared by
+    every cursor in the request and handed back in the teardown hook.
+    """
+
+    def __init__(self, pool, conn, scoped):
+        self._pool = pool
+        self._conn = conn
+        self._scoped = scoped
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._conn.cursor(*args, **kwargs)
+        if _config('SQL_INSTRUMENTATION'):
+            return InstrumentedCursor(cursor)
+        return cursor
+
+    def close(self):
+        if not self._scoped:
+            self.release()
+
+    def release(self):
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+    def discard(self):
+        """Close rather than pool it, e.g. with an unbuffered result left unread."""
+        if self._conn is not None:
+            self._pool.discard(self._conn)
+            self._conn = None
+
+
+# =====================================
+# PUBLIC HELPERS
+# =====================================
+
+
+def _config(key):
+    if has_app_context():
+        return current_app.config.get(key, DEFAULT_CONFIG[key])
+    return DEFAULT_CONFIG[key]
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    size=_config('DB_POOL_SIZE'),
+                    timeout=_config('DB_POOL_TIMEOUT'),
+                    health_check_interval=_config('DB_POOL_HEALTH_CHECK_INTERVAL'),
+                    host=_config('DB_HOST'),
+                    user=_config('DB_USER'),
+                    password=_config('DB_PASSWORD'),
+                    database=_config('DB_NAME'),
+                )
+    return _pool
+
+
+def close_pool():
+    """Close the process's idle connections; the next get_pool() starts over."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
+def _reset_after_fork():
+    # A forked worker must never talk over the parent's sockets: drop the
+    # inherited pool without closing it (closing would send COM_QUIT on a
+    # socket the parent still uses) and build a fresh one on first use.
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
 
 
 def get_db_connection():
-    conn = mysql.connector.connect(
-        host='localhost',
-        user='root',
-        password='', 
-        database='book_ecommerce',
-        autocommit=True
-    )
-    return conn
+    """Return the request's pooled connection.
+
+    Inside an app context one connection is checked out lazily and reused
+    for the rest of the request. Outside of one (scripts, background
+    threads) the caller owns the connection and `close()` returns it.
+    """
+    if not has_app_context():
+        return open_db_connection()
+
+    pool = get_pool()
+    if 'db_conn' not in g:
+        g.db_conn = PooledConnection(pool, pool.acquire(), scoped=True)
+    return g.db_conn
+
+
+def open_db_connection():
+    """Check out a connection the caller owns, even inside a request.
+
+    For work that must not share the request's connection, such as an
+    unbuffered query feeding a streamed response. `close()` returns it.
+    """
+    pool = get_pool()
+    return PooledConnection(pool, pool.acquire(), scoped=False)
+
+
+def release_db_connection(exception=None):
+    """Teardown hook: hand the request's connection back to the pool."""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn.release()
+
+
+def init_db(app):
+    """Apply pool config defaults and register the teardown hook."""
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
+    app.teardown_appcontext(release_db_connection)
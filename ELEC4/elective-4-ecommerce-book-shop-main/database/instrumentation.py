@@ -0,0 +1,199 @@
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, request, current_app, has_request_context
+
+# =====================================
+# SQL INSTRUMENTATION
+# =====================================
+# Every cursor handed out by get_db_connection() is wrapped so each
+# statement's time, row count and calling endpoint are recorded. The
+# request's totals go out as a Server-Timing header and are rolled up
+# per endpoint and per statement for /admin/db_stats. Slow statements
+# and likely N+1 loops are logged as warnings (database.instrumentation).
+
+MAX_TRACKED_STATEMENTS = 500
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_endpoints = {}    # endpoint -> totals
+_statements = {}   # normalized SQL -> totals
+_captured = None   # normalized SQL -> (sql, params, endpoint) while capturing
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    if isinstance(sql, bytes):
+        sql = sql.decode(errors='replace')
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def _endpoint():
+    if has_request_context():
+        return request.endpoint or request.path
+    return '<no request>'
+
+
+class InstrumentedCursor:
+    """Cursor proxy that times execute()/executemany() and counts rows."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._last = None
+        self._count_fetches = False
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._count(1)
+            yield row
+
+    def _timed(self, method, operation, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(operation, *args, **kwargs)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            rowcount = self._cursor.rowcount
+            # Unbuffered SELECTs report -1 until rows are read; count fetches then
+            self._count_fetches = not rowcount or rowcount < 0
+            params = (args[0] if args else kwargs.get('params')) if method == self._cursor.execute else None
+            self._last = record(operation, elapsed_ms, 0 if self._count_fetches else rowcount, params)
+
+    def execute(self, operation, *args, **kwargs):
+        return self._timed(self._cursor.execute, operation, *args, **kwargs)
+
+    def executemany(self, operation, *args, **kwargs):
+        return self._timed(self._cursor.executemany, operation, *args, **kwargs)
+
+    def _count(self, rows):
+        if self._last is not None and self._count_fetches:
+            self._last['rows'] += rows
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._count(1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._count(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._count(len(rows))
+        return rows
+
+
+def record(operation, elapsed_ms, rowcount, params=None):
+    """Add one statement to the current request's stats; returns its entry."""
+    sql = normalize_sql(operation)
+    endpoint = _endpoint()
+
+    captured = _captured
+    if captured is not None and sql not in captured:
+        captured[sql] = (operation, params, endpoint)
+    entry = {'sql': sql, 'ms': elapsed_ms, 'rows': rowcount, 'endpoint': endpoint}
+
+    if has_request_context():
+        stats = g.setdefault('sql_stats', {'count': 0, 'ms': 0.0, 'statements': []})
+        stats['count'] += 1
+        stats['ms'] += elapsed_ms
+        stats['statements'].append(entry)
+
+    threshold = current_app.config.get('SLOW_QUERY_MS', 100) if has_request_context() else 100
+    if elapsed_ms >= threshold:
+        logger.warning("Slow query %.1f ms in %s: %s", elapsed_ms, endpoint, sql[:500])
+
+    with _lock:
+        totals = _statements.get(sql)
+        if totals is None and len(_statements) < MAX_TRACKED_STATEMENTS:
+            totals = _statements[sql] = {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'endpoints': set()}
+        if totals is not None:
+            totals['calls'] += 1
+            totals['total_ms'] += elapsed_ms
+            totals['max_ms'] = max(totals['max_ms'], elapsed_ms)
+            totals['endpoints'].add(endpoint)
+    return entry
+
+
+def _finish_request(response):
+    """after_request: roll the request's stats up and add Server-Timing."""
+    stats = g.pop('sql_stats', None)
+    if stats is None:
+        return response
+
+    endpoint = request.endpoint or request.path
+    with _lock:
+        totals = _endpoints.setdefault(endpoint, {
+            'requests': 0, 'queries': 0, 'db_ms': 0.0, 'max_queries': 0, 'max_db_ms': 0.0})
+        totals['requests'] += 1
+        totals['queries'] += stats['count']
+        totals['db_ms'] += stats['ms']
+        totals['max_queries'] = max(totals['max_queries'], stats['count'])
+        totals['max_db_ms'] = max(totals['max_db_ms'], stats['ms'])
+
+    # Same statement many times in one request is the N+1 signature
+    repeats = {}
+    for entry in stats['statements']:
+        repeats[entry['sql']] = repeats.get(entry['sql'], 0) + 1
+    limit = current_app.config.get('SQL_REPEAT_WARNING', 5)
+    for sql, times in repeats.items():
+        if times > limit:
+            logger.warning("N+1? %s ran the same statement %dx: %s", endpoint, times, sql[:200])
+
+    timing = f'db;dur={stats["ms"]:.2f};desc="{stats["count"]} queries"'
+    existing = response.headers.get('Server-Timing')
+    response.headers['Server-Timing'] = f"{existing}, {timing}" if existing else timing
+    return response
+
+
+def snapshot(top=50):
+    """Per-endpoint and slowest-statement totals for the admin endpoint."""
+    with _lock:
+        endpoints = {
+            name: dict(t,
+                       avg_queries=round(t['queries'] / t['requests'], 2),
+                       avg_db_ms=round(t['db_ms'] / t['requests'], 3))
+            for name, t in _endpoints.items()
+        }
+        statements = sorted(
+            ({'sql': sql, 'calls': t['calls'], 'total_ms': round(t['total_ms'], 3),
+              'avg_ms': round(t['total_ms'] / t['calls'], 3), 'max_ms': round(t['max_ms'], 3),
+              'endpoints': sorted(t['endpoints'])}
+             for sql, t in _statements.items()),
+            key=lambda s: s['total_ms'], reverse=True)[:top]
+    return {'endpoints': endpoints, 'statements': statements}
+
+
+@contextmanager
+def capture_statements():
+    """Collect the first (sql, params, endpoint) of every distinct statement."""
+    global _captured
+    _captured = {}
+    try:
+        yield _captured
+    finally:
+        _captured = None
+
+
+def reset():
+    with _lock:
+        _endpoints.clear()
+        _statements.clear()
+
+
+def init_instrumentation(app):
+    app.config.setdefault('SQL_INSTRUMENTATION', True)
+    app.config.setdefault('SLOW_QUERY_MS', 100)
+    app.config.setdefault('SQL_REPEAT_WARNING', 5)
+    app.after_request(_finish_request)
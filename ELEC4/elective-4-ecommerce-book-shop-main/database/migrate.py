@@ -0,0 +1,324 @@
+import hashlib
+import os
+import re
+import threading
+
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+from werkzeug.routing import BuildError
+
+from database.connection import get_db_connection
+from database import instrumentation
+
+# =====================================
+# SCHEMA MIGRATIONS
+# =====================================
+# database/migrations/NNNN_name.sql files are applied in order and
+# recorded in schema_migrations. MySQL commits DDL implicitly, so a file
+# is not atomic: it is only recorded once every statement has succeeded,
+# and a failure stops the run so the file can be fixed and re-run.
+#
+# A `-- expect-empty: <message>` line before a SELECT makes it a guard:
+# if it returns rows, the run stops with the message and the rows (e.g.
+# data an admin has to fix before a constraint can be added).
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
+_FILENAME = re.compile(r'^(\d{4})_[\w-]+\.sql$')
+_EXPECT_EMPTY = re.compile(r'^--\s*expect-empty:\s*(.*)$')
+GUARD_ROWS_SHOWN = 50
+
+
+def migration_files():
+    """[(version, filename, path)] sorted by version."""
+    found = []
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = _FILENAME.match(name)
+        if match:
+            found.append((match.group(1), name, os.path.join(MIGRATIONS_DIR, name)))
+    return found
+
+
+def split_statements(sql):
+    """Split a migration into statements (no procedures, so ';' at EOL ends one).
+
+    Returns [(statement, guard)]: guard is the message of an expect-empty
+    line before the statement, or None.
+    """
+    statements = []
+    current = []
+    guard = None
+    for line in sql.splitlines():
+        if line.strip().startswith('--'):
+            match = _EXPECT_EMPTY.match(line.strip())
+            if match:
+                guard = match.group(1).strip() or 'unexpected rows'
+            continue
+        current.append(line)
+        if line.rstrip().endswith(';'):
+            statement = '\n'.join(current).strip().rstrip(';').strip()
+            if statement:
+                statements.append((statement, guard))
+                guard = None
+            current = []
+    tail = '\n'.join(current).strip()
+    if tail:
+        statements.append((tail, guard))
+    return statements
+
+
+def _guard_failure(name, i, guard, rows):
+    shown = '\n'.join('  ' + ', '.join(str(value) for value in row) for row in rows[:GUARD_ROWS_SHOWN])
+    more = f"\n  ... and {len(rows) - GUARD_ROWS_SHOWN} more" if len(rows) > GUARD_ROWS_SHOWN else ''
+    return click.ClickException(
+        f"{name} stopped at statement {i}: {guard}\n{shown}{more}\n"
+        f"Nothing after it has run; fix the data and re-run.")
+
+
+def _checksum(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def applied_versions(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+          `version` varchar(16) NOT NULL,
+          `filename` varchar(255) NOT NULL,
+          `checksum` char(64) NOT NULL,
+          `applied_at` datetime DEFAULT current_timestamp(),
+          PRIMARY KEY (`version`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """)
+    cursor.execute("SELECT version, checksum FROM schema_migrations")
+    return dict(cursor.fetchall())
+
+
+def _record(cursor, version, name, path):
+    cursor.execute(
+        "INSERT INTO schema_migrations (version, filename, checksum) VALUES (%s, %s, %s)",
+        (version, name, _checksum(path)))
+
+
+@click.command('db-migrate')
+@click.option('--dry-run', is_flag=True, help='Print pending statements without running them.')
+@click.option('--fake', 'fake', multiple=True, metavar='VERSION',
+              help='Mark a migration applied without running it (already applied by hand).')
+@with_appcontext
+def db_migrate_command(dry_run, fake):
+    """Apply pending database/migrations/*.sql files in order."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        applied = applied_versions(cursor)
+        pending = [m for m in migration_files() if m[0] not in applied]
+        if not pending:
+            click.echo("Database is up to date.")
+            return
+
+        for version, name, path in pending:
+            if version in fake:
+                _record(cursor, version, name, path)
+                click.echo(f"faked    {name}")
+                continue
+
+            with open(path, encoding='utf-8') as f:
+                statements = split_statements(f.read())
+            if dry_run:
+                click.echo(f"-- {name}")
+                for statement, guard in statements:
+                    if guard:
+                        click.echo(f"-- expect-empty: {guard}")
+                    click.echo(statement + ';')
+                continue
+
+            click.echo(f"applying {name} ({len(statements)} statements)")
+            for i, (statement, guard) in enumerate(statements, 1):
+                try:
+                    cursor.execute(statement)
+                    rows = cursor.fetchall() if cursor.with_rows else []
+                except Exception as e:
+                    raise click.ClickException(
+                        f"{name} failed at statement {i}: {e}\n"
+                        f"Statements before it have been committed; fix the file and re-run.")
+                if guard and rows:
+                    raise _guard_failure(name, i, guard, rows)
+            _record(cursor, version, name, path)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+@click.command('db-status')
+@with_appcontext
+def db_status_command():
+    """List migrations and whether they have been applied (or edited since)."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        applied = applied_versions(cursor)
+    finally:
+        cursor.close()
+        conn.close()
+    for version, name, path in migration_files():
+        if version not in applied:
+            state = 'pending'
+        elif applied[version] != _checksum(path):
+            state = 'CHANGED'
+        else:
+            state = 'applied'
+        click.echo(f"{state:8} {name}")
+
+
+# =====================================
+# QUERY PLAN VERIFICATION
+# =====================================
+# Crawls every side-effect-free GET route as an admin and as a customer,
+# capturing each distinct statement (with the parameters it actually
+# ran with) through the SQL instrumentation, then EXPLAINs them. A plan
+# step that scans a whole table (type ALL) estimated at min-rows or more
+# fails the check.
+
+# GET routes that change data; never crawled
+UNSAFE_ENDPOINTS = {
+    'static', 'auth.logout', 'admin.toggle_user_status', 'admin.reset_user_password',
+    'customer.remove_from_cart', 'category.delete_category',
+}
+# Extra query strings tried on every route to reach the filtered queries
+QUERY_VARIANTS = ({}, {'search': 'a'}, {'category': '1', 'category_id': '1', 'status': 'active'},
+                  {'status': 'Pending'})
+_NEXT_PAGE = re.compile(r'href="([^"]*[?&]after=[^"]*)"')
+
+
+def _sample_ids(cursor):
+    cursor.execute("SELECT user_id FROM users WHERE role = 'customer' ORDER BY user_id LIMIT 1")
+    customer = cursor.fetchone()
+    cursor.execute("SELECT user_id FROM users WHERE role = 'admin' ORDER BY user_id LIMIT 1")
+    admin = cursor.fetchone()
+    return (customer[0] if customer else 1), (admin[0] if admin else 1)
+
+
+def _client(app, user_id, role):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['role'] = role
+        session['name'] = 'db-verify'
+    return client
+
+
+def _crawl(app, clients, sample_id):
+    urls = []
+    with app.test_request_context():
+        for rule in app.url_map.iter_rules():
+            if 'GET' not in rule.methods or rule.endpoint in UNSAFE_ENDPOINTS:
+                continue
+            values = {arg: sample_id for arg in rule.arguments}
+            for variant in QUERY_VARIANTS:
+                try:
+                    urls.append(url_for(rule.endpoint, **dict(variant, **values)))
+                except BuildError:
+                    pass
+
+    seen = set()
+    while urls:
+        url = urls.pop()
+        if url in seen:
+            continue
+        seen.add(url)
+        for client in clients:
+            response = client.get(url)
+            if response.mimetype == 'text/html':
+                # Follow keyset "next page" links once to capture the cursor queries
+                for link in _NEXT_PAGE.findall(response.get_data(as_text=True)):
+                    link = link.replace('&amp;', '&')
+                    if link not in seen:
+                        urls.append(link)
+    return len(seen)
+
+
+def explain(cursor, sql, params):
+    cursor.execute('EXPLAIN ' + sql, params or ())
+    return cursor.fetchall()
+
+
+@click.command('db-verify')
+@click.option('--min-rows', type=int, default=None,
+              help='Fail full scans estimated at this many rows or more (default EXPLAIN_MIN_ROWS).')
+@click.option('--sample-id', type=int, default=1, show_default=True,
+              help='Value used for <int:...> URL arguments.')
+@click.option('--verbose', '-v', is_flag=True, help='Print every plan, not just failures.')
+@with_appcontext
+def db_verify_command(min_rows, sample_id, verbose):
+    """EXPLAIN every query the blueprints issue; fail on large full scans."""
+    from modules.cache import catalog_cache
+    from modules.search import product_index, user_index, category_index
+
+    # Search index loaders read whole tables on purpose
+    full_loads = {instrumentation.normalize_sql(index.loader_sql)
+                  for index in (product_index, user_index, category_index) if index.loader_sql}
+
+    app = current_app._get_current_object()
+    min_rows = min_rows if min_rows is not None else app.config.get('EXPLAIN_MIN_ROWS', 1000)
+
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        customer_id, admin_id = _sample_ids(conn.cursor())
+        clients = [_client(app, admin_id, 'admin'), _client(app, customer_id, 'customer')]
+
+        catalog_cache.invalidate()  # cached queries must actually run
+        with instrumentation.capture_statements() as captured:
+            # A fresh thread has no app context, so every crawled request
+            # gets its own (own g, own pooled connection) like in production
+            result = {}
+
+            def crawl():
+                try:
+                    result['pages'] = _crawl(app, clients, sample_id)
+                except Exception as e:
+                    result['error'] = e
+
+            crawler = threading.Thread(target=crawl)
+            crawler.start()
+            crawler.join()
+            if 'error' in result:
+                raise click.ClickException(f"Crawl failed: {result['error']!r}")
+            pages = result['pages']
+
+        failures = 0
+        checked = 0
+        for normalized, (sql, params, endpoint) in sorted(captured.items(), key=lambda c: c[1][2]):
+            if normalized.split(' ', 1)[0].upper() not in ('SELECT', 'UPDATE', 'DELETE'):
+                continue
+            if normalized in full_loads:
+                continue
+            try:
+                plan = explain(cursor, sql, params)
+            except Exception as e:
+                click.echo(f"?? {endpoint}: could not EXPLAIN ({e}): {normalized[:120]}")
+                continue
+            checked += 1
+            scans = [step for step in plan
+                     if step.get('type') == 'ALL' and (step.get('rows') or 0) >= min_rows]
+            if scans or verbose:
+                click.echo(f"{'FAIL' if scans else 'ok  '} {endpoint}: {normalized[:160]}")
+                for step in plan:
+                    click.echo(f"       {step.get('table')}: type={step.get('type')} "
+                               f"key={step.get('key')} rows={step.get('rows')} {step.get('Extra') or ''}")
+            failures += bool(scans)
+    finally:
+        cursor.close()
+        conn.close()
+
+    click.echo(f"{pages} pages crawled, {checked} statements explained, {failures} full scan(s) "
+               f">= {min_rows} rows")
+    if failures:
+        raise SystemExit(1)
+
+
+def init_migrations(app):
+    app.config.setdefault('EXPLAIN_MIN_ROWS', 1000)
+    app.cli.add_command(db_migrate_command)
+    app.cli.add_command(db_status_command)
+    app.cli.add_command(db_verify_command)
@@ -0,0 +1,27 @@
+-- One cart row per (user, product) so add_to_cart can upsert with
+-- INSERT ... ON DUPLICATE KEY UPDATE.
+--
+-- Apply with: mysql book_ecommerce < database/migrations/0001_cart_user_product_unique.sql
+
+-- Fold existing duplicate lines into the oldest row first
+UPDATE cart c
+JOIN (
+    SELECT MIN(cart_id) AS keep_id, SUM(quantity) AS total
+    FROM cart
+    GROUP BY user_id, product_id
+    HAVING COUNT(*) > 1
+) d ON c.cart_id = d.keep_id
+SET c.quantity = d.total;
+
+DELETE c FROM cart c
+JOIN (
+    SELECT user_id, product_id, MIN(cart_id) AS keep_id
+    FROM cart
+    GROUP BY user_id, product_id
+    HAVING COUNT(*) > 1
+) d ON c.user_id = d.user_id AND c.product_id = d.product_id AND c.cart_id <> d.keep_id;
+
+-- The new key's leading column covers lookups by user_id alone
+ALTER TABLE cart
+  DROP KEY `user_id`,
+  ADD UNIQUE KEY `user_product` (`user_id`, `product_id`);
@@ -0,0 +1,25 @@
+-- Composite indexes for the hot listing queries. Each one matches the
+-- WHERE equality columns followed by the keyset ORDER BY columns, so
+-- MySQL can seek to the cursor and read LIMIT rows without a filesort.
+--
+-- cart (user_id, product_id) is already covered by 0001's unique key.
+
+-- my_orders: WHERE user_id = ? ORDER BY order_date DESC, order_id DESC.
+-- Replaces the single-column key (the FK on user_id can use the new one).
+ALTER TABLE orders
+  ADD KEY `user_date` (`user_id`, `order_date`, `order_id`);
+ALTER TABLE orders
+  DROP KEY `user_id`;
+
+-- admin orders: ORDER BY order_date DESC, order_id DESC [WHERE status = ?]
+ALTER TABLE orders
+  ADD KEY `status_date` (`status`, `order_date`, `order_id`),
+  ADD KEY `order_date` (`order_date`, `order_id`);
+
+-- manage_users: WHERE role = 'customer' [AND status = ?] ORDER BY user_id
+ALTER TABLE users
+  ADD KEY `role_status` (`role`, `status`, `user_id`);
+
+-- shop: WHERE stock > 0 [AND category_id = ?] ORDER BY product_id
+ALTER TABLE products
+  ADD KEY `stock_category` (`stock`, `category_id`, `product_id`);
@@ -0,0 +1,5 @@
+-- /api/v1/authors pages through DISTINCT authors by name (keyset on
+-- author), and home's author chips read DISTINCT author: both become an
+-- index scan instead of a full read of products.
+ALTER TABLE products
+  ADD KEY `author` (`author`);
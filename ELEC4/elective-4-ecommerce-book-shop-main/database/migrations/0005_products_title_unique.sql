@@ -0,0 +1,17 @@
+-- One product per title, so the bulk import can upsert with
+-- INSERT ... ON DUPLICATE KEY UPDATE (add_product already refuses
+-- duplicate titles; this makes the database enforce it).
+--
+-- Titles are what customers see, and order_items refers to the rows, so
+-- existing duplicates are neither renamed nor deleted here: the migration
+-- stops and lists them. Retitle (or retire) the extra products in the
+-- admin, then re-run `flask db-migrate`.
+
+-- expect-empty: these titles are used by more than one product (title, product ids); make them unique and re-run
+SELECT title, GROUP_CONCAT(product_id ORDER BY product_id) AS product_ids
+FROM products
+GROUP BY title
+HAVING COUNT(*) > 1;
+
+ALTER TABLE products
+  ADD UNIQUE KEY `title` (`title`);
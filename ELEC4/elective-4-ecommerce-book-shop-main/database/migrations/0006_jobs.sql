@@ -0,0 +1,39 @@
+-- Background job queue (modules/jobs.py).
+--
+-- Request handlers insert jobs inside their own transaction; workers
+-- claim them with a single UPDATE that stamps locked_by, run them, and
+-- mark them done in the same transaction as the job's writes.
+-- dedupe_key is unique while a job is pending and cleared once it
+-- finishes, so "compact the sales reports" is queued at most once.
+
+CREATE TABLE IF NOT EXISTS jobs (
+  `job_id` bigint(20) NOT NULL AUTO_INCREMENT,
+  `kind` varchar(64) NOT NULL,
+  `payload` text NOT NULL,
+  `dedupe_key` varchar(191) DEFAULT NULL,
+  `status` enum('queued','running','done','failed') NOT NULL DEFAULT 'queued',
+  `attempts` int(11) NOT NULL DEFAULT 0,
+  `max_attempts` int(11) NOT NULL DEFAULT 5,
+  `run_at` datetime NOT NULL DEFAULT current_timestamp(),
+  `locked_by` varchar(64) DEFAULT NULL,
+  `locked_until` datetime DEFAULT NULL,
+  `last_error` text DEFAULT NULL,
+  `created_at` datetime NOT NULL DEFAULT current_timestamp(),
+  `finished_at` datetime DEFAULT NULL,
+  PRIMARY KEY (`job_id`),
+  UNIQUE KEY `dedupe_key` (`dedupe_key`),
+  KEY `status_run_at` (`status`, `run_at`),
+  KEY `locked_by` (`locked_by`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- One log row per job, so a retried job can't log twice
+ALTER TABLE activity_logs
+  ADD COLUMN `job_id` bigint(20) DEFAULT NULL,
+  ADD UNIQUE KEY `job_id` (`job_id`);
+
+-- Set when a cancelled/declined order's stock has been put back
+ALTER TABLE orders
+  ADD COLUMN `stock_restored` tinyint(1) NOT NULL DEFAULT 0;
+
+-- cancel_order used to put stock back inline
+UPDATE orders SET stock_restored = 1 WHERE status = 'Cancelled';
@@ -0,0 +1,18 @@
+-- Stock holds between checkout and place_order (modules/holds.py).
+--
+-- Held units have already left products.stock. holder is 'user:<id>'
+-- for a customer's checkout hold, or 'proc:<host:pid:token>' for a web
+-- process's allotment (a block of stock it hands holds out of without
+-- locking the product row). Expired rows are put back by the reaper.
+
+CREATE TABLE IF NOT EXISTS stock_holds (
+  `hold_id` bigint(20) NOT NULL AUTO_INCREMENT,
+  `holder` varchar(64) NOT NULL,
+  `product_id` int(11) NOT NULL,
+  `quantity` int(11) NOT NULL,
+  `expires_at` datetime NOT NULL,
+  PRIMARY KEY (`hold_id`),
+  UNIQUE KEY `holder_product` (`holder`, `product_id`),
+  KEY `expires_at` (`expires_at`),
+  KEY `product_id` (`product_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
@@ -0,0 +1,18 @@
+-- Sharded stock counters for hot products (modules/stock.py).
+--
+-- A product with stock_shards = N keeps its stock in N rows of
+-- product_stock_shards, so concurrent checkouts lock different rows;
+-- products.stock then holds their total, refreshed in the background.
+-- stock_shards = 0 (every product by default) keeps stock on the product.
+
+ALTER TABLE products
+  ADD COLUMN `stock_shards` tinyint(3) UNSIGNED NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS product_stock_shards (
+  `product_id` int(11) NOT NULL,
+  `shard` tinyint(3) UNSIGNED NOT NULL,
+  `stock` int(11) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`product_id`, `shard`),
+  CONSTRAINT `product_stock_shards_product` FOREIGN KEY (`product_id`)
+    REFERENCES products (`product_id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
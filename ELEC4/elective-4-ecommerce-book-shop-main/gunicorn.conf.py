@@ -0,0 +1,62 @@
+# =====================================
+# GUNICORN (production serving)
+# =====================================
+#     pip install gunicorn
+#     gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Pre-fork: the master imports wsgi.py once, then forks WEB_CONCURRENCY
+# workers, each serving GUNICORN_THREADS requests at a time. Each worker
+# opens its own DB pool (sized to its thread count) after the fork.
+#
+# Reloading without dropping requests:
+#   kill -TERM <worker>   worker finishes in-flight requests (up to
+#                         graceful_timeout) and the master replaces it
+#   kill -USR2 <master>   start a new master with the new code next to the
+#                         old one, then `kill -QUIT <old master>`; old
+#                         workers drain before exiting, so a checkout that
+#                         is halfway through place_order still commits
+# (HUP alone re-forks from the preloaded master, i.e. the old code.)
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+preload_app = True
+
+timeout = 30            # a worker silent this long is killed and replaced
+graceful_timeout = 30   # in-flight requests get this long on reload/shutdown
+keepalive = 5
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))  # recycle workers; 0 = never
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')  # e.g. '-' for stdout
+errorlog = '-'
+
+# Read by create_app() in the master; every worker gets its own pool of
+# this size, so the database sees workers * DB_POOL_SIZE connections at most.
+# One per request thread, plus one for the worker's background job thread.
+os.environ.setdefault('DB_POOL_SIZE', str(threads + 1))
+# Each worker already is a process; one scrypt helper apiece is plenty
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '1')
+
+
+def post_fork(server, worker):
+    # The pools reset themselves through os.register_at_fork; this just
+    # makes the per-worker setup visible in the log
+    server.log.info("worker %s ready (pool of %s, %s threads)",
+                    worker.pid, os.environ['DB_POOL_SIZE'], threads)
+
+
+def worker_exit(server, worker):
+    """Finish background work, then close this worker's connections."""
+    from database.connection import close_pool
+    from modules import images
+    from modules.hashing import get_hasher
+
+    # Payment proofs are published on the image pool after their order
+    # commits; let those moves finish so no order points at a missing file
+    images.shutdown(wait=True)
+    get_hasher().shutdown()
+    close_pool()
@@ -1,8 +1,16 @@
-from flask import Blueprint, render_template, redirect, url_for, session, flash, request
+from flask import Blueprint, render_template, redirect, url_for, session, flash, request, jsonify, current_app
 from functools import wraps
-from database.connection import get_db_connection
-from werkzeug.security import generate_password_hash
+from database.connection import get_db_connection, get_pool
+from database import instrumentation
 from modules.utils import admin_required
+from modules.hashing import get_hasher
+from modules.search import user_index, order_by_rank, id_placeholders
+from modules.pagination import fetch_page, page_ranked
+from modules.cache import catalog_cache
+from modules.fragments import fragment_stats
+from modules.sales import dashboard_summary
+from modules.sessions import revoke_user_sessions
+from modules.streaming import wants_all, rank_order, stream_rows, stream_listing
 admin_bp = Blueprint('admin', __name__, template_folder='../templates')
 
 # ==================================================
@@ -13,7 +21,53 @@ admin_bp = Blueprint('admin', __name__, template_folder='../templates')
 @admin_bp.route('/dashboard')
 @admin_required
 def dashboard():
-    return render_template('admin/dashboard.html')
+    """Sales figures from the pre-aggregated rollups (see modules/sales.py)"""
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        summary = dashboard_summary(cursor, days=request.args.get('days', 30, type=int))
+    finally:
+        cursor.close()
+        conn.close()
+    return render_template('admin/dashboard.html', summary=summary)
+
+
+# ==================================================
+# DATABASE POOL STATS
+# ==================================================
+@admin_bp.route('/pool_stats')
+@admin_required
+def pool_stats():
+    """Connection pool size, checkout waits and timeouts as JSON"""
+    return jsonify(get_pool().stats())
+
+
+# ==================================================
+# CATALOG CACHE STATS
+# ==================================================
+@admin_bp.route('/cache_stats')
+@admin_required
+def cache_stats():
+    """Catalog cache (plus session LRU and template fragment) hit/miss counters as JSON"""
+    stats = catalog_cache.stats()
+    stats['fragments'] = fragment_stats()
+    if hasattr(current_app.session_interface, 'stats'):
+        stats['sessions'] = current_app.session_interface.stats()
+    return jsonify(stats)
+
+
+# ==================================================
+# SQL STATS (per endpoint + slowest statements)
+# ==================================================
+@admin_bp.route('/db_stats')
+@admin_required
+def db_stats():
+    """Query counts and DB time per endpoint; ?reset=1 clears them"""
+    stats = instrumentation.snapshot(top=request.args.get('top', 50, type=int))
+    stats['pool'] = get_pool().stats()
+    if request.args.get('reset'):
+        instrumentation.reset()
+    return jsonify(stats)
 
 
 # ==================================================
@@ -34,15 +88,6 @@ def manage_categories():
     return render_template('admin/manage_categories.html')
 
 
-# ==================================================
-# ORDERS MANAGEMENT
-# ==================================================
-@admin_bp.route('/orders')
-@admin_required
-def process_orders():
-    return render_template('admin/process_orders.html')
-
-
 # ==================================================
 # USERS MANAGEMENT (Search + Filter)
 # ==================================================
@@ -56,27 +101,43 @@ def manage_users():
     conn = get_db_connection()
     cur = conn.cursor(dictionary=True)
 
-    sql = "SELECT * FROM users WHERE role = 'customer'"
+    sql = "SELECT user_id, name, email, phone, status FROM users WHERE role = 'customer'"
     params = []
 
+    ranked_ids = None
     if search_query:
-        sql += " AND (name LIKE %s OR email LIKE %s)"
-        params.extend([f"%{search_query}%", f"%{search_query}%"])
+        ranked_ids = user_index.search(search_query)
+        sql += f" AND user_id IN ({id_placeholders(ranked_ids) or 'NULL'})"
+        params.extend(ranked_ids)
 
     if status_filter != 'all':
         sql += " AND status = %s"
         params.append(status_filter)
 
-    sql += " ORDER BY user_id DESC"
-
-    cur.execute(sql, params)
-    users = cur.fetchall()
+    if wants_all():
+        cur.close()
+        order_by, order_params = (rank_order('user_id', ranked_ids) if ranked_ids is not None
+                                  else (" ORDER BY user_id DESC", []))
+        return stream_listing(
+            'admin/manage_users.html',
+            users=stream_rows(sql + order_by, params + order_params),
+            search_query=search_query,
+            status_filter=status_filter
+        )
+
+    if ranked_ids is not None:
+        cur.execute(sql, params)
+        page = page_ranked(order_by_rank(cur.fetchall(), ranked_ids, 'user_id'), 'user_id')
+    else:
+        page = fetch_page(cur, sql, params, [('user_id', 'user_id')])
+    users = page.items
     cur.close()
     conn.close()
 
     return render_template(
         'admin/manage_users.html',
         users=users,
+        page=page,
         search_query=search_query,
         status_filter=status_filter
     )
@@ -98,6 +159,10 @@ def toggle_user_status(user_id, action):
     cur.close()
     conn.close()
 
+    # Deactivation logs the user out of every device right away
+    if status != 'active':
+        revoke_user_sessions(user_id)
+
     flash(f"User account has been {status}.", "info")
     return redirect(url_for('admin.manage_users'))
 
@@ -108,7 +173,7 @@ def toggle_user_status(user_id, action):
 @admin_bp.route('/user/<int:user_id>/reset_password')
 @admin_required
 def reset_user_password(user_id):
-    new_password = generate_password_hash("123456")  # default reset password
+    new_password = get_hasher().hash("123456")  # default reset password
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("UPDATE users SET password=%s WHERE user_id=%s",
@@ -116,6 +181,7 @@ def reset_user_password(user_id):
     conn.commit()
     cur.close()
     conn.close()
+    revoke_user_sessions(user_id)
 
     flash("User password has been reset to '123456'.", "warning")
     return redirect(url_for('admin.manage_users'))
@@ -1,5 +1,8 @@
-from flask import Blueprint, render_template, redirect, url_for, request, session, flash
+from flask import Blueprint, render_template, redirect, url_for, request, session, flash, current_app
 from database.connection import get_db_connection
+from modules.pagination import fetch_page
+from modules.orders import ADMIN_ACTIONS, TRANSITIONS, action_for, transition
+from modules.streaming import wants_all, stream_rows, stream_listing
 
 admin_orders_bp = Blueprint(
     'admin_orders',
@@ -7,6 +10,9 @@ admin_orders_bp = Blueprint(
     template_folder='../templates/admin'
 )
 
+ORDER_STATUSES = ('Pending', 'Shipped', 'Delivered', 'Declined', 'Cancelled')
+
+
 def is_admin():
     return 'user_id' in session and session.get('role') == 'admin'
 
@@ -16,21 +22,39 @@ def orders():
     if not is_admin():
         return redirect(url_for('auth.login'))
 
+    status = request.args.get('status', '')
+
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
 
-    cursor.execute("""
-        SELECT o.*, u.name AS customer_name
+    query = """
+        SELECT o.order_id, o.total_amount, o.status, o.order_date,
+               u.name AS customer_name, u.email
         FROM orders o
         JOIN users u ON o.user_id = u.user_id
-        ORDER BY o.order_date DESC
-    """)
-    orders = cursor.fetchall()
+        WHERE 1=1
+    """
+    params = []
+    # Served by the (status, order_date, order_id) index
+    if status in ORDER_STATUSES:
+        query += " AND o.status = %s"
+        params.append(status)
+
+    if wants_all():
+        cursor.close()
+        return stream_listing('process_orders.html',
+                              orders=stream_rows(query + " ORDER BY o.order_date DESC, o.order_id DESC", params),
+                              statuses=ORDER_STATUSES, selected_status=status)
+
+    page = fetch_page(cursor, query, params,
+                      [('o.order_date', 'order_date'), ('o.order_id', 'order_id')])
+    orders = page.items
 
     cursor.close()
     conn.close()
 
-    return render_template('orders.html', orders=orders)
+    return render_template('process_orders.html', orders=orders, page=page,
+                           statuses=ORDER_STATUSES, selected_status=status)
 
 
 @admin_orders_bp.route('/orders/update/<int:order_id>', methods=['POST'])
@@ -39,27 +63,45 @@ def update_order(order_id):
         return redirect(url_for('auth.login'))
 
     status = request.form.get('status')
-    reason = request.form.get('reason')
+    action = action_for(status)
+    if action is None:
+        flash("Unknown order status", "danger")
+        return redirect(url_for('admin_orders.orders'))
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    if status == 'Declined':
-        cursor.execute("""
-            UPDATE orders
-            SET status = %s, cancel_reason = %s
-            WHERE order_id = %s
-        """, (status, reason, order_id))
+    result = transition(get_db_connection(), action, [order_id], actor_id=session['user_id'],
+                        reason=request.form.get('reason'))
+    if result.moved:
+        flash("Order updated successfully", "success")
     else:
-        cursor.execute("""
-            UPDATE orders
-            SET status = %s
-            WHERE order_id = %s
-        """, (status, order_id))
+        flash(f"Order ORD-{order_id} can't be moved to {status}", "danger")
+    return redirect(url_for('admin_orders.orders'))
 
-    conn.commit()
-    cursor.close()
-    conn.close()
 
-    flash("Order updated successfully", "success")
-    return redirect(url_for('admin_orders.orders'))
+@admin_orders_bp.route('/orders/bulk', methods=['POST'])
+def bulk_update_orders():
+    """Ship, deliver or decline every ticked order in one transaction."""
+    if not is_admin():
+        return redirect(url_for('auth.login'))
+
+    action = request.form.get('action')
+    order_ids = request.form.getlist('order_ids', type=int)
+    # Back to the listing the orders were ticked on
+    back = url_for('admin_orders.orders', status=request.form.get('status_filter') or None)
+    if action not in ADMIN_ACTIONS:
+        flash("Choose what to do with the selected orders", "danger")
+        return redirect(back)
+    if not order_ids:
+        flash("No orders selected", "warning")
+        return redirect(back)
+    if len(order_ids) > current_app.config['ORDER_BULK_MAX']:
+        flash(f"Select at most {current_app.config['ORDER_BULK_MAX']} orders at a time", "danger")
+        return redirect(back)
+
+    result = transition(get_db_connection(), action, order_ids, actor_id=session['user_id'],
+                        reason=request.form.get('reason'))
+    target = TRANSITIONS[action][0]
+    if result.moved:
+        flash(f"{len(result.moved)} order(s) marked {target}", "success")
+    if result.skipped:
+        flash(f"{len(result.skipped)} order(s) skipped: their status can't move to {target}", "warning")
+    return redirect(back)
@@ -0,0 +1,268 @@
+import gzip
+import hashlib
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import Blueprint, current_app, request, url_for
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    brotli = None
+
+from database.connection import get_db_connection
+from modules.cache import catalog_cache, cached_query, cached_page, category_options
+from modules.images import image_variants
+from modules.pagination import decode_cursor, encode_cursor, page_ranked, page_size
+from modules.search import product_index, order_by_rank, id_placeholders
+
+api_bp = Blueprint('api', __name__)
+
+# =====================================
+# READ-ONLY CATALOG API (/api/v1)
+# =====================================
+# GET /products[/<id>], /categories, /authors as JSON.
+#   ?fields=title,price   sparse fieldset (unknown names are a 400)
+#   ?limit=&after=        keyset pagination, same cursors as the HTML lists
+# Responses carry a weak ETag (304 on If-None-Match) and are compressed
+# with brotli or gzip when the client accepts it. Data comes through the
+# catalog cache, so admin writes show up after the next invalidation.
+
+# field -> SQL expression; product_id is always selected for the cursor
+PRODUCT_FIELDS = {
+    'product_id': 'p.product_id',
+    'title': 'p.title',
+    'author': 'p.author',
+    'description': 'p.description',
+    'price': 'p.price',
+    'stock': 'COALESCE(p.stock, 0)',
+    'image': 'p.image',
+    'category_id': 'p.category_id',
+    'category_name': 'c.category_name',
+    'updated_at': 'COALESCE(p.updated_at, p.created_at)',
+}
+# Computed from another column after the query
+PRODUCT_COMPUTED = {'images': 'image'}
+DEFAULT_PRODUCT_FIELDS = ('product_id', 'title', 'author', 'price', 'stock', 'image', 'category_name')
+CATEGORY_FIELDS = ('category_id', 'category_name')
+
+
+class ApiError(Exception):
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+@api_bp.errorhandler(ApiError)
+def handle_api_error(e):
+    response = current_app.response_class(
+        json.dumps({'error': str(e)}), status=e.status, mimetype='application/json')
+    response.headers['Cache-Control'] = "no-store"
+    return response
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def selected_fields(allowed, default):
+    """Fields named in ?fields=, validated against `allowed`."""
+    raw = request.args.get('fields')
+    if not raw:
+        return list(default)
+    fields = list(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown)}. "
+                       f"Available: {', '.join(sorted(allowed))}")
+    return fields
+
+
+def api_response(payload):
+    """JSON with a weak ETag; 304 when the client already has this body."""
+    body = json.dumps(payload, separators=(',', ':'), default=_json_value)
+    etag = hashlib.sha1(body.encode()).hexdigest()[:20]
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(body, mimetype='application/json')
+    # Weak: the gzip/brotli encodings of a body share its validator
+    response.set_etag(etag, weak=True)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config.get('CATALOG_MAX_AGE', 60)
+    return response
+
+
+def list_payload(items, next_cursor):
+    next_url = None
+    if next_cursor:
+        args = request.args.to_dict()
+        args['after'] = next_cursor
+        next_url = url_for(request.endpoint, **(request.view_args or {}), **args)
+    return {'data': items, 'next_cursor': next_cursor, 'next': next_url}
+
+
+# =====================================
+# PRODUCTS
+# =====================================
+
+
+def _product_select(fields):
+    columns = {'product_id'} | {PRODUCT_COMPUTED.get(f, f) for f in fields}
+    return ', '.join(f"{PRODUCT_FIELDS[c]} AS {c}" for c in sorted(columns))
+
+
+def _shape_products(rows, fields):
+    shaped = []
+    for row in rows:
+        item = {}
+        for field in fields:
+            if field == 'images':
+                item[field] = image_variants(row['image'])
+            elif field == 'image':
+                item[field] = image_variants(row['image'])['src']
+            else:
+                item[field] = row[field]
+        shaped.append(item)
+    return shaped
+
+
+@api_bp.route('/products')
+def products():
+    fields = selected_fields(PRODUCT_FIELDS.keys() | PRODUCT_COMPUTED.keys(), DEFAULT_PRODUCT_FIELDS)
+    search = request.args.get('search', '').strip()
+    category = request.args.get('category', type=int)
+    in_stock = request.args.get('in_stock') in ('1', 'true')
+
+    query = f"""
+        SELECT {_product_select(fields)}
+        FROM products p
+        LEFT JOIN categories c ON c.category_id = p.category_id
+        WHERE 1=1
+    """
+    params = []
+    if in_stock:
+        query += " AND p.stock > 0"
+    if category is not None:
+        query += " AND p.category_id = %s"
+        params.append(category)
+
+    key = f"api:products:{','.join(fields)}:{category}:{int(in_stock)}"
+    if search:
+        def load_ranked():
+            ranked_ids = product_index.search(search)
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(
+                query + f" AND p.product_id IN ({id_placeholders(ranked_ids) or 'NULL'})",
+                params + ranked_ids)
+            rows = order_by_rank(cursor.fetchall(), ranked_ids, 'product_id')
+            cursor.close()
+            conn.close()
+            return page_ranked(rows, 'product_id')
+
+        page = catalog_cache.get_or_set(
+            f"{key}:search:{search.lower()}:{request.args.get('after', '')}:{page_size()}", load_ranked)
+    else:
+        page = cached_page(key, query, params, [('p.product_id', 'product_id')])
+
+    return api_response(list_payload(_shape_products(page.items, fields), page.next_cursor))
+
+
+@api_bp.route('/products/<int:product_id>')
+def product(product_id):
+    fields = selected_fields(PRODUCT_FIELDS.keys() | PRODUCT_COMPUTED.keys(), PRODUCT_FIELDS.keys())
+    row = cached_query(f"api:product:{product_id}:{','.join(fields)}", f"""
+        SELECT {_product_select(fields)}
+        FROM products p
+        LEFT JOIN categories c ON c.category_id = p.category_id
+        WHERE p.product_id = %s
+    """, (product_id,), one=True)
+    if row is None:
+        raise ApiError("Product not found", 404)
+    return api_response({'data': _shape_products([row], fields)[0]})
+
+
+# =====================================
+# CATEGORIES / AUTHORS
+# =====================================
+
+
+@api_bp.route('/categories')
+def categories():
+    fields = selected_fields(CATEGORY_FIELDS, CATEGORY_FIELDS)
+    items = [{field: row[field] for field in fields} for row in category_options()]
+    return api_response(list_payload(items, None))
+
+
+@api_bp.route('/authors')
+def authors():
+    """Distinct authors by name with their number of books, keyset paged."""
+    limit = page_size()
+    after = request.args.get('after', '')
+    values = decode_cursor(after, 1)
+
+    def load():
+        sql = "SELECT author AS name, COUNT(*) AS books FROM products WHERE author IS NOT NULL AND author <> ''"
+        params = []
+        if values is not None:
+            sql += " AND author > %s"
+            params.append(values[0])
+        sql += " GROUP BY author ORDER BY author LIMIT %s"
+        params.append(limit + 1)
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+
+    rows = catalog_cache.get_or_set(f"api:authors:{after}:{limit}", load)
+    next_cursor = encode_cursor([rows[limit - 1]['name']]) if len(rows) > limit else None
+    return api_response(list_payload(rows[:limit], next_cursor))
+
+
+# =====================================
+# RESPONSE COMPRESSION
+# =====================================
+
+
+def _encoding():
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(offered)
+
+
+@api_bp.after_request
+def compress(response):
+    """gzip/brotli by Accept-Encoding for bodies worth compressing."""
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers):
+        return response
+    body = response.get_data()
+    if len(body) < current_app.config.get('API_COMPRESS_MIN_BYTES', 512):
+        return response
+    encoding = _encoding()
+    if encoding == 'br':
+        body = brotli.compress(body, quality=current_app.config.get('API_BROTLI_QUALITY', 5))
+    elif encoding == 'gzip':
+        body = gzip.compress(body, compresslevel=current_app.config.get('API_GZIP_LEVEL', 6))
+    else:
+        return response
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_api(app):
+    app.config.setdefault('API_COMPRESS_MIN_BYTES', 512)
+    app.config.setdefault('API_GZIP_LEVEL', 6)
+    app.config.setdefault('API_BROTLI_QUALITY', 5)
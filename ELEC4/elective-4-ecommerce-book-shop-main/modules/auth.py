@@ -1,7 +1,9 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from werkzeug.security import generate_password_hash, check_password_hash
 import re
 from database.connection import get_db_connection
+from modules.search import user_index
+from modules.hashing import get_hasher, HashingBusy
+from modules.sessions import login_user
 
 auth_bp = Blueprint('auth', __name__, template_folder='../templates')
 
@@ -65,7 +67,18 @@ def register():
             )
 
         # --- Insert user ---
-        hashed_password = generate_password_hash(password)
+        try:
+            hashed_password = get_hasher().hash(password)
+        except HashingBusy:
+            flash("The server is busy. Please try again in a moment.", "warning")
+            return render_template(
+                'auth/register.html',
+                errors={},
+                name=name,
+                email=email,
+                phone=phone,
+                address=address
+            ), 503
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute("""
@@ -73,6 +86,7 @@ def register():
             VALUES (%s, %s, %s, %s, %s, 'customer', 'active')
         """, (name, email, hashed_password, phone, address))
         conn.commit()
+        user_index.add(cursor.lastrowid, {'name': name, 'email': email})
         cursor.close()
         conn.close()
 
@@ -103,17 +117,33 @@ def login():
             flash("Your account has been deactivated. Please contact admin.", "danger")
             return redirect(url_for('auth.login'))
 
-        if check_password_hash(user['password'], password):
-            #  Save session
-            session['user_id'] = user['user_id']
-            session['role'] = user['role']
-            session['name'] = user['name']
+        try:
+            valid, needs_rehash = get_hasher().verify(user['password'], password)
+        except HashingBusy:
+            flash("The server is busy. Please try again in a moment.", "warning")
+            return render_template('auth/login.html'), 503
+
+        if valid:
+            #  Upgrade the stored hash if the hashing parameters changed
+            if needs_rehash:
+                try:
+                    conn = get_db_connection()
+                    cursor = conn.cursor()
+                    cursor.execute("UPDATE users SET password=%s WHERE user_id=%s",
+                                   (get_hasher().hash(password), user['user_id']))
+                    conn.commit()
+                    cursor.close()
+                    conn.close()
+                except HashingBusy:
+                    pass  # try again on the next login
+
+            #  Save session (fresh id; the rest of the user is loaded lazily)
+            login_user(user)
 
             #  Redirect based on role
             if user['role'] == 'admin':
                 return redirect(url_for('admin.dashboard'))
             else:
-                print('as: ' + generate_password_hash("admin123"))
                 return redirect(url_for('customer.home'))
         else:
             flash("Incorrect password.", "danger")
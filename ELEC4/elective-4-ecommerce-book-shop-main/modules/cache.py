@@ -0,0 +1,236 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context, request
+from database.connection import get_db_connection
+from modules.pagination import fetch_page, page_size
+
+# =====================================
+# CATALOG CACHE
+# =====================================
+# Read-through cache for catalog queries (home, shop, product details,
+# category dropdowns). Entries expire after a TTL, the in-process backend
+# evicts least-recently-used entries, and admin writes invalidate the
+# whole catalog by bumping a generation number that is part of every key.
+# Stock changes from orders, holds and restocks only drop the affected
+# products' detail entries; listings showing the old count age out on
+# the TTL (every sale re-checks stock in the database anyway).
+
+MISSING = object()
+
+
+class MemoryBackend:
+    """Thread-safe in-process LRU with per-entry expiry."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            value = self._data.get(key, (0, None))[0] + 1
+            self._data[key] = (value, None)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisBackend:
+    """Any Redis-protocol server (Redis, Valkey, KeyDB, a local stand-in).
+
+    Shared by every worker process, so an invalidation in one worker is
+    seen by all of them. LRU eviction is the server's maxmemory-policy.
+    """
+
+    def __init__(self, url, prefix='bookshop:'):
+        import redis  # optional dependency, only needed for this backend
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.evictions = 0
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + key)
+        return MISSING if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self._client.set(self.prefix + key, pickle.dumps(value), ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        self._client.delete(self.prefix + key)
+
+    def incr(self, key):
+        return int(self._client.incr(self.prefix + key))
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            self._client.delete(key)
+
+    def __len__(self):
+        return sum(1 for _ in self._client.scan_iter(self.prefix + '*'))
+
+
+class Cache:
+    """Namespaced read-through cache with hit/miss statistics."""
+
+    GENERATION_KEY = 'generation'
+
+    def __init__(self, namespace, backend=None, ttl=60):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = _backend_from_config()
+            if has_app_context():
+                self.ttl = current_app.config.get('CATALOG_CACHE_TTL', self.ttl)
+        return self._backend
+
+    def _generation(self):
+        gen = self.backend.get(f"{self.namespace}:{self.GENERATION_KEY}")
+        return 0 if gen is MISSING else gen
+
+    def _key(self, key):
+        return f"{self.namespace}:{self._generation()}:{key}"
+
+    def get_or_set(self, key, loader, ttl=None):
+        """Return the cached value for key, calling loader() on a miss."""
+        full_key = self._key(key)
+        value = self.backend.get(full_key)
+        if value is not MISSING:
+            with self._lock:
+                self.hits += 1
+            return value
+
+        with self._lock:
+            self.misses += 1
+        value = loader()
+        self.backend.set(full_key, value, ttl or self.ttl)
+        return value
+
+    def delete(self, *keys):
+        """Drop single entries of the current generation."""
+        for key in keys:
+            self.backend.delete(self._key(key))
+
+    def invalidate(self):
+        """Drop every entry in this namespace (old generations age out)."""
+        self.backend.incr(f"{self.namespace}:{self.GENERATION_KEY}")
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'namespace': self.namespace,
+            'backend': type(self.backend).__name__,
+            'ttl': self.ttl,
+            'entries': len(self.backend),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'evictions': self.backend.evictions,
+        }
+
+
+def _backend_from_config():
+    config = current_app.config if has_app_context() else {}
+    if config.get('CATALOG_CACHE_BACKEND', 'memory') == 'redis':
+        return RedisBackend(config.get('CATALOG_CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+    return MemoryBackend(config.get('CATALOG_CACHE_MAXSIZE', 1024))
+
+
+catalog_cache = Cache('catalog')
+
+
+def cached_query(key, sql, params=(), one=False):
+    """Run a catalog SELECT through the cache; rows are returned as dicts.
+
+    Cached rows are shared between requests, so callers must not mutate them.
+    """
+    def load():
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchone() if one else cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+
+    return catalog_cache.get_or_set(key, load)
+
+
+def cached_page(key, query, params, order_by, descending=True):
+    """fetch_page() through the cache, keyed by the cursor and page size."""
+    limit = page_size()
+    after = request.args.get('after', '')
+
+    def load():
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            return fetch_page(cursor, query, params, order_by, descending, limit, after)
+        finally:
+            cursor.close()
+            conn.close()
+
+    return catalog_cache.get_or_set(f"{key}:{after}:{limit}", load)
+
+
+def category_options():
+    """Categories for filter/edit dropdowns, ordered by name."""
+    return cached_query(
+        'categories:options',
+        "SELECT category_id, category_name FROM categories ORDER BY category_name ASC",
+    )
+
+
+def invalidate_catalog():
+    """Call after any admin write that changes products or categories."""
+    catalog_cache.invalidate()
+
+
+def invalidate_stock(product_ids):
+    """Call after a stock-only change (orders, holds, restocks)."""
+    catalog_cache.delete(*(f"product:{product_id}" for product_id in product_ids))
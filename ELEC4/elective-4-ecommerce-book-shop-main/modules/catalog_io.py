@@ -0,0 +1,350 @@
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+
+from database.connection import get_db_connection, release_db_connection
+from modules.cache import category_options, invalidate_catalog
+from modules.facets import product_facets
+from modules.search import product_index
+from modules.stock import set_stock
+
+# =====================================
+# BULK CATALOG IMPORT / EXPORT
+# =====================================
+# CSV (header row) or JSONL (one object per line) with the columns in
+# COLUMNS. Import reads the file as a stream, validates it in chunks of
+# CATALOG_IMPORT_CHUNK_SIZE rows and upserts each chunk by title (unique
+# since migration 0005) with one multi-row INSERT ... ON DUPLICATE KEY
+# UPDATE in its own transaction. Export pages through products by id, so
+# neither side ever holds the whole catalog in memory.
+#
+# Empty optional cells leave an existing product's value alone, so a file
+# of just title,price,stock is a price/stock update.
+
+COLUMNS = ('title', 'author', 'description', 'price', 'stock', 'category', 'image')
+FORMATS = ('csv', 'jsonl')
+MAX_REPORTED_ERRORS = 50
+
+UPSERT_SQL = """
+    INSERT INTO products (title, author, description, price, stock, category_id, image)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        author = COALESCE(VALUES(author), author),
+        description = COALESCE(VALUES(description), description),
+        price = VALUES(price),
+        stock = COALESCE(VALUES(stock), stock),
+        category_id = COALESCE(VALUES(category_id), category_id),
+        image = COALESCE(VALUES(image), image)
+"""
+
+# Column lengths from the products table
+MAX_LENGTHS = {'title': 150, 'author': 100, 'image': 255}
+MAX_PRICE = Decimal('99999999.99')  # decimal(10,2)
+
+
+def _config(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+
+class ImportReport:
+    """Running totals for one import, passed to the progress callback."""
+
+    def __init__(self):
+        self.rows = 0
+        self.written = 0
+        self.rejected = 0
+        self.errors = []    # [(line, message)], first MAX_REPORTED_ERRORS
+        self.failed = None  # set when a chunk could not be written
+
+    def reject(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def summary(self):
+        text = f"{self.rows} row(s) read, {self.written} imported, {self.rejected} rejected"
+        if self.failed:
+            text += f"; stopped: {self.failed}"
+        return text
+
+
+# =====================================
+# READING
+# =====================================
+
+
+def read_rows(stream, fmt):
+    """Yield (line, row dict, parse error) from a binary stream."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(text)
+            missing = {'title', 'price'} - {name.strip().lower() for name in reader.fieldnames or ()}
+            if missing:
+                yield 1, None, f"missing column(s): {', '.join(sorted(missing))}"
+                return
+            for row in reader:
+                yield reader.line_num, {(k or '').strip().lower(): v for k, v in row.items()}, None
+        else:
+            for line, raw in enumerate(text, 1):
+                if not raw.strip():
+                    continue
+                try:
+                    row = json.loads(raw)
+                except ValueError as e:
+                    yield line, None, f"invalid JSON: {e}"
+                    continue
+                if not isinstance(row, dict):
+                    yield line, None, "expected a JSON object"
+                    continue
+                yield line, {str(k).lower(): v for k, v in row.items()}, None
+    finally:
+        text.detach()  # leave the caller's stream open
+
+
+def _text(row, field):
+    value = row.get(field)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def validate_row(row, categories):
+    """Row dict -> (values for UPSERT_SQL, None) or (None, error message)."""
+    title = _text(row, 'title')
+    if not title:
+        return None, "title is required"
+
+    fields = {'title': title, 'author': _text(row, 'author'), 'image': _text(row, 'image')}
+    for field, limit in MAX_LENGTHS.items():
+        if fields[field] and len(fields[field]) > limit:
+            return None, f"{field} is longer than {limit} characters"
+
+    try:
+        price = Decimal(_text(row, 'price') or 'x')
+    except InvalidOperation:
+        return None, "price must be a number"
+    if not price.is_finite() or not 0 <= price <= MAX_PRICE:
+        return None, "price is out of range"
+    price = price.quantize(Decimal('0.01'))
+
+    stock = _text(row, 'stock')
+    if stock is not None:
+        try:
+            stock = int(stock)
+        except ValueError:
+            return None, "stock must be a whole number"
+        if stock < 0:
+            return None, "stock can't be negative"
+
+    category_id = None
+    category = _text(row, 'category')
+    if category:
+        category_id = categories.get(category.lower())
+        if category_id is None:
+            return None, f"unknown category '{category}'"
+
+    return (title, fields['author'], _text(row, 'description'), price, stock, category_id,
+            fields['image']), None
+
+
+# =====================================
+# IMPORT
+# =====================================
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def import_products(stream, fmt, chunk_size=None, progress=None):
+    """Upsert products from a CSV/JSONL stream; returns an ImportReport.
+
+    Each chunk commits on its own: if one fails to write, the import stops
+    there and the earlier chunks stay imported (re-running is safe, rows
+    are matched by title).
+    """
+    chunk_size = chunk_size or _config('CATALOG_IMPORT_CHUNK_SIZE', 1000)
+    report = ImportReport()
+    # Category names resolved once, from the cached dropdown list
+    categories = {c['category_name'].strip().lower(): c['category_id'] for c in category_options()}
+
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        for chunk in _chunks(read_rows(stream, fmt), chunk_size):
+            batch = []
+            for line, row, error in chunk:
+                values = None
+                if error is None:
+                    values, error = validate_row(row, categories)
+                if error:
+                    report.reject(line, error)
+                else:
+                    batch.append(values)
+            report.rows += len(chunk)
+
+            if batch:
+                try:
+                    conn.start_transaction()
+                    # executemany sends a single multi-row INSERT
+                    cursor.executemany(UPSERT_SQL, batch)
+                    _rebalance_sharded(cursor, batch)
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    report.failed = f"lines {chunk[0][0]}-{chunk[-1][0]}: {e}"
+                    break
+                report.written += len(batch)
+            if progress:
+                progress(report)
+    finally:
+        cursor.close()
+        conn.close()
+
+    if report.written:
+        # Rebuilt from the table on next use rather than row by row
+        product_index.mark_stale()
+        product_facets.mark_stale()
+        invalidate_catalog()
+    return report
+
+
+def _rebalance_sharded(cursor, batch):
+    # An imported stock figure replaces a sharded product's shards too
+    stocks = {values[0]: values[4] for values in batch if values[4] is not None}
+    if not stocks:
+        return
+    titles = list(stocks)
+    cursor.execute(f"""
+        SELECT product_id, title FROM products
+        WHERE stock_shards > 0 AND title IN ({', '.join(['%s'] * len(titles))})
+    """, titles)
+    for row in cursor.fetchall():
+        set_stock(cursor, row['product_id'], stocks[row['title']])
+
+
+# =====================================
+# EXPORT
+# =====================================
+
+EXPORT_SQL = """
+    SELECT p.product_id, p.title, p.author, p.description, p.price, p.stock,
+           c.category_name AS category, p.image
+    FROM products p
+    LEFT JOIN categories c ON c.category_id = p.category_id
+    WHERE p.product_id > %s
+    ORDER BY p.product_id
+    LIMIT %s
+"""
+
+
+def iter_product_chunks(chunk_size=None):
+    """Yield lists of product rows in id order, one query per chunk.
+
+    The pooled connection goes back between chunks, so a slow download
+    doesn't hold a database connection for its whole length.
+    """
+    chunk_size = chunk_size or _config('CATALOG_EXPORT_CHUNK_SIZE', 1000)
+    last_id = 0
+    while True:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(EXPORT_SQL, (last_id, chunk_size))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+            if has_app_context():
+                release_db_connection()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1]['product_id']
+
+
+def export_products(fmt, chunk_size=None):
+    """Yield the catalog as CSV or JSONL text, one chunk of rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(COLUMNS)
+    for rows in iter_product_chunks(chunk_size):
+        for row in rows:
+            if fmt == 'csv':
+                writer.writerow(['' if row[c] is None else row[c] for c in COLUMNS])
+            else:
+                buffer.write(json.dumps({c: row[c] for c in COLUMNS}, default=str) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+# =====================================
+# CLI
+# =====================================
+
+
+def format_for(filename, fmt=None):
+    """The format asked for, else guessed from the file extension."""
+    if fmt in FORMATS:
+        return fmt
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.json', '.ndjson')) else 'csv'
+
+
+@click.command('import-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Default: from the file extension.')
+@click.option('--chunk-size', type=int, default=None)
+@with_appcontext
+def import_products_command(path, fmt, chunk_size):
+    """Upsert products from a CSV or JSONL file, matched by title."""
+    def progress(report):
+        click.echo(f"  {report.rows} rows, {report.written} imported, {report.rejected} rejected")
+
+    with open(path, 'rb') as f:
+        report = import_products(f, format_for(path, fmt), chunk_size, progress)
+    for line, message in report.errors:
+        click.echo(f"line {line}: {message}")
+    if report.rejected > len(report.errors):
+        click.echo(f"... and {report.rejected - len(report.errors)} more")
+    click.echo(report.summary())
+    if report.failed:
+        raise SystemExit(1)
+
+
+@click.command('export-products')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Default: from the file extension.')
+@with_appcontext
+def export_products_command(path, fmt):
+    """Write every product to a CSV or JSONL file."""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for text in export_products(format_for(path, fmt)):
+            f.write(text)
+    click.echo(f"wrote {path}")
+
+
+def init_catalog_io(app):
+    app.config.setdefault('CATALOG_IMPORT_CHUNK_SIZE', 1000)
+    app.config.setdefault('CATALOG_EXPORT_CHUNK_SIZE', 1000)
+    app.config.setdefault('CATALOG_IMPORT_MAX_BYTES', 200 * 1024 * 1024)
+    app.cli.add_command(import_products_command)
+    app.cli.add_command(export_products_command)
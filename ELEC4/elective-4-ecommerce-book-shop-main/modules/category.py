@@ -4,6 +4,8 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from database.connection import get_db_connection
 from modules.utils import admin_required
+from modules.search import category_index, order_by_rank, id_placeholders
+from modules.cache import invalidate_catalog
 category_bp = Blueprint('category', __name__, template_folder='../templates')
 
 
@@ -36,17 +38,17 @@ def manage_categories():
 
         print("Fetching categories from database...")
 
-        # Add search condition
+        # Add search condition (ranked by the search index)
         if search:
-            cursor.execute("""
+            ranked_ids = category_index.search(search)
+            cursor.execute(f"""
                 SELECT * FROM categories
-                WHERE category_name LIKE %s OR description LIKE %s
-                ORDER BY created_at ASC
-            """, (f"%{search}%", f"%{search}%"))
+                WHERE category_id IN ({id_placeholders(ranked_ids) or 'NULL'})
+            """, ranked_ids)
+            categories = order_by_rank(cursor.fetchall(), ranked_ids, 'category_id')
         else:
             cursor.execute("SELECT * FROM categories ORDER BY created_at ASC")
-
-        categories = cursor.fetchall()
+            categories = cursor.fetchall()
         conn.commit()
 
         print(f"Found {len(categories)} categories")
@@ -108,6 +110,9 @@ def add_category():
                 (category_name, description)
             )
             conn.commit()
+            category_index.add(cursor.lastrowid, {
+                'category_name': category_name, 'description': description})
+            invalidate_catalog()
 
             print(f"✓ Category '{category_name}' added successfully!")
             flash(
@@ -161,6 +166,9 @@ def edit_category(category_id):
                 (category_name, description, category_id)
             )
             conn.commit()
+            category_index.add(category_id, {
+                'category_name': category_name, 'description': description})
+            invalidate_catalog()
 
             print(f"✓ Category '{category_name}' updated successfully!")
             flash(
@@ -221,6 +229,8 @@ def delete_category(category_id):
         cursor.execute(
             "DELETE FROM categories WHERE category_id=%s", (category_id,))
         conn.commit()
+        category_index.remove(category_id)
+        invalidate_catalog()
 
         print(f"✓ Category '{category['category_name']}' deleted!")
         flash(
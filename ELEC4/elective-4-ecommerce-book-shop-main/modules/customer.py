@@ -1,8 +1,15 @@
-from flask import Blueprint, render_template, redirect, url_for, session, request, jsonify, flash
+from flask import Blueprint, render_template, redirect, url_for, session, request, jsonify, flash, current_app
 from database.connection import get_db_connection
-import os
-from werkzeug.utils import secure_filename
-from datetime import datetime
+from modules.search import product_index, order_by_rank, id_placeholders
+from modules.pagination import fetch_page, page_ranked, page_size
+from modules.cache import catalog_cache, cached_query, cached_page, category_options
+from modules.orders import transition
+from modules.holds import hold_cart, convert_holds, holds_committed, user_holder
+from modules.facets import product_facets
+from modules.uploads import spool_upload, UploadRejected
+from modules.sales import queue_rollup
+from modules.jobs import log_activity
+from modules.http_cache import conditional, row_etag
 
 from flask import session, request, redirect, url_for, render_template, flash
 customer_bp = Blueprint('customer', __name__, template_folder='../templates')
@@ -15,25 +22,19 @@ def home():
     if not is_customer():
         return redirect(url_for('auth.login'))
     
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    
-    # 1. Fetch books (Added 'stock' explicitly to ensure it's selected)
-    cursor.execute("SELECT * FROM products ORDER BY product_id DESC")
-    books = cursor.fetchall()
-
-    # 2. Fetch unique authors for the filter chips
-    cursor.execute("SELECT DISTINCT author FROM products WHERE author IS NOT NULL LIMIT 8")
-    authors = cursor.fetchall()
-    
-    cursor.close()
-    conn.close()
-    
-    # Ensure stock is treated as an int in Python before rendering
-    for book in books:
-        book['stock'] = int(book['stock']) if book['stock'] is not None else 0
+    # 1. Fetch one page of books (newest first, served from the catalog cache)
+    page = cached_page('home', """
+        SELECT product_id, title, author, price, COALESCE(stock, 0) AS stock, image,
+               COALESCE(updated_at, created_at) AS updated_at
+        FROM products
+        WHERE 1=1
+    """, [], [('product_id', 'product_id')])
+    books = page.items
+
+    # 2. Authors with the most books in stock for the filter chips (facet index, no query)
+    authors = product_facets.authors(limit=8)
     
-    return render_template('customer/home.html', books=books, authors=authors)
+    return render_template('customer/home.html', books=books, authors=authors, page=page)
 
 # --- SHOP & SEARCH ---
 @customer_bp.route('/shop')
@@ -43,55 +44,77 @@ def shop():
     
     search_query = request.args.get('search', '').strip()
     category_id = request.args.get('category', '')
+    author = request.args.get('author', '').strip()
 
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    
     query = """
-        SELECT p.*, c.category_name 
+        SELECT p.product_id, p.title, p.author, p.price, p.stock, p.image, c.category_name,
+               COALESCE(p.updated_at, p.created_at) AS updated_at
         FROM products p 
         LEFT JOIN categories c ON p.category_id = c.category_id 
         WHERE p.stock > 0
     """
     params = []
 
-    if search_query:
-        query += " AND (p.title LIKE %s OR p.author LIKE %s)"
-        search_param = f"%{search_query}%"
-        params.extend([search_param, search_param])
-
     if category_id:
         query += " AND p.category_id = %s"
         params.append(category_id)
 
-    query += " ORDER BY p.product_id DESC"
-    
-    cursor.execute(query, params)
-    products = cursor.fetchall()
+    if author:
+        query += " AND p.author = %s"
+        params.append(author)
 
-    cursor.execute("SELECT category_id, category_name FROM categories")
-    categories = cursor.fetchall()
-    
-    cursor.close()
-    conn.close()
-    
-    return render_template('customer/shop.html', products=products, categories=categories)
+    if search_query:
+        # Search results keep their relevance order (bounded by SEARCH_MAX_RESULTS)
+        def load_ranked():
+            ranked_ids = product_index.search(search_query)
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(
+                query + f" AND p.product_id IN ({id_placeholders(ranked_ids) or 'NULL'})",
+                params + ranked_ids)
+            rows = order_by_rank(cursor.fetchall(), ranked_ids, 'product_id')
+            cursor.close()
+            conn.close()
+            return page_ranked(rows, 'product_id')
+
+        key = f"shop:search:{search_query.lower()}:{category_id}:{author}:{request.args.get('after', '')}:{page_size()}"
+        page = catalog_cache.get_or_set(key, load_ranked)
+    else:
+        page = cached_page(f"shop:{category_id}:{author}", query, params, [('p.product_id', 'product_id')])
+    products = page.items
+
+    # Facet counts (in stock), each narrowed by the other filter
+    selected_category = int(category_id) if category_id.isdigit() else None
+    category_counts = product_facets.categories(author or None)
+    categories = [dict(cat, books=category_counts.get(cat['category_id'], 0)) for cat in category_options()]
+    authors = product_facets.authors(selected_category, limit=current_app.config.get('FACET_AUTHOR_LIMIT', 20))
+
+    return render_template('customer/shop.html', products=products, categories=categories,
+                           authors=authors, selected_author=author, page=page)
 
 # --- PRODUCT DETAILS ---
-@customer_bp.route('/shop/<int:product_id>')
-def product_details(product_id):
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT p.*, c.category_name 
+def _product_row(product_id):
+    """One product with its category name, from the catalog cache."""
+    return cached_query(f"product:{product_id}", """
+        SELECT p.product_id, p.title, p.author, p.description, p.price,
+               p.stock, p.image, c.category_name,
+               COALESCE(p.updated_at, p.created_at) AS updated_at
         FROM products p 
         LEFT JOIN categories c ON p.category_id = c.category_id 
         WHERE p.product_id = %s
-    """, (product_id,))
-    product = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    return render_template('customer/product_view.html', product=product)
+    """, (product_id,), one=True)
+
+
+@customer_bp.route('/shop/<int:product_id>')
+def product_details(product_id):
+    product = _product_row(product_id)
+    if product is None:
+        return render_template('customer/product_view.html', product=product)
+    # Public page: revalidated by ETag / Last-Modified instead of re-rendered
+    return conditional(
+        row_etag(product),
+        lambda: render_template('customer/product_view.html', product=product),
+        last_modified=product['updated_at'])
 
 # --- ADD TO CART (AJAX) ---
 @customer_bp.route('/add_to_cart', methods=['POST'])
@@ -113,53 +136,49 @@ def add_to_cart():
     cursor = conn.cursor(dictionary=True)
 
     try:
-        # 1. VALIDATE STOCK
-        cursor.execute("SELECT title, stock FROM products WHERE product_id = %s", (product_id,))
-        product = cursor.fetchone()
-
-        if not product:
-            return jsonify({'success': False, 'message': 'Product not found.'}), 404
-        
-        if product['stock'] <= 0:
-            return jsonify({'success': False, 'message': 'This item is currently out of stock.'}), 400
-
-        # 2. CHECK EXISTING CART (Fixed column name to user_id)
-        cursor.execute("SELECT cart_id, quantity FROM cart WHERE user_id = %s AND product_id = %s", 
-                       (user_id, product_id))
-        existing_item = cursor.fetchone()
-
-        requested_total = quantity
-        if existing_item:
-            requested_total += existing_item['quantity']
-
-        # 3. STOCK OVERFLOW CHECK
-        if requested_total > product['stock']:
+        # 1. INSERT OR TOP UP THE CART LINE IN ONE STATEMENT
+        # The SELECT only yields a row when the product exists and has
+        # stock for what is already in the cart plus the new quantity.
+        cursor.execute("""
+            INSERT INTO cart (user_id, product_id, quantity)
+            SELECT %s, p.product_id, %s
+            FROM products p
+            LEFT JOIN cart c ON c.user_id = %s AND c.product_id = p.product_id
+            WHERE p.product_id = %s
+              AND p.stock >= %s + COALESCE(c.quantity, 0)
+            ON DUPLICATE KEY UPDATE quantity = cart.quantity + VALUES(quantity)
+        """, (user_id, quantity, user_id, product_id, quantity))
+
+        if cursor.rowcount == 0:
+            # 2. REJECTED - look up why (only on the failure path)
+            cursor.execute("""
+                SELECT p.stock, COALESCE(c.quantity, 0) AS in_cart
+                FROM products p
+                LEFT JOIN cart c ON c.user_id = %s AND c.product_id = p.product_id
+                WHERE p.product_id = %s
+            """, (user_id, product_id))
+            product = cursor.fetchone()
+
+            if not product:
+                return jsonify({'success': False, 'message': 'Product not found.'}), 404
+            if product['stock'] <= 0:
+                return jsonify({'success': False, 'message': 'This item is currently out of stock.'}), 400
             return jsonify({
                 'success': False, 
-                'message': f"Cannot add more. You already have {existing_item['quantity'] if existing_item else 0} in cart, and only {product['stock']} are available."
+                'message': f"Cannot add more. You already have {product['in_cart']} in cart, and only {product['stock']} are available."
             }), 400
 
-        # 4. PERFORM DATABASE ACTION (Fixed column name to user_id)
-        if existing_item:
-            cursor.execute("UPDATE cart SET quantity = %s WHERE cart_id = %s", 
-                           (requested_total, existing_item['cart_id']))
+        # 3. CART COUNT FROM THE SESSION (summed from the DB once per session)
+        if 'cart_count' in session:
+            session['cart_count'] += quantity
         else:
-            # Matches your DB: user_id, product_id, quantity
-            cursor.execute("INSERT INTO cart (user_id, product_id, quantity) VALUES (%s, %s, %s)", 
-                           (user_id, product_id, quantity))
-
-        conn.commit()
-
-        # 5. GET UPDATED CART COUNT (Fixed column name to user_id)
-        cursor.execute("SELECT SUM(quantity) as total_items FROM cart WHERE user_id = %s", (user_id,))
-        cart_stats = cursor.fetchone()
-        
-        new_count = int(cart_stats['total_items']) if cart_stats['total_items'] else 0
+            session['cart_count'] = _cart_count(cursor, user_id)
 
+        product = _product_row(product_id)
         return jsonify({
             'success': True, 
-            'message': f"Added {product['title']} to cart!",
-            'cart_count': new_count
+            'message': f"Added {product['title'] if product else 'item'} to cart!",
+            'cart_count': session['cart_count']
         })
 
     except Exception as e:
@@ -169,7 +188,18 @@ def add_to_cart():
     finally:
         cursor.close()
         conn.close()
-        
+
+
+def _cart_count(cursor, user_id):
+    cursor.execute("SELECT SUM(quantity) as total_items FROM cart WHERE user_id = %s", (user_id,))
+    cart_stats = cursor.fetchone()
+    return int(cart_stats['total_items']) if cart_stats['total_items'] else 0
+
+
+def _forget_cart_count():
+    """Drop the cached count after any change other than add_to_cart."""
+    session.pop('cart_count', None)
+
         
 @customer_bp.route('/cart')
 def view_cart():
@@ -240,6 +270,7 @@ def update_cart(cart_id):
         cursor.execute("UPDATE cart SET quantity = %s WHERE cart_id = %s AND user_id = %s", 
                        (new_qty, cart_id, user_id))
         conn.commit()
+        _forget_cart_count()
         
         return jsonify(success=True)
 
@@ -264,6 +295,7 @@ def remove_from_cart(cart_id):
         # Ensure user_id check is present so users can't delete other people's cart items
         cursor.execute("DELETE FROM cart WHERE cart_id = %s AND user_id = %s", (cart_id, user_id))
         conn.commit()
+        _forget_cart_count()
         return jsonify({'success': True})
     except Exception as e:
         print(f"Remove Error: {e}")
@@ -295,6 +327,7 @@ def bulk_remove_cart():
     try:
         cursor.execute(query, [user_id] + cart_ids)
         conn.commit()
+        _forget_cart_count()
         return jsonify({'success': True})
     except Exception as e:
         print(f"Error: {e}")
@@ -308,7 +341,7 @@ def bulk_remove_cart():
 
 
 
-@customer_bp.route('/checkout')
+@customer_bp.route('/checkout', methods=['GET', 'POST'])
 def checkout():
     if not is_customer():
         return redirect(url_for('auth.login'))
@@ -323,7 +356,7 @@ def checkout():
     
     # 2. Fetch cart items with product titles (the product "Name")
     query = """
-        SELECT c.quantity, p.title, p.price 
+        SELECT c.quantity, p.product_id, p.title, p.price 
         FROM cart c 
         JOIN products p ON c.product_id = p.product_id 
         WHERE c.user_id = %s
@@ -336,20 +369,54 @@ def checkout():
         conn.close()
         return redirect(url_for('customer.view_cart'))
 
+    # 3. "Proceed to Checkout" (a POST, so crawlers and prefetches can't
+    #    take stock off sale): hold the stock until the order is placed
+    #    (or the hold expires), then show the page
+    if request.method == 'POST':
+        quantities = {}
+        for item in cart_items:
+            quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+        try:
+            conn.start_transaction()
+            changed = hold_cart(cursor, user_id, quantities)
+            if changed is None:
+                conn.rollback()
+                flash("Some items in your cart are no longer available in that quantity. Please review your cart.", "danger")
+                return redirect(url_for('customer.view_cart'))
+            conn.commit()
+            holds_committed(changed)
+        except Exception as e:
+            conn.rollback()
+            print("STOCK HOLD ERROR:", e)
+            flash("Checkout is unavailable right now. Please try again.", "danger")
+            return redirect(url_for('customer.view_cart'))
+        finally:
+            cursor.close()
+            conn.close()
+        return redirect(url_for('customer.checkout'))
+
+    # How long the current holds (if any) have left
+    cursor.execute("""
+        SELECT CEIL(TIMESTAMPDIFF(SECOND, NOW(), MIN(expires_at)) / 60) AS minutes
+        FROM stock_holds
+        WHERE holder = %s AND expires_at > NOW()
+    """, (user_holder(user_id),))
+    hold_minutes = cursor.fetchone()['minutes']
+    cursor.close()
+    conn.close()
+
     # Calculations
     subtotal = sum(float(item['price']) * item['quantity'] for item in cart_items)
     shipping = 50.00
     total = subtotal + shipping
     
-    cursor.close()
-    conn.close()
-    
     return render_template('customer/checkout.html', 
                            items=cart_items, 
                            user=user_info, # Passing the customer name/info here
                            total=total, 
                            subtotal=subtotal, 
-                           shipping=shipping)
+                           shipping=shipping,
+                           hold_minutes=hold_minutes)
 
 
 
@@ -364,34 +431,67 @@ def place_order():
     address = request.form.get('address')
     payment_method = request.form.get('payment_method')
 
+    proof = None
     proof_filename = None
 
-    # Ensure upload folder exists
-    payment_dir = os.path.join('static', 'img', 'payments')
-    os.makedirs(payment_dir, exist_ok=True)
-
+    # Spool the proof (size-capped); it is only published once the order commits
     if payment_method == 'Online' and 'payment_proof' in request.files:
         file = request.files['payment_proof']
         if file.filename:
-            proof_filename = secure_filename(
-                f"pay_{user_id}_{int(datetime.now().timestamp())}_{file.filename}"
-            )
-            file.save(os.path.join(payment_dir, proof_filename))
+            try:
+                proof = spool_upload(file)
+            except UploadRejected as e:
+                flash(str(e), "danger")
+                return redirect(url_for('customer.checkout'))
 
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
 
     try:
-        # Get cart items
+        # Everything below commits or rolls back as one unit
+        conn.start_transaction()
+
+        # Get cart items. Only the buyer's own cart rows are locked (so a
+        # double submit can't order them twice); locking the product rows
+        # too would queue every checkout of a hot SKU behind one another.
         cursor.execute("""
-            SELECT c.quantity, p.product_id, p.price
-            FROM cart c
-            JOIN products p ON c.product_id = p.product_id
-            WHERE c.user_id = %s
+            SELECT product_id, quantity
+            FROM cart
+            WHERE user_id = %s
+            FOR UPDATE
         """, (user_id,))
         cart_items = cursor.fetchall()
 
         if not cart_items:
+            conn.rollback()
+            return redirect(url_for('customer.view_cart'))
+
+        # Prices are a plain read; the stock itself is taken below
+        product_ids = sorted({item['product_id'] for item in cart_items})
+        cursor.execute(f"""
+            SELECT product_id, price
+            FROM products
+            WHERE product_id IN ({id_placeholders(product_ids)})
+        """, product_ids)
+        prices = {row['product_id']: row['price'] for row in cursor.fetchall()}
+        for item in cart_items:
+            item['price'] = prices.get(item['product_id'])
+        cart_items = [item for item in cart_items if item['price'] is not None]
+
+        if not cart_items:
+            conn.rollback()
+            return redirect(url_for('customer.view_cart'))
+
+        # Turn the checkout holds into the sale; lines not held (or no
+        # longer held) are taken now, and it fails as a whole on oversell
+        quantities = {}
+        for item in cart_items:
+            quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+
+        changed = convert_holds(cursor, user_id, quantities)
+        if changed is None:
+            conn.rollback()
+            flash("Some items in your cart are no longer available in that quantity. Please review your cart.", "danger")
             return redirect(url_for('customer.view_cart'))
 
         subtotal = sum(float(i['price']) * i['quantity'] for i in cart_items)
@@ -405,29 +505,36 @@ def place_order():
 
         order_id = cursor.lastrowid
 
+        if proof:
+            proof_filename = proof.name_for(order_id)
+            cursor.execute("UPDATE orders SET payment_proof = %s WHERE order_id = %s",
+                           (proof_filename, order_id))
+
         # Payment record
         cursor.execute("""
             INSERT INTO payments (order_id, amount, method, proof, status, payment_date)
             VALUES (%s, %s, %s, %s, 'Completed', NOW())
         """, (order_id, total, payment_method, proof_filename or 'COD'))
 
-        # Order items + stock update
-        for item in cart_items:
-            cursor.execute("""
-                INSERT INTO order_items (order_id, product_id, quantity, price)
-                VALUES (%s, %s, %s, %s)
-            """, (order_id, item['product_id'], item['quantity'], item['price']))
+        # Order items (executemany sends a single multi-row INSERT)
+        cursor.executemany("""
+            INSERT INTO order_items (order_id, product_id, quantity, price)
+            VALUES (%s, %s, %s, %s)
+        """, [(order_id, item['product_id'], item['quantity'], item['price'])
+              for item in cart_items])
 
-            cursor.execute("""
-                UPDATE products
-                SET stock = stock - %s
-                WHERE product_id = %s
-            """, (item['quantity'], item['product_id']))
+        # Sales rollups for the dashboard, applied by a job
+        queue_rollup(cursor, [order_id], 'Pending')
+        log_activity(cursor, user_id, f"Placed order #{order_id}")
 
         # Clear cart
         cursor.execute("DELETE FROM cart WHERE user_id = %s", (user_id,))
 
         conn.commit()
+        if proof:
+            proof.commit()  # move + thumbnail in the background
+        holds_committed(changed)  # stock levels changed
+        _forget_cart_count()
 
         return redirect(url_for('customer.order_complete'))
 
@@ -438,6 +545,8 @@ def place_order():
         return redirect(url_for('customer.checkout'))
 
     finally:
+        if proof:
+            proof.discard()  # no-op once committed
         cursor.close()
         conn.close()
         
@@ -459,17 +568,18 @@ def my_orders():
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
 
-    # Fetch all orders for this user to categorize them in the template
-    cursor.execute("""
-        SELECT * FROM orders 
-        WHERE user_id = %s 
-        ORDER BY order_date DESC
-    """, (user_id,))
-    orders = cursor.fetchall()
+    # Fetch one page of this user's orders (newest first)
+    page = fetch_page(cursor, """
+        SELECT order_id, name, address, order_date, total_amount,
+               payment_method, payment_proof, status
+        FROM orders 
+        WHERE user_id = %s
+    """, [user_id], [('order_date', 'order_date'), ('order_id', 'order_id')])
+    orders = page.items
 
     cursor.close()
     conn.close()        
-    return render_template('customer/myorder.html', orders=orders)
+    return render_template('customer/myorder.html', orders=orders, page=page)
 
 @customer_bp.route('/cancel_order/<int:order_id>', methods=['POST'])
 def cancel_order(order_id):
@@ -479,49 +589,17 @@ def cancel_order(order_id):
     user_id = session.get('user_id')
     reason = request.form.get('cancel_reason') 
     
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
     try:
-        # 1. Verify ownership and status
-        cursor.execute("""
-            SELECT order_id FROM orders 
-            WHERE order_id = %s AND user_id = %s AND status = 'Pending'
-        """, (order_id, user_id))
-        order = cursor.fetchone()
-
-        if not order:
+        # Ownership and status are checked under the order's row lock
+        result = transition(get_db_connection(), 'cancel', [order_id], actor_id=user_id,
+                            reason=reason, owner_id=user_id)
+        if not result.moved:
             flash("Action denied. This order cannot be cancelled.", "danger")
-            return redirect(url_for('customer.my_orders'))
-
-        # 2. Restore Product Stock using order_items
-        cursor.execute("SELECT product_id, quantity FROM order_items WHERE order_id = %s", (order_id,))
-        items_to_return = cursor.fetchall()
-
-        for item in items_to_return:
-            cursor.execute("""
-                UPDATE products 
-                SET stock = stock + %s 
-                WHERE product_id = %s
-            """, (item['quantity'], item['product_id']))
-
-        # 3. Update Order Status and use the NEW cancel_reason column
-        cursor.execute("""
-            UPDATE orders 
-            SET status = 'Cancelled', cancel_reason = %s 
-            WHERE order_id = %s
-        """, (reason, order_id))
-        
-        conn.commit()
-        flash("Order #ORD-{} has been removed from your active list.".format(order_id), "success")
-            
+        else:
+            flash("Order #ORD-{} has been removed from your active list.".format(order_id), "success")
     except Exception as e:
-        conn.rollback()
         print(f"Error: {e}")
         flash("An error occurred during cancellation.", "danger")
-    finally:
-        cursor.close()
-        conn.close()
 
     return redirect(url_for('customer.my_orders'))
 
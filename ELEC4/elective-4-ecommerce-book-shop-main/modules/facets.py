@@ -0,0 +1,133 @@
+from collections import Counter
+
+from modules.index_loader import ReloadableIndex
+
+# =====================================
+# FACET COUNTS
+# =====================================
+# In-stock book counts per author and per category, kept in memory so the
+# shop filters and home's author chips never run GROUP BY per request.
+# The write routes update the counts as products are added, edited,
+# deleted, sold and restocked. Other worker processes write to the same
+# tables, so the counts are rebuilt from the database every
+# FACET_INDEX_MAX_AGE seconds as well, by the same loader as the search
+# index (modules/index_loader.py). A stock delta replayed on rows that
+# already include it is counted twice, which only matters if it crosses
+# zero, until the next refresh.
+
+
+def _bump(counter, key, sign):
+    counter[key] += sign
+    if counter[key] <= 0:
+        del counter[key]
+
+
+class FacetIndex(ReloadableIndex):
+    """Author/category counts over in-stock products."""
+
+    max_age_key = 'FACET_INDEX_MAX_AGE'
+    label = 'Facet index'
+
+    def _reset(self):
+        self._products = {}       # product_id -> (author, category_id, stock)
+        self._authors = Counter()
+        self._categories = Counter()
+        self._by_category = {}    # category_id -> Counter(author)
+
+    # --- maintenance -------------------------------------------------
+
+    def _count(self, entry, sign):
+        author, category_id, stock = entry
+        if stock <= 0:
+            return
+        _bump(self._categories, category_id, sign)
+        if author:
+            _bump(self._authors, author, sign)
+            _bump(self._by_category.setdefault(category_id, Counter()), author, sign)
+
+    @staticmethod
+    def _entry(row):
+        category_id = row.get('category_id')
+        return (row.get('author') or None, int(category_id) if category_id else None,
+                int(row.get('stock') or 0))
+
+    def set_product(self, product_id, row):
+        """Add or replace one product given its author, category_id and stock.
+
+        Form values are accepted as they come (strings, '' for none).
+        """
+        entry = self._entry(row)
+        with self._lock:
+            self._set(product_id, entry)
+            self._note('_set', product_id, entry)
+
+    def _set(self, product_id, entry):
+        old = self._products.get(product_id)
+        if old is not None:
+            self._count(old, -1)
+        self._products[product_id] = entry
+        self._count(entry, 1)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+            self._note('_remove', product_id)
+
+    def _remove(self, product_id):
+        old = self._products.pop(product_id, None)
+        if old is not None:
+            self._count(old, -1)
+
+    def adjust_stock(self, deltas):
+        """Apply {product_id: +/-qty} after an order takes or returns stock.
+
+        Only products that cross zero change any count.
+        """
+        with self._lock:
+            self._adjust(deltas)
+            self._note('_adjust', dict(deltas))
+
+    def _adjust(self, deltas):
+        for product_id, delta in deltas.items():
+            old = self._products.get(product_id)
+            if old is None:
+                continue
+            new = (old[0], old[1], old[2] + delta)
+            self._products[product_id] = new
+            if (old[2] > 0) != (new[2] > 0):
+                self._count(old, -1)
+                self._count(new, 1)
+
+    def _insert(self, row):
+        self._set(row['product_id'], self._entry(row))
+
+    # --- loading -----------------------------------------------------
+
+    def _fresh(self):
+        return FacetIndex(self.loader_sql)
+
+    def _adopt(self, fresh):
+        self._products, self._authors = fresh._products, fresh._authors
+        self._categories, self._by_category = fresh._categories, fresh._by_category
+
+    # --- querying ----------------------------------------------------
+
+    def authors(self, category_id=None, limit=None):
+        """[{'author', 'books'}], most books first, then by name."""
+        self.ensure_loaded()
+        with self._lock:
+            counts = self._authors if category_id is None else self._by_category.get(category_id, {})
+            ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        return [{'author': author, 'books': books} for author, books in ranked[:limit]]
+
+    def categories(self, author=None):
+        """{category_id: in-stock books}, optionally only those by `author`."""
+        self.ensure_loaded()
+        with self._lock:
+            if author is None:
+                return dict(self._categories)
+            return {category_id: authors[author]
+                    for category_id, authors in self._by_category.items() if author in authors}
+
+
+product_facets = FacetIndex("SELECT product_id, author, category_id, COALESCE(stock, 0) AS stock FROM products")
@@ -0,0 +1,110 @@
+import os
+import threading
+
+from flask import current_app, has_app_context
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+from modules.cache import MISSING, MemoryBackend
+
+# =====================================
+# TEMPLATE CACHING
+# =====================================
+# - Bytecode: compiled templates are written under the instance folder,
+#   so a fresh process (or a restarted worker) loads them instead of
+#   parsing and compiling every template again.
+# - Fragments: {% cache 'card', product.product_id, product.updated_at %}
+#   ... {% endcache %} keeps the rendered markup in a per-process LRU.
+#   The key is the template, the tag's line and the given values, plus the
+#   release token (so a deploy that changes templates starts clean). Put
+#   every value the block shows that can change without updated_at
+#   changing into the key. Nothing request-specific may go inside.
+#   A helper that renders something incomplete (image variants still
+#   being built) calls skip_fragment_cache() so that rendering isn't kept.
+# Fragments are not cached while templates auto-reload (debug).
+
+_backend = None
+_backend_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_rendering = threading.local()
+stats = {'hits': 0, 'misses': 0}
+
+
+def _config(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+
+def fragment_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = MemoryBackend(_config('FRAGMENT_CACHE_MAXSIZE', 10000))
+    return _backend
+
+
+def skip_fragment_cache():
+    """Don't cache the {% cache %} block being rendered (no-op outside one)."""
+    _rendering.skip = True
+
+
+def clear_fragments():
+    fragment_backend().clear()
+
+
+def fragment_stats():
+    lookups = stats['hits'] + stats['misses']
+    backend = fragment_backend()
+    return {
+        'entries': len(backend),
+        'maxsize': backend.maxsize,
+        'hits': stats['hits'],
+        'misses': stats['misses'],
+        'hit_ratio': round(stats['hits'] / lookups, 4) if lookups else 0.0,
+        'evictions': backend.evictions,
+    }
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache key_part, ... %}body{% endcache %}"""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        where = nodes.Const(f"{parser.name}:{lineno}")
+        return nodes.CallBlock(self.call_method('_cached', [where, nodes.List(parts)]),
+                               [], [], body).set_lineno(lineno)
+
+    def _cached(self, where, parts, caller):
+        backend = fragment_backend()
+        if self.environment.auto_reload or backend.maxsize <= 0:
+            return caller()
+        key = f"{_config('HTTP_CACHE_RELEASE', '')}:{where}:{parts!r}"
+        value = backend.get(key)
+        with _stats_lock:
+            stats['hits' if value is not MISSING else 'misses'] += 1
+        if value is not MISSING:
+            return value
+        outer, _rendering.skip = getattr(_rendering, 'skip', False), False
+        try:
+            value = caller()
+            if not _rendering.skip:
+                backend.set(key, value)
+        finally:
+            _rendering.skip = outer or _rendering.skip
+        return value
+
+
+def init_templates(app):
+    app.config.setdefault('TEMPLATE_BYTECODE_CACHE_DIR', os.path.join(app.instance_path, 'jinja-cache'))
+    app.config.setdefault('FRAGMENT_CACHE_MAXSIZE', 10000)
+    directory = app.config['TEMPLATE_BYTECODE_CACHE_DIR']
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+    app.jinja_env.add_extension(FragmentCacheExtension)
@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# =====================================
+# PASSWORD HASHING SERVICE
+# =====================================
+# scrypt/PBKDF2 are deliberately CPU-heavy. Running them on the request
+# thread lets a burst of logins stall every other request in the worker,
+# so hashing runs in a small process pool with a bounded queue in front.
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue stays full for longer than the timeout."""
+
+
+class PasswordHasher:
+
+    def __init__(self, method=DEFAULT_METHOD, workers=2, max_pending=32, timeout=10.0):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._canonical_method = None
+
+    def _pool(self):
+        # Executors don't survive fork; build one per worker process
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HashingBusy("Too many password hashes queued")
+        try:
+            return self._pool().submit(fn, *args).result(timeout=self.timeout)
+        except TimeoutError:
+            raise HashingBusy("Password hashing timed out")
+        finally:
+            self._slots.release()
+
+    @property
+    def canonical_method(self):
+        """Method string as werkzeug writes it, e.g. 'pbkdf2:sha256:1000000'."""
+        if self._canonical_method is None:
+            self._canonical_method = generate_password_hash('', self.method).split('$', 1)[0]
+        return self._canonical_method
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        """Return (matches, needs_rehash) for a stored hash."""
+        ok = self._run(check_password_hash, pwhash, password)
+        return ok, ok and self.needs_rehash(pwhash)
+
+    def needs_rehash(self, pwhash):
+        return pwhash.split('$', 1)[0] != self.canonical_method
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    """Process-wide hasher built from PASSWORD_HASH_* config."""
+    global _hasher
+    if _hasher is None:
+        config = current_app.config if has_app_context() else {}
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher(
+                    method=config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+                    workers=config.get('PASSWORD_HASH_WORKERS', 2),
+                    max_pending=config.get('PASSWORD_HASH_MAX_PENDING', 32),
+                    timeout=config.get('PASSWORD_HASH_TIMEOUT', 10.0),
+                )
+    return _hasher
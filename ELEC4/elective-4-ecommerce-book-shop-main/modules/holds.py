@@ -0,0 +1,337 @@
+import os
+import socket
+import threading
+import uuid
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+
+from database.connection import get_db_connection
+from modules.cache import invalidate_stock
+from modules.facets import product_facets
+from modules.jobs import periodic
+from modules.search import id_placeholders
+from modules.stock import take_stocks, return_stock
+
+# =====================================
+# STOCK HOLDS
+# =====================================
+# checkout() holds the cart's quantities for STOCK_HOLD_SECONDS and
+# place_order() turns the holds into the sale, so customers who got to
+# the checkout page don't race each other at "Place order". A held unit
+# has already left products.stock: the shop's "in stock" is what can
+# still be held. The reaper puts expired holds back.
+#
+# Hot products: taking every hold straight from products.stock would
+# queue all checkouts of a flash-sale book on that one row's lock. Each
+# web process instead takes STOCK_HOLD_BLOCK extra units at a time into
+# its allotment (a stock_holds row of its own, remembered in memory) and
+# serves holds from it, touching the product row once per block. Blocks
+# are only taken while the product has plenty left; near the end, holds
+# come straight from the product and the reaper hands allotments back,
+# so the last units are never stranded in an idle process. The reaper is
+# a periodic job, so one worker runs it, not every web process.
+#
+# The in-memory figures are hints: every move is a conditional UPDATE,
+# and a hint that turns out wrong is re-read from the table.
+
+_allotted = {}  # product_id -> units in this process's allotment (hint)
+_allotted_lock = threading.Lock()
+_holder = None
+
+
+def _config(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+
+def process_holder():
+    """This process's holder name for its allotments."""
+    global _holder
+    if _holder is None:
+        _holder = f"proc:{socket.gethostname()[:30]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    return _holder
+
+
+def user_holder(user_id):
+    return f"user:{user_id}"
+
+
+def _note(product_id, delta):
+    with _allotted_lock:
+        _allotted[product_id] = max(0, _allotted.get(product_id, 0) + delta)
+
+
+def _sync(cursor, product_id):
+    """Re-read this process's allotment of a product."""
+    cursor.execute("SELECT quantity FROM stock_holds WHERE holder = %s AND product_id = %s",
+                   (process_holder(), product_id))
+    row = cursor.fetchone()
+    quantity = row['quantity'] if row else 0
+    with _allotted_lock:
+        _allotted[product_id] = quantity
+    return quantity
+
+
+def _allot(cursor, quantities):
+    """Add {product_id: qty} to this process's allotments."""
+    cursor.executemany("""
+        INSERT INTO stock_holds (holder, product_id, quantity, expires_at)
+        VALUES (%s, %s, %s, NOW() + INTERVAL %s SECOND)
+        ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity), expires_at = VALUES(expires_at)
+    """, [(process_holder(), product_id, qty, _config('STOCK_ALLOTMENT_SECONDS', 60))
+          for product_id, qty in quantities.items()])
+    for product_id, qty in quantities.items():
+        _note(product_id, qty)
+
+
+def _from_allotment(cursor, product_id, qty):
+    """Take qty units of a product from this process's allotment (no lock on the product row)."""
+    have = _allotted.get(product_id)
+    if have is None:
+        have = _sync(cursor, product_id)
+    if have < qty:
+        return False
+    cursor.execute("""
+        UPDATE stock_holds
+        SET quantity = quantity - %s, expires_at = NOW() + INTERVAL %s SECOND
+        WHERE holder = %s AND product_id = %s AND quantity >= %s
+    """, (qty, _config('STOCK_ALLOTMENT_SECONDS', 60), process_holder(), product_id, qty))
+    if cursor.rowcount == 1:
+        _note(product_id, -qty)
+        return True
+    _sync(cursor, product_id)  # reaped, or the hint was stale
+    return False
+
+
+def _from_stock(cursor, quantities, changed):
+    """Take {product_id: qty} off the products' stock; False if some product hasn't enough."""
+    block = _config('STOCK_HOLD_BLOCK', 10)
+
+    # Each line plus a fresh block for the allotment, while every product
+    # keeps two blocks (below that the reaper takes allotments back). It
+    # is all or nothing, so one nearly sold-out line rolls back to the
+    # savepoint and the whole cart is taken exactly.
+    if block > 0:
+        cursor.execute("SAVEPOINT hold_blocks")
+        with_blocks = {product_id: qty + block for product_id, qty in quantities.items()}
+        if take_stocks(cursor, with_blocks, 2 * block):
+            _allot(cursor, {product_id: block for product_id in quantities})
+            quantities = with_blocks
+        else:
+            cursor.execute("ROLLBACK TO SAVEPOINT hold_blocks")
+            if not take_stocks(cursor, quantities):
+                return False
+    elif not take_stocks(cursor, quantities):
+        return False
+
+    for product_id, qty in quantities.items():
+        changed[product_id] = changed.get(product_id, 0) - qty
+    return True
+
+
+def _give_back(cursor, product_id, qty, changed):
+    """Return held units: into this process's allotment up to a block, the rest to stock."""
+    block = _config('STOCK_HOLD_BLOCK', 10)
+    have = _allotted.get(product_id)
+    if have is None:
+        have = _sync(cursor, product_id)
+    to_allotment = min(qty, max(0, block - have))
+    if to_allotment:
+        _allot(cursor, {product_id: to_allotment})
+    if qty > to_allotment:
+        return_stock(cursor, {product_id: qty - to_allotment})
+        changed[product_id] = changed.get(product_id, 0) + qty - to_allotment
+
+
+def _reconcile(cursor, user_id, quantities):
+    """Make the user's held units match `quantities`; returns the stock changes or None."""
+    cursor.execute("""
+        SELECT product_id, quantity FROM stock_holds
+        WHERE holder = %s
+        FOR UPDATE
+    """, (user_holder(user_id),))
+    held = {row['product_id']: row['quantity'] for row in cursor.fetchall()}
+
+    changed = {}
+    from_stock = {}
+    # Sorted, so two transactions lock rows in the same order
+    for product_id in sorted(set(held) | set(quantities)):
+        delta = quantities.get(product_id, 0) - held.get(product_id, 0)
+        if delta > 0 and not _from_allotment(cursor, product_id, delta):
+            from_stock[product_id] = delta
+        if delta < 0:
+            _give_back(cursor, product_id, -delta, changed)
+    # The rest in one statement (sharded products take one each)
+    if from_stock and not _from_stock(cursor, from_stock, changed):
+        return None
+    cursor.execute("DELETE FROM stock_holds WHERE holder = %s", (user_holder(user_id),))
+    return changed
+
+
+def hold_cart(cursor, user_id, quantities):
+    """Hold {product_id: qty} for the user, replacing their previous holds.
+
+    Runs in the caller's transaction, on a dictionary cursor. Returns the
+    changes made to products.stock ({product_id: delta}) for
+    holds_committed(), or None if some product hasn't enough stock left;
+    the caller must roll back then.
+    """
+    changed = _reconcile(cursor, user_id, quantities)
+    if changed is None:
+        return None
+    if quantities:
+        cursor.executemany("""
+            INSERT INTO stock_holds (holder, product_id, quantity, expires_at)
+            VALUES (%s, %s, %s, NOW() + INTERVAL %s SECOND)
+        """, [(user_holder(user_id), product_id, qty, _config('STOCK_HOLD_SECONDS', 600))
+              for product_id, qty in quantities.items()])
+    return changed
+
+
+def convert_holds(cursor, user_id, quantities):
+    """Turn the user's holds into an order's quantities, in the order's transaction.
+
+    Lines held at checkout are already out of stock; anything added,
+    removed or expired since is taken or returned here. Same return value
+    as hold_cart().
+    """
+    return _reconcile(cursor, user_id, quantities)
+
+
+def holds_committed(changed):
+    """After the commit: this process's cached copies of changed stock."""
+    if changed:
+        invalidate_stock(changed)
+        product_facets.adjust_stock(changed)
+
+
+# =====================================
+# REAPER
+# =====================================
+
+
+def _reap_candidates(cursor, batch):
+    """hold_ids worth reaping, from plain (non-locking) reads.
+
+    Expired holds come off the expires_at index; allotments of nearly
+    sold-out products are read through the holder index.
+    """
+    cursor.execute("""
+        SELECT hold_id FROM stock_holds
+        WHERE expires_at < NOW()
+        ORDER BY expires_at
+        LIMIT %s
+    """, (batch,))
+    expired = [row['hold_id'] for row in cursor.fetchall()]
+    cursor.execute("""
+        SELECT h.hold_id
+        FROM stock_holds h
+        JOIN products p ON p.product_id = h.product_id
+        WHERE h.holder LIKE %s AND p.stock < %s
+        LIMIT %s
+    """, ('proc:%', 2 * _config('STOCK_HOLD_BLOCK', 10), batch))
+    low = [row['hold_id'] for row in cursor.fetchall()]
+    return expired, low
+
+
+def reap_batch(cursor):
+    """Reap up to STOCK_HOLD_REAP_BATCH holds in the caller's transaction.
+
+    Returns (holds reaped, {product_id: qty} put back). Only the chosen
+    rows are locked, by primary key; rows used, renewed or replaced since
+    they were read are left alone.
+    """
+    expired, low = _reap_candidates(cursor, _config('STOCK_HOLD_REAP_BATCH', 1000))
+    hold_ids = sorted(set(expired) | set(low))
+    if not hold_ids:
+        return 0, {}
+
+    cursor.execute(f"""
+        SELECT hold_id, product_id, quantity, expires_at < NOW() AS expired
+        FROM stock_holds
+        WHERE hold_id IN ({id_placeholders(hold_ids)})
+        ORDER BY hold_id
+        FOR UPDATE
+    """, hold_ids)
+    low = set(low)
+    rows = [row for row in cursor.fetchall() if row['expired'] or row['hold_id'] in low]
+    if not rows:
+        return 0, {}
+
+    quantities = {}
+    for row in rows:
+        quantities[row['product_id']] = quantities.get(row['product_id'], 0) + row['quantity']
+    quantities = {product_id: qty for product_id, qty in quantities.items() if qty > 0}
+    return_stock(cursor, quantities)
+    reaped = [row['hold_id'] for row in rows]
+    cursor.execute(f"DELETE FROM stock_holds WHERE hold_id IN ({id_placeholders(reaped)})", reaped)
+    return len(reaped), quantities
+
+
+def _reaped(quantities):
+    """After the commit: cached stock, and this process's allotment hints."""
+    holds_committed(quantities)
+    with _allotted_lock:
+        # Our own allotments may be among them; re-read when next used
+        for product_id in quantities:
+            _allotted.pop(product_id, None)
+
+
+def reap_holds(conn):
+    """Put expired holds back into stock, batch by batch; returns how many were reaped.
+
+    Also hands back every process's allotment of a product that is nearly
+    sold out, so its last units can be held from any process.
+    """
+    total = 0
+    cursor = conn.cursor(dictionary=True)
+    try:
+        while True:
+            conn.start_transaction()
+            reaped, quantities = reap_batch(cursor)
+            conn.commit()
+            if not reaped:
+                return total
+            total += reaped
+            _reaped(quantities)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+@periodic('reap_holds', 'STOCK_HOLD_REAP_INTERVAL', 15)
+def reap_holds_job(cursor, payload, job_id):
+    """One batch every STOCK_HOLD_REAP_INTERVAL, in whichever worker claims it."""
+    reaped, quantities = reap_batch(cursor)
+    return (lambda: _reaped(quantities)) if reaped else None
+
+
+def _reset_after_fork():
+    # The child is a new holder: the parent's allotments aren't its own
+    global _holder, _allotted, _allotted_lock
+    _holder = None
+    _allotted = {}
+    _allotted_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@click.command('reap-holds')
+@with_appcontext
+def reap_holds_command():
+    """Put expired stock holds back (run from cron if no job worker runs)."""
+    conn = get_db_connection()
+    click.echo(f"reaped {reap_holds(conn)} hold(s)")
+
+
+def init_holds(app):
+    app.config.setdefault('STOCK_HOLD_SECONDS', 600)
+    app.config.setdefault('STOCK_HOLD_BLOCK', 10)
+    app.config.setdefault('STOCK_ALLOTMENT_SECONDS', 60)
+    app.config.setdefault('STOCK_HOLD_REAP_INTERVAL', 15)
+    app.config.setdefault('STOCK_HOLD_REAP_BATCH', 1000)
+    app.cli.add_command(reap_holds_command)
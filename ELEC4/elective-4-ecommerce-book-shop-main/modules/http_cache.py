@@ -0,0 +1,151 @@
+import hashlib
+import os
+import re
+import threading
+
+from flask import current_app, has_app_context, make_response, request
+
+# =====================================
+# HTTP CACHING POLICY
+# =====================================
+# Every response is no-store unless something opts it in, so pages behind
+# a login (and anything added later) are never kept by a browser or proxy.
+# Opted in:
+# - static files: url_for('static') appends ?v=<content hash>, and a
+#   request carrying the current hash is cached for a year as immutable.
+#   Content-addressed uploads (images.save_upload) are immutable by name.
+# - public catalog pages call conditional(), which sets a weak ETag and
+#   Last-Modified (from products.updated_at) and answers 304 before
+#   rendering when the client's copy is still current.
+# - payment proofs under static/img/payments are never cached.
+
+NO_STORE = "no-store, no-cache, must-revalidate, max-age=0"
+PRIVATE_STATIC = ('img/payments/',)
+_CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{16}(-\d+)?\.\w+$')  # images.HASH_LENGTH names
+
+_versions = {}  # filename -> (mtime_ns, size, digest)
+_versions_lock = threading.Lock()
+
+
+def _config(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+
+def static_version(filename):
+    """Short content hash of a static file, recomputed only when it changes."""
+    path = os.path.join(current_app.static_folder, filename)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    with _versions_lock:
+        cached = _versions.get(filename)
+    if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    version = digest.hexdigest()[:10]
+    with _versions_lock:
+        _versions[filename] = (stat.st_mtime_ns, stat.st_size, version)
+    return version
+
+
+def _is_private(filename):
+    return filename.startswith(PRIVATE_STATIC)
+
+
+def _is_content_addressed(filename):
+    return bool(_CONTENT_ADDRESSED.match(filename.rsplit('/', 1)[-1]))
+
+
+def fingerprint_static(endpoint, values):
+    """url_defaults: /static/x.css -> /static/x.css?v=<hash>."""
+    if endpoint != 'static' or 'v' in values:
+        return
+    filename = values.get('filename')
+    if not filename or _is_private(filename) or _is_content_addressed(filename):
+        return
+    version = static_version(filename)
+    if version:
+        values['v'] = version
+
+
+def release_token(app):
+    """Changes whenever a template changes, so page ETags change with a deploy."""
+    digest = hashlib.sha256()
+    for root, _, files in sorted(os.walk(os.path.join(app.root_path, app.template_folder))):
+        for name in sorted(files):
+            stat = os.stat(os.path.join(root, name))
+            digest.update(f"{name}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+    return digest.hexdigest()[:8]
+
+
+def row_etag(*rows):
+    """ETag token for the rows a page is rendered from (any change, new tag)."""
+    return hashlib.sha1(repr(rows).encode()).hexdigest()[:16]
+
+
+def not_modified(etag, last_modified=None):
+    """True when the request's validators match (If-None-Match wins)."""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def conditional(etag, render, last_modified=None, max_age=None):
+    """Publicly cacheable response validated by ETag/Last-Modified.
+
+    `etag` must change whenever the rendered output would; `render` is only
+    called when the client doesn't already have that version.
+    """
+    etag = f"{current_app.config['HTTP_CACHE_RELEASE']}-{etag}"
+    if request.method in ('GET', 'HEAD') and not_modified(etag, last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age if max_age is not None else _config('CATALOG_MAX_AGE', 60)
+    return response
+
+
+def apply_cache_policy(response):
+    """after_request: static files by fingerprint, everything else no-store."""
+    if request.endpoint == 'static' and response.status_code < 400:
+        filename = (request.view_args or {}).get('filename', '')
+        cc = response.cache_control
+        if _is_private(filename):
+            response.headers['Cache-Control'] = "private, no-store"
+        elif _is_content_addressed(filename) or (
+                request.args.get('v') and request.args.get('v') == static_version(filename)):
+            cc.no_cache = None
+            cc.public = True
+            cc.max_age = _config('STATIC_IMMUTABLE_MAX_AGE', 365 * 24 * 3600)
+            cc.immutable = True
+        else:
+            # Unversioned or stale ?v= link: short-lived, then revalidated by ETag
+            cc.no_cache = None
+            cc.public = True
+            cc.max_age = _config('STATIC_MAX_AGE', 300)
+        return response
+
+    if 'Cache-Control' not in response.headers:
+        response.headers['Cache-Control'] = NO_STORE
+        response.headers['Pragma'] = "no-cache"
+        response.headers['Expires'] = "0"
+    return response
+
+
+def init_http_cache(app):
+    app.config.setdefault('STATIC_IMMUTABLE_MAX_AGE', 365 * 24 * 3600)
+    app.config.setdefault('STATIC_MAX_AGE', 300)
+    app.config.setdefault('CATALOG_MAX_AGE', 60)
+    app.config.setdefault('HTTP_CACHE_RELEASE', release_token(app))
+    app.url_defaults(fingerprint_static)
+    app.after_request(apply_cache_policy)
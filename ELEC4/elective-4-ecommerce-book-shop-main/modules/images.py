@@ -0,0 +1,271 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app, has_app_context, url_for
+from flask.cli import with_appcontext
+
+from modules.fragments import skip_fragment_cache
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional: without it originals are served as-is
+    Image = None
+
+# =====================================
+# PRODUCT IMAGE PIPELINE
+# =====================================
+# Uploads are stored under the sha256 of their content, so re-uploading the
+# same cover is a no-op and a changed cover always gets a new URL. Resized
+# JPEG/PNG and WebP variants are written by a small background pool into
+# static/img/variants/ and picked up by the templates through srcset.
+
+DEFAULT_WIDTHS = (160, 320, 640)
+VARIANT_DIR = 'variants'
+HASH_LENGTH = 16
+CHUNK_SIZE = 64 * 1024
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+_variant_cache = {}  # image basename -> (variants dict for the templates, recheck time or None)
+_variant_lock = threading.Lock()
+
+
+def _config(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+
+def _folder():
+    return _config('UPLOAD_FOLDER', 'static/img')
+
+
+def _widths():
+    return tuple(_config('IMAGE_WIDTHS', DEFAULT_WIDTHS))
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_config('IMAGE_WORKERS', 2), thread_name_prefix='images')
+        return _executor
+
+
+def shutdown(wait=True):
+    """Let queued work (variants, published proofs) finish before exiting."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def _reset_after_fork():
+    # Pool threads don't survive fork; each worker starts its own on first use
+    global _executor, _executor_lock, _variant_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+    _variant_lock = threading.Lock()
+    _pending.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def basename(image):
+    """Strip whatever path the DB has for an image (/static/img/x, C:\\x, x)."""
+    return image.split('\\')[-1].split('/')[-1] if image else None
+
+
+def variant_name(name, width, ext=None):
+    stem, original_ext = os.path.splitext(name)
+    return f"{stem}-{width}{ext or original_ext.lower()}"
+
+
+# =====================================
+# UPLOADS
+# =====================================
+
+
+def save_upload(file_storage, ext):
+    """Store an upload under its content hash and queue its variants.
+
+    Returns the path saved in products.image (e.g. /static/img/ab12...jpg).
+    """
+    folder = _folder()
+    os.makedirs(folder, exist_ok=True)
+
+    digest = hashlib.sha256()
+    tmp_path = os.path.join(folder, f".upload-{os.getpid()}-{threading.get_ident()}")
+    with open(tmp_path, 'wb') as out:
+        for chunk in iter(lambda: file_storage.stream.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            out.write(chunk)
+
+    name = f"{digest.hexdigest()[:HASH_LENGTH]}.{ext.lower()}"
+    path = os.path.join(folder, name)
+    if os.path.exists(path):
+        os.remove(tmp_path)  # same bytes already stored
+    else:
+        os.replace(tmp_path, path)
+
+    schedule_variants(name)
+    return '/' + path.replace(os.sep, '/')
+
+
+def schedule_variants(name, folder=None, widths=None):
+    """Generate the resized/WebP copies of one stored image in the background."""
+    if Image is None:
+        return None
+    folder, widths = folder or _folder(), widths or _widths()
+    with _variant_lock:
+        if name in _pending:
+            return None
+        _pending.add(name)
+    return _pool().submit(_build_variants, folder, name, widths)
+
+
+def submit(fn, *args):
+    """Run other upload post-processing on the same background pool."""
+    return _pool().submit(fn, *args)
+
+
+def _build_variants(folder, name, widths):
+    try:
+        generate_variants(folder, name, widths)
+    except Exception as e:
+        print(f"Image variants failed for {name}: {e}")
+    finally:
+        with _variant_lock:
+            _pending.discard(name)
+            _variant_cache.pop(name, None)
+
+
+def generate_variants(folder, name, widths=DEFAULT_WIDTHS):
+    """Write <stem>-<w>.<ext> and <stem>-<w>.webp for every width <= the original."""
+    out_dir = os.path.join(folder, VARIANT_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+
+    with Image.open(os.path.join(folder, name)) as img:
+        img = ImageOps.exif_transpose(img)
+        ext = os.path.splitext(name)[1].lower()
+        for width in widths:
+            if width > img.width and width != min(widths):
+                continue  # never upscale, but always keep the smallest thumb
+            targets = [(variant_name(name, width), ext), (variant_name(name, width, '.webp'), '.webp')]
+            if all(os.path.exists(os.path.join(out_dir, t)) for t, _ in targets):
+                continue
+
+            height = round(img.height * width / img.width)
+            resized = img.resize((width, height), Image.LANCZOS) if width < img.width else img.copy()
+            for target, fmt in targets:
+                out = resized
+                if fmt in ('.jpg', '.jpeg') and out.mode not in ('RGB', 'L'):
+                    out = out.convert('RGB')
+                tmp = os.path.join(out_dir, f".{target}.tmp")
+                if fmt == '.webp':
+                    out.save(tmp, 'WEBP', quality=80, method=4)
+                elif fmt in ('.jpg', '.jpeg'):
+                    out.save(tmp, 'JPEG', quality=82, optimize=True, progressive=True)
+                else:
+                    out.save(tmp, Image.registered_extensions().get(fmt, 'PNG'), optimize=True)
+                os.replace(tmp, os.path.join(out_dir, target))
+
+
+# =====================================
+# TEMPLATE HELPER
+# =====================================
+
+
+def _expected_widths(folder, name, widths):
+    """The widths generate_variants() writes for an image (none if it can't)."""
+    if Image is None:
+        return ()
+    try:
+        with Image.open(os.path.join(folder, name)) as img:  # reads the header only
+            width, height = img.size
+            if img.getexif().get(0x0112) in (5, 6, 7, 8):  # exif_transpose turns it 90 degrees
+                width = height
+    except Exception:
+        return ()
+    return [w for w in widths if w <= width or w == min(widths)]
+
+
+def image_variants(image):
+    """src/srcset/webp_srcset for a product image, using only variants on disk.
+
+    Kept once every variant exists. A set still being built (here or in
+    another process) is re-checked after IMAGE_VARIANT_RECHECK seconds
+    and keeps the {% cache %} block it's rendered in out of the cache.
+    """
+    name = basename(image) or 'default-book.png'
+    with _variant_lock:
+        cached = _variant_cache.get(name)
+    if cached is not None:
+        variants, recheck_at = cached
+        if recheck_at is None:
+            return variants
+        if time.monotonic() < recheck_at:
+            skip_fragment_cache()
+            return variants
+
+    folder, widths = _folder(), _widths()
+    src = url_for('static', filename='img/' + name)
+    srcset, webp_srcset, built = [], [], set()
+    for width in widths:
+        found = 0
+        for ext, entries in ((None, srcset), ('.webp', webp_srcset)):
+            variant = variant_name(name, width, ext)
+            if os.path.exists(os.path.join(folder, VARIANT_DIR, variant)):
+                url = url_for('static', filename=f"img/{VARIANT_DIR}/{variant}")
+                entries.append(f"{url} {width}w")
+                found += 1
+        if found == 2:
+            built.add(width)
+
+    variants = {'src': src, 'srcset': ', '.join(srcset), 'webp_srcset': ', '.join(webp_srcset)}
+    complete = all(width in built for width in _expected_widths(folder, name, widths))
+    recheck_at = None if complete else time.monotonic() + _config('IMAGE_VARIANT_RECHECK', 30)
+    with _variant_lock:
+        _variant_cache[name] = (variants, recheck_at)
+    if not complete:
+        skip_fragment_cache()
+    return variants
+
+
+# =====================================
+# CLI: build variants for existing images
+# =====================================
+
+
+@click.command('images-rebuild')
+@with_appcontext
+def images_rebuild_command():
+    """Generate missing variants for every image in UPLOAD_FOLDER."""
+    if Image is None:
+        raise click.ClickException("Pillow is not installed (pip install Pillow)")
+    folder, widths = _folder(), _widths()
+    allowed = current_app.config['ALLOWED_EXTENSIONS']
+    names = [n for n in sorted(os.listdir(folder))
+             if os.path.isfile(os.path.join(folder, n)) and n.rsplit('.', 1)[-1].lower() in allowed]
+    for name in names:
+        try:
+            generate_variants(folder, name, widths)
+            click.echo(f"ok    {name}")
+        except Exception as e:
+            click.echo(f"fail  {name}: {e}")
+    with _variant_lock:
+        _variant_cache.clear()
+
+
+def init_images(app):
+    app.config.setdefault('IMAGE_WIDTHS', DEFAULT_WIDTHS)
+    app.config.setdefault('IMAGE_WORKERS', 2)
+    app.config.setdefault('IMAGE_VARIANT_RECHECK', 30)
+    app.jinja_env.globals['image_variants'] = image_variants
+    app.cli.add_command(images_rebuild_command)
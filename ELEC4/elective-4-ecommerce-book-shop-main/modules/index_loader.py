@@ -0,0 +1,127 @@
+import threading
+import time
+
+from flask import current_app, has_app_context
+from database.connection import get_db_connection
+
+# =====================================
+# RELOADABLE INDEXES
+# =====================================
+# Shared by the search index and the facet counts: an in-memory structure
+# built from one query, kept in sync by the write routes, and rebuilt
+# from the database once it is older than its max-age setting (other
+# worker processes write to the same tables).
+#
+# A rebuild reads the table without holding the lock, so every write
+# made meanwhile is journaled and replayed on the rebuilt copy. Loads can
+# overlap (a background refresh and a synchronous reload after
+# mark_stale(), e.g. from a catalog import): each keeps its own journal,
+# and a load that finds another one completed after it started throws
+# its copy away instead of swapping it over the newer one.
+
+
+class ReloadableIndex:
+    """Base for the in-memory indexes built from `loader_sql`.
+
+    Subclasses provide _reset() (empty state), _insert(row) (one loader
+    row), _fresh() (an empty index configured like this one) and
+    _adopt(fresh) (take over a built copy's state). Their write methods
+    call _note(method, *args) with the internal method to replay.
+    """
+
+    max_age_key = None      # config key of the refresh interval, in seconds
+    label = 'Index'         # for error messages
+
+    def __init__(self, loader_sql=None):
+        self.loader_sql = loader_sql
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._refreshing = False
+        self._generation = 0    # bumped by every build and completed load
+        self._journals = []     # one [(method, args)] per running load
+        self._reset()
+
+    def _note(self, method, *args):
+        for journal in self._journals:
+            journal.append((method, args))
+
+    def build(self, rows):
+        """Replace the whole index from an iterable of row dicts."""
+        with self._lock:
+            self._reset()
+            for row in rows:
+                self._insert(row)
+            self._generation += 1
+            self._loaded_at = time.monotonic()
+
+    # --- loading -----------------------------------------------------
+
+    def _load_from_db(self):
+        journal = []
+        with self._lock:
+            started = self._generation
+            self._journals.append(journal)
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute(self.loader_sql)
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+                conn.close()
+            fresh = self._fresh()
+            fresh.build(rows)
+
+            with self._lock:
+                if self._generation != started:
+                    return  # another load finished meanwhile; keep its result
+                self._adopt(fresh)
+                # Writes made while the rows were read may be missing from them
+                for method, args in journal:
+                    getattr(self, method)(*args)
+                self._generation += 1
+                self._loaded_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._journals = [j for j in self._journals if j is not journal]
+
+    def _background_refresh(self, app):
+        try:
+            with app.app_context():
+                self._load_from_db()
+        except Exception as e:
+            print(f"{self.label} refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def mark_stale(self):
+        """Reload from the database on next use (after a bulk change)."""
+        self._loaded_at = None
+
+    def ensure_loaded(self):
+        """Load on first use; refresh in the background once stale."""
+        if self.loader_sql is None:
+            return
+        loaded_at = self._loaded_at
+        if loaded_at is None:
+            with self._lock:
+                if self._loaded_at is None:
+                    self._load_from_db()
+            return
+
+        if not has_app_context():
+            return
+        max_age = current_app.config.get(self.max_age_key, 300)
+        if time.monotonic() - loaded_at <= max_age:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(
+            target=self._background_refresh,
+            args=(current_app._get_current_object(),),
+            daemon=True,
+        ).start()
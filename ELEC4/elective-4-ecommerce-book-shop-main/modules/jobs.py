@@ -0,0 +1,374 @@
+import json
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+
+from database.connection import get_db_connection
+
+# =====================================
+# BACKGROUND JOBS
+# =====================================
+# Side effects that don't have to happen inside the request (activity log,
+# sales rollups and report compaction) are queued in the jobs
+# table by enqueue(), in the same transaction as the change that caused
+# them, so a job exists if and only if that change committed.
+#
+# A worker claims due jobs with one UPDATE that stamps its lease token,
+# runs each handler and marks the job done in the handler's transaction:
+# a crash before the commit undoes both, and the job simply runs again.
+# Failures are retried with exponential backoff up to max_attempts.
+#
+# Workers: `flask jobs-worker` as its own process, and/or a thread in each
+# web process (JOBS_IN_PROCESS_WORKER) so a plain `python app.py` works.
+# Any number of them can run; a job is only ever claimed by one.
+#
+# Periodic jobs (@periodic) are ordinary jobs that queue their own next
+# run, so housekeeping like the stock hold reaper runs in one worker at a
+# time instead of in every web process.
+
+HANDLERS = {}  # kind -> function(cursor, payload, job_id)
+PERIODIC = {}  # kind -> (config key of its interval in seconds, default)
+
+_wake = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+_last_maintenance = 0.0
+
+
+def _config(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+
+def job(kind):
+    """Register a handler: fn(cursor, payload, job_id).
+
+    The handler runs inside the worker's transaction (a dictionary
+    cursor) and may return a callable to run after the commit, e.g. to
+    drop this process's cached copies of what it changed.
+    """
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def periodic(kind, interval_key, default):
+    """Register a handler that runs every app.config[interval_key] seconds.
+
+    One run is queued at a time (dedupe key 'every:<kind>') and each run
+    queues the next in its own transaction. An interval of 0 stops it.
+    """
+    def register(fn):
+        HANDLERS[kind] = fn
+        PERIODIC[kind] = (interval_key, default)
+        return fn
+    return register
+
+
+def enqueue(cursor, kind, payload=None, dedupe_key=None, delay=0, max_attempts=None):
+    """Queue a job in the caller's transaction.
+
+    With a dedupe_key, a job already queued (or running) under that key
+    absorbs this one.
+    """
+    cursor.execute("""
+        INSERT INTO jobs (kind, payload, dedupe_key, run_at, max_attempts)
+        VALUES (%s, %s, %s, NOW() + INTERVAL %s SECOND, %s)
+        ON DUPLICATE KEY UPDATE job_id = job_id
+    """, (kind, json.dumps(payload or {}, default=str), dedupe_key, int(delay),
+          max_attempts or _config('JOBS_MAX_ATTEMPTS', 5)))
+    _wake.set()
+
+
+def _queue_next_run(cursor, kind):
+    interval = _config(*PERIODIC[kind])
+    if interval > 0:
+        enqueue(cursor, kind, dedupe_key=f"every:{kind}", delay=interval)
+
+
+# =====================================
+# WORKER
+# =====================================
+
+
+def _lease_token():
+    return f"{socket.gethostname()[:30]}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+
+
+def claim(conn, limit):
+    """Claim up to `limit` due jobs; returns their rows."""
+    token = _lease_token()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        # One statement, so two workers can never claim the same row
+        cursor.execute("""
+            UPDATE jobs
+            SET status = 'running', locked_by = %s, attempts = attempts + 1,
+                locked_until = NOW() + INTERVAL %s SECOND
+            WHERE status = 'queued' AND run_at <= NOW()
+            ORDER BY run_at, job_id
+            LIMIT %s
+        """, (token, _config('JOBS_LEASE_SECONDS', 300), limit))
+        cursor.execute("""
+            SELECT job_id, kind, payload, attempts, max_attempts, locked_by
+            FROM jobs WHERE locked_by = %s AND status = 'running'
+            ORDER BY run_at, job_id
+        """, (token,))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def _retry_delay(attempts):
+    base = _config('JOBS_RETRY_BASE_SECONDS', 5)
+    return min(base * 2 ** (attempts - 1), _config('JOBS_RETRY_MAX_SECONDS', 3600))
+
+
+def run_job(conn, row):
+    """Run one claimed job; returns True if it completed."""
+    cursor = conn.cursor(dictionary=True)
+    after_commit = None
+    try:
+        handler = HANDLERS.get(row['kind'])
+        if handler is None:
+            raise LookupError(f"no handler for job kind '{row['kind']}'")
+        conn.start_transaction()
+        after_commit = handler(cursor, json.loads(row['payload']), row['job_id'])
+        cursor.execute("""
+            UPDATE jobs
+            SET status = 'done', finished_at = NOW(), dedupe_key = NULL,
+                locked_by = NULL, locked_until = NULL, last_error = NULL
+            WHERE job_id = %s AND locked_by = %s
+        """, (row['job_id'], row['locked_by']))
+        if cursor.rowcount != 1:
+            # Our lease expired and someone else has the job now
+            conn.rollback()
+            return False
+        if row['kind'] in PERIODIC:
+            _queue_next_run(cursor, row['kind'])
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"JOB {row['kind']} #{row['job_id']} FAILED (attempt {row['attempts']}):", e)
+        give_up = isinstance(e, LookupError) or row['attempts'] >= row['max_attempts']
+        cursor.execute("""
+            UPDATE jobs
+            SET status = %s, run_at = NOW() + INTERVAL %s SECOND, last_error = %s,
+                dedupe_key = IF(%s, NULL, dedupe_key), locked_by = NULL, locked_until = NULL
+            WHERE job_id = %s AND locked_by = %s
+        """, ('failed' if give_up else 'queued', 0 if give_up else _retry_delay(row['attempts']),
+              traceback.format_exc()[-4000:], give_up, row['job_id'], row['locked_by']))
+        conn.commit()
+        return False
+    finally:
+        cursor.close()
+
+    if after_commit is not None:
+        try:
+            after_commit()
+        except Exception as e:
+            print(f"JOB {row['kind']} #{row['job_id']} after-commit hook failed:", e)
+    return True
+
+
+def maintenance(conn):
+    """Requeue jobs whose worker died mid-lease; drop old finished jobs.
+
+    Also queues any periodic job that has no run pending (first start,
+    or its last run failed for good).
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            UPDATE jobs SET status = 'queued', locked_by = NULL, locked_until = NULL
+            WHERE status = 'running' AND locked_until < NOW()
+        """)
+        requeued = cursor.rowcount
+        cursor.execute("""
+            DELETE FROM jobs
+            WHERE status = 'done' AND finished_at < NOW() - INTERVAL %s DAY
+            LIMIT 5000
+        """, (_config('JOBS_KEEP_DONE_DAYS', 7),))
+        for kind in PERIODIC:
+            _queue_next_run(cursor, kind)
+        conn.commit()
+        return requeued
+    finally:
+        cursor.close()
+
+
+def work_batch(conn):
+    """Claim and run one batch of due jobs; returns how many were claimed."""
+    global _last_maintenance
+    if time.monotonic() - _last_maintenance > _config('JOBS_MAINTENANCE_INTERVAL', 60):
+        _last_maintenance = time.monotonic()
+        maintenance(conn)
+    rows = claim(conn, _config('JOBS_BATCH_SIZE', 20))
+    for row in rows:
+        run_job(conn, row)
+    return len(rows)
+
+
+def run_worker(app, stop, once=False):
+    """Poll for jobs until `stop` is set (or, with once, the queue is empty)."""
+    while not stop.is_set():
+        claimed = 0
+        try:
+            with app.app_context():
+                claimed = work_batch(get_db_connection())
+        except Exception as e:
+            print("JOB WORKER ERROR:", e)
+        if claimed:
+            continue
+        if once:
+            return
+        _wake.wait(app.config.get('JOBS_POLL_INTERVAL', 1.0))
+        _wake.clear()
+
+
+def ensure_worker():
+    """before_request: start this process's worker thread on first use.
+
+    Started lazily (not at import) so a pre-forking server doesn't start
+    it in the master, where it would not survive the fork.
+    """
+    global _worker
+    if _worker is not None or not current_app.config.get('JOBS_IN_PROCESS_WORKER', True):
+        return
+    with _worker_lock:
+        if _worker is not None:
+            return
+        _worker = threading.Thread(
+            target=run_worker,
+            args=(current_app._get_current_object(), threading.Event()),
+            daemon=True,
+        )
+        _worker.start()
+
+
+def _reset_after_fork():
+    # The parent's worker thread doesn't exist in the child
+    global _worker, _worker_lock, _wake
+    _worker = None
+    _worker_lock = threading.Lock()
+    _wake = threading.Event()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def queue_stats(cursor):
+    """Job counts by kind and status, plus the oldest due job's wait in seconds."""
+    cursor.execute("""
+        SELECT kind, status, COUNT(*) AS jobs,
+               MAX(CASE WHEN status = 'queued' AND run_at <= NOW()
+                        THEN TIMESTAMPDIFF(SECOND, run_at, NOW()) END) AS oldest_wait
+        FROM jobs
+        GROUP BY kind, status
+        ORDER BY kind, status
+    """)
+    return cursor.fetchall()
+
+
+# =====================================
+# HANDLERS: ACTIVITY LOG
+# =====================================
+
+
+def log_activity(cursor, user_id, action):
+    """Queue an activity_logs row, stamped with the time of the action."""
+    enqueue(cursor, 'activity_log', {
+        'user_id': user_id,
+        'action': action[:255],
+        'at': datetime.now().isoformat(sep=' ', timespec='seconds'),
+    })
+
+
+@job('activity_log')
+def write_activity_log(cursor, payload, job_id):
+    # job_id is unique in activity_logs, so a re-run can't log twice
+    cursor.execute("""
+        INSERT IGNORE INTO activity_logs (admin_id, action, created_at, job_id)
+        VALUES (%s, %s, %s, %s)
+    """, (payload.get('user_id'), payload['action'], payload['at'], job_id))
+
+
+# =====================================
+# CLI
+# =====================================
+
+
+@click.command('jobs-worker')
+@click.option('--once', is_flag=True, help='Exit once no job is due.')
+@with_appcontext
+def jobs_worker_command(once):
+    """Run queued jobs until interrupted (SIGTERM/SIGINT finish the current batch)."""
+    app = current_app._get_current_object()
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        stop.set()
+        _wake.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    click.echo(f"job worker {os.getpid()} started ({', '.join(sorted(HANDLERS))})")
+    run_worker(app, stop, once=once)
+
+
+@click.command('jobs-status')
+@with_appcontext
+def jobs_status_command():
+    """Show queued/running/done/failed job counts."""
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        for row in queue_stats(cursor):
+            wait = f", oldest due {row['oldest_wait']}s ago" if row['oldest_wait'] is not None else ''
+            click.echo(f"{row['kind']:16} {row['status']:8} {row['jobs']}{wait}")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+@click.command('jobs-retry')
+@with_appcontext
+def jobs_retry_command():
+    """Requeue every failed job with a fresh set of attempts."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            UPDATE jobs SET status = 'queued', attempts = 0, run_at = NOW()
+            WHERE status = 'failed'
+        """)
+        conn.commit()
+        click.echo(f"requeued {cursor.rowcount} job(s)")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def init_jobs(app):
+    app.config.setdefault('JOBS_IN_PROCESS_WORKER', True)
+    app.config.setdefault('JOBS_POLL_INTERVAL', 1.0)
+    app.config.setdefault('JOBS_BATCH_SIZE', 20)
+    app.config.setdefault('JOBS_LEASE_SECONDS', 300)
+    app.config.setdefault('JOBS_MAX_ATTEMPTS', 5)
+    app.config.setdefault('JOBS_RETRY_BASE_SECONDS', 5)
+    app.config.setdefault('JOBS_RETRY_MAX_SECONDS', 3600)
+    app.config.setdefault('JOBS_KEEP_DONE_DAYS', 7)
+    app.config.setdefault('JOBS_MAINTENANCE_INTERVAL', 60)
+    app.before_request(ensure_worker)
+    app.cli.add_command(jobs_worker_command)
+    app.cli.add_command(jobs_status_command)
+    app.cli.add_command(jobs_retry_command)
@@ -0,0 +1,117 @@
+from modules.jobs import log_activity
+from modules.sales import NOT_SALES, queue_rollup
+from modules.search import id_placeholders
+from modules.stock import restore_stock, stock_restored
+
+# =====================================
+# ORDER STATE MACHINE
+# =====================================
+# Every status change (customer cancel, admin ship/deliver/decline, one
+# order or hundreds) goes through transition(): in one transaction it
+# locks the orders, moves the ones whose status allows it, queues the
+# sales rollup change and, for cancel/decline, puts all their stock back
+# with one set-based statement. An order is Cancelled/Declined if and
+# only if its stock is back.
+#
+#   Pending --ship--> Shipped --deliver--> Delivered
+#    |  |                |
+#    |  +--decline--> Declined <--decline--+
+#    +--cancel--> Cancelled (customer)
+
+TRANSITIONS = {
+    # action: (new status, statuses it can leave from)
+    'ship': ('Shipped', ('Pending',)),
+    'deliver': ('Delivered', ('Shipped',)),
+    'decline': ('Declined', ('Pending', 'Shipped')),
+    'cancel': ('Cancelled', ('Pending',)),
+}
+
+# What the admin can move an order to from each status
+ADMIN_ACTIONS = ('ship', 'deliver', 'decline')
+NEXT_STATUSES = {
+    status: [TRANSITIONS[action][0] for action in ADMIN_ACTIONS if status in TRANSITIONS[action][1]]
+    for status in ('Pending', 'Shipped', 'Delivered', 'Declined', 'Cancelled')
+}
+
+
+class TransitionResult:
+    """Which of the requested orders moved, and which were left alone."""
+
+    def __init__(self, action, moved, skipped, restocked):
+        self.action = action
+        self.moved = moved
+        self.skipped = skipped  # not found, not the user's, or wrong status
+        self.restocked = restocked  # {product_id: qty}
+
+
+def action_for(status):
+    """The admin action that moves an order to `status`, or None."""
+    for action in ADMIN_ACTIONS:
+        if TRANSITIONS[action][0] == status:
+            return action
+    return None
+
+
+def _log_message(action, moved, statuses):
+    target = TRANSITIONS[action][0]
+    if len(moved) == 1:
+        return f"Order #{moved[0]}: {statuses[moved[0]]} -> {target}"
+    return f"{target} {len(moved)} orders: " + ', '.join(f"#{order_id}" for order_id in moved)
+
+
+def transition(conn, action, order_ids, actor_id, reason=None, owner_id=None):
+    """Apply `action` to every order in order_ids that allows it, atomically.
+
+    owner_id limits it to one customer's orders. reason is stored as the
+    cancel/decline reason. Raises KeyError for an unknown action.
+    """
+    target, sources = TRANSITIONS[action]
+    order_ids = sorted({int(order_id) for order_id in order_ids})
+    if not order_ids:
+        return TransitionResult(action, [], [], {})
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        conn.start_transaction()
+        # Locked in id order, so two bulk updates can't deadlock each other
+        sql = f"SELECT order_id, status FROM orders WHERE order_id IN ({id_placeholders(order_ids)})"
+        params = list(order_ids)
+        if owner_id is not None:
+            sql += " AND user_id = %s"
+            params.append(owner_id)
+        cursor.execute(sql + " ORDER BY order_id FOR UPDATE", params)
+        statuses = {row['order_id']: row['status'] for row in cursor.fetchall()}
+
+        moved = [order_id for order_id in order_ids if statuses.get(order_id) in sources]
+        skipped = [order_id for order_id in order_ids if order_id not in moved]
+        if not moved:
+            conn.rollback()
+            return TransitionResult(action, [], skipped, {})
+
+        if target in NOT_SALES:
+            cursor.execute(f"""
+                UPDATE orders SET status = %s, cancel_reason = %s
+                WHERE order_id IN ({id_placeholders(moved)})
+            """, (target, reason or None, *moved))
+        else:
+            cursor.execute(f"UPDATE orders SET status = %s WHERE order_id IN ({id_placeholders(moved)})",
+                           (target, *moved))
+        # Move the orders between status buckets of the sales rollups
+        queue_rollup(cursor, moved, target, {order_id: statuses[order_id] for order_id in moved})
+
+        restocked = restore_stock(cursor, moved) if target in NOT_SALES else {}
+        log_activity(cursor, actor_id, _log_message(action, moved, statuses))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    stock_restored(restocked)
+    return TransitionResult(action, moved, skipped, restocked)
+
+
+def init_orders(app):
+    app.config.setdefault('ORDER_BULK_MAX', 1000)
+    app.jinja_env.globals['next_statuses'] = NEXT_STATUSES
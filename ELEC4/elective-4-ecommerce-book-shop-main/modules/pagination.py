@@ -0,0 +1,149 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import request, current_app, url_for
+
+# =====================================
+# KEYSET PAGINATION
+# =====================================
+# Listings are paged with "seek" conditions on their sort key instead of
+# OFFSET, so page 500 costs the same as page 1. The cursor passed around
+# in `?after=` is the sort key of the last row on the previous page.
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+class Page:
+    """One page of rows plus the cursor for the next one."""
+
+    def __init__(self, items, next_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def page_size():
+    """Page size from `?limit=`, clamped to the configured bounds."""
+    default = current_app.config.get('PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    maximum = current_app.config.get('MAX_PAGE_SIZE', MAX_PAGE_SIZE)
+    limit = request.args.get('limit', default, type=int)
+    return max(1, min(limit or default, maximum))
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Return the key values in a cursor, or None if it is missing/invalid."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = [_decode_value(v) for v in json.loads(raw)]
+    except (ValueError, TypeError):
+        return None
+    return values if len(values) == size else None
+
+
+def keyset_condition(columns, values, descending=True):
+    """Build `(a < %s OR (a = %s AND b < %s))` for a multi-column key."""
+    op = '<' if descending else '>'
+    clauses, params = [], []
+    for i, column in enumerate(columns):
+        parts = [f"{columns[j]} = %s" for j in range(i)] + [f"{column} {op} %s"]
+        clauses.append('(' + ' AND '.join(parts) + ')')
+        params.extend(values[:i] + [values[i]])
+    return '(' + ' OR '.join(clauses) + ')', params
+
+
+def fetch_page(cursor, query, params, order_by, descending=True, limit=None, after=None):
+    """Run `query` (which must already have a WHERE clause) one page at a time.
+
+    order_by is a list of (sql_column, row_key) pairs that together form a
+    unique sort key, e.g. [('o.order_date', 'order_date'), ('o.order_id', 'order_id')].
+    """
+    limit = limit or page_size()
+    if after is None:
+        after = request.args.get('after')
+
+    columns = [column for column, _ in order_by]
+    params = list(params)
+    values = decode_cursor(after, len(columns))
+    if values is not None:
+        condition, extra = keyset_condition(columns, values, descending)
+        query += f" AND {condition}"
+        params.extend(extra)
+
+    direction = 'DESC' if descending else 'ASC'
+    query += " ORDER BY " + ', '.join(f"{column} {direction}" for column in columns)
+    query += " LIMIT %s"
+    params.append(limit + 1)
+
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][key] for _, key in order_by])
+    return Page(rows, next_cursor)
+
+
+def page_ranked(rows, id_field, limit=None, after=None):
+    """Page rows already sorted by search rank; the cursor is the last id."""
+    limit = limit or page_size()
+    if after is None:
+        after = request.args.get('after')
+
+    start = 0
+    values = decode_cursor(after, 1)
+    if values is not None:
+        for i, row in enumerate(rows):
+            if row[id_field] == values[0]:
+                start = i + 1
+                break
+
+    items = rows[start:start + limit]
+    next_cursor = None
+    if start + limit < len(rows):
+        next_cursor = encode_cursor([items[-1][id_field]])
+    return Page(items, next_cursor)
+
+
+def page_url(cursor=None, **params):
+    """URL of the current listing with `after` swapped for another cursor.
+
+    Extra keyword arguments replace query args (None removes one).
+    """
+    args = request.args.to_dict()
+    args.pop('after', None)
+    if cursor:
+        args['after'] = cursor
+    args.update(params)
+    args = {key: value for key, value in args.items() if value is not None}
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+def init_pagination(app):
+    app.config.setdefault('PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    app.config.setdefault('MAX_PAGE_SIZE', MAX_PAGE_SIZE)
+    app.jinja_env.globals['page_url'] = page_url
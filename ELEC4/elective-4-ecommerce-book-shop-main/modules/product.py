@@ -1,8 +1,14 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
-from werkzeug.utils import secure_filename
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, Response, abort, stream_with_context
 from database.connection import get_db_connection
 from modules.utils import admin_required
-import os
+from modules.search import product_index, order_by_rank, id_placeholders
+from modules.pagination import fetch_page, page_ranked
+from modules.cache import category_options, invalidate_catalog
+from modules.images import save_upload
+from modules.facets import product_facets
+from modules.catalog_io import COLUMNS, FORMATS, format_for, import_products, export_products
+from modules.streaming import wants_all, rank_order, stream_rows, stream_listing
+from modules.stock import set_stock, stock_total
 
 product_bp = Blueprint('product', __name__, template_folder='../templates')
 
@@ -16,6 +22,13 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
 
+def save_product_image(image_file):
+    """Store an uploaded cover (content-addressed); None if there isn't a valid one."""
+    if image_file and allowed_file(image_file.filename):
+        return save_upload(image_file, image_file.filename.rsplit('.', 1)[1])
+    return None
+
+
 # =====================================
 # MANAGE PRODUCTS
 # =====================================
@@ -35,32 +48,51 @@ def manage_products():
         category_id = request.args.get('category_id', 'all')
 
         # 2. Fetch categories for the filter dropdown
-        cursor.execute("SELECT * FROM categories ORDER BY category_name ASC")
-        categories = cursor.fetchall()
+        categories = category_options()
 
         # 3. Build the Dynamic Query
         query = """
-            SELECT p.*, c.category_name 
+            SELECT p.product_id, p.title, p.author, p.description, p.price,
+                   p.stock, p.image, c.category_name
             FROM products p 
             LEFT JOIN categories c ON p.category_id = c.category_id 
             WHERE 1=1
         """
         params = []
 
-        # Filter by Title/Author
+        # Filter by Title/Author (ranked by the search index)
+        ranked_ids = None
         if search:
-            query += " AND (p.title LIKE %s OR p.author LIKE %s)"
-            params.extend([f"%{search}%", f"%{search}%"])
+            ranked_ids = product_index.search(search)
+            query += f" AND p.product_id IN ({id_placeholders(ranked_ids) or 'NULL'})"
+            params.extend(ranked_ids)
 
         # Filter by Category (only if it's not "all")
         if category_id and category_id != "all":
             query += " AND p.category_id = %s"
             params.append(category_id)
 
-        # 4. Final Sorting and Execution
-        query += " ORDER BY p.product_id ASC"
-        cursor.execute(query, tuple(params))
-        products = cursor.fetchall()
+        # 4. Final Sorting and Execution (one page at a time, or every
+        #    row streamed with ?all=1)
+        if wants_all():
+            order_by, order_params = (rank_order('p.product_id', ranked_ids) if ranked_ids is not None
+                                      else (" ORDER BY p.product_id", []))
+            return stream_listing(
+                'admin/manage_products.html',
+                products=stream_rows(query + order_by, params + order_params),
+                categories=categories,
+                selected_category=category_id,
+                search=search
+            )
+
+        if ranked_ids is not None:
+            cursor.execute(query, tuple(params))
+            rows = order_by_rank(cursor.fetchall(), ranked_ids, 'product_id')
+            page = page_ranked(rows, 'product_id')
+        else:
+            page = fetch_page(cursor, query, params,
+                              [('p.product_id', 'product_id')], descending=False)
+        products = page.items
 
     finally:
         # 5. Always close connection even if query fails
@@ -70,6 +102,7 @@ def manage_products():
     return render_template(
         'admin/manage_products.html',
         products=products,
+        page=page,
         categories=categories,
         selected_category=category_id, # Keeps the dropdown selected
         search=search                  # Keeps the search text in the box
@@ -84,8 +117,7 @@ def manage_products():
 def add_product():
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM categories ORDER BY category_name ASC")
-    categories = cursor.fetchall()
+    categories = category_options()
 
     if request.method == 'POST':
         title = request.form.get('title', '').strip()
@@ -96,15 +128,6 @@ def add_product():
         category_id = request.form.get('category_id') or None
 
         # Handle image upload
-        image_file = request.files.get('image')
-        image_filename = None
-        if image_file and allowed_file(image_file.filename):
-            filename = secure_filename(image_file.filename)
-            image_path = os.path.join(
-                current_app.config['UPLOAD_FOLDER'], filename)
-            image_file.save(image_path)
-            image_filename = f"/{image_path}"
-
         # Validation
         if not title or not price:
             flash('Title and price are required.', 'danger')
@@ -115,11 +138,17 @@ def add_product():
             flash('Product title already exists.', 'danger')
             return render_template('admin/product/add_product.html', categories=categories)
 
+        # Handle image upload (stored under its content hash, variants built in the background)
+        image_filename = save_product_image(request.files.get('image'))
+
         cursor.execute("""
             INSERT INTO products (title, author, description, price, stock, category_id, image)
             VALUES (%s, %s, %s, %s, %s, %s, %s)
         """, (title, author, description, price, stock, category_id, image_filename))
         conn.commit()
+        product_index.add(cursor.lastrowid, {'title': title, 'author': author})
+        product_facets.set_product(cursor.lastrowid, {'author': author, 'category_id': category_id, 'stock': stock})
+        invalidate_catalog()
 
         flash('Product added successfully!', 'success')
         cursor.close()
@@ -143,12 +172,14 @@ def edit_product(id):
     cursor.execute("SELECT * FROM products WHERE product_id = %s", (id,))
     product = cursor.fetchone()
 
-    cursor.execute("SELECT * FROM categories ORDER BY category_name ASC")
-    categories = cursor.fetchall()
+    categories = category_options()
 
     if not product:
         flash('Product not found.', 'danger')
         return redirect(url_for('product.manage_products'))
+    if product['stock_shards']:
+        # products.stock lags the shards by up to STOCK_SHARD_SYNC_INTERVAL
+        product['stock'] = stock_total(cursor, id)
 
     if request.method == 'POST':
         title = request.form.get('title', '').strip()
@@ -158,22 +189,26 @@ def edit_product(id):
         stock = request.form.get('stock', 0)
         category_id = request.form.get('category_id') or None
 
-        # Handle new image
-        image_file = request.files.get('image')
-        image_filename = product['image']  # keep old one by default
-        if image_file and allowed_file(image_file.filename):
-            filename = secure_filename(image_file.filename)
-            image_path = os.path.join(
-                current_app.config['UPLOAD_FOLDER'], filename)
-            image_file.save(image_path)
-            image_filename = f"/{image_path}"
+        # Titles are unique (migration 0005)
+        cursor.execute("SELECT product_id FROM products WHERE title = %s AND product_id <> %s", (title, id))
+        if cursor.fetchone():
+            flash('Product title already exists.', 'danger')
+            return render_template('admin/product/edit_product.html', product=product, categories=categories)
+
+        # Handle new image (keep old one by default)
+        image_filename = save_product_image(request.files.get('image')) or product['image']
 
+        conn.start_transaction()
         cursor.execute("""
             UPDATE products 
             SET title=%s, author=%s, description=%s, price=%s, stock=%s, category_id=%s, image=%s
             WHERE product_id=%s
         """, (title, author, description, price, stock, category_id, image_filename, id))
+        set_stock(cursor, id, stock)  # rebalances a sharded product's shards
         conn.commit()
+        product_index.add(id, {'title': title, 'author': author})
+        product_facets.set_product(id, {'author': author, 'category_id': category_id, 'stock': stock})
+        invalidate_catalog()
 
         flash('Product updated successfully!', 'success')
         cursor.close()
@@ -195,8 +230,43 @@ def delete_product(id):
     cursor = conn.cursor()
     cursor.execute("DELETE FROM products WHERE product_id = %s", (id,))
     conn.commit()
+    product_index.remove(id)
+    product_facets.remove(id)
+    invalidate_catalog()
     cursor.close()
     conn.close()
 
     flash('Product deleted successfully!', 'success')
     return redirect(url_for('product.manage_products'))
+
+
+# =====================================
+# BULK IMPORT / EXPORT
+# =====================================
+@product_bp.route('/admin/import_products', methods=['GET', 'POST'])
+@admin_required
+def bulk_import():
+    report = None
+    if request.method == 'POST':
+        # Catalog files are far bigger than the app-wide upload limit
+        request.max_content_length = current_app.config['CATALOG_IMPORT_MAX_BYTES']
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Choose a CSV or JSONL file to import.', 'danger')
+            return redirect(url_for('product.bulk_import'))
+
+        report = import_products(upload.stream, format_for(upload.filename, request.form.get('format')))
+        flash(report.summary(), 'danger' if report.failed else 'success')
+
+    return render_template('admin/product/import_products.html', report=report, columns=COLUMNS)
+
+
+@product_bp.route('/admin/export_products.<fmt>')
+@admin_required
+def bulk_export(fmt):
+    if fmt not in FORMATS:
+        abort(404)
+    response = Response(stream_with_context(export_products(fmt)),
+                        mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename=products.{fmt}'
+    return response
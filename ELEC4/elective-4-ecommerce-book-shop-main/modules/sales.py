@@ -0,0 +1,309 @@
+from datetime import date, timedelta
+
+import click
+from flask.cli import with_appcontext
+from database.connection import get_db_connection
+from modules.search import id_placeholders
+from modules.jobs import enqueue, job
+
+# =====================================
+# SALES ROLLUPS
+# =====================================
+# Orders are folded into per-day rollups (overall, per product, per
+# category). Buckets are keyed by status, so a status change is "subtract
+# under the old status, add under the new one". Touched days are queued
+# in sales_dirty_days and a compactor rewrites just those days' rows of
+# sales_reports (daily, plus the enclosing week and month). The dashboard
+# reads sales_reports and the rollups, never orders/order_items.
+#
+# The rollup rows are shared by every order of the day, so checkout and
+# status changes don't touch them: their transaction only queues a
+# sales_rollup job (its own jobs row, nothing shared) saying which orders
+# moved between which buckets, and a job worker applies it. The job
+# carries the statuses, so it is correct whenever it runs, and it queues
+# the compaction itself.
+#
+# Lock order: the dirty-day row is written before the rollup rows, the
+# same order the compactor takes them in, so the two can't deadlock.
+
+NOT_SALES = ('Cancelled', 'Declined')  # statuses excluded from revenue
+
+def _not_sales_sql():
+    return ', '.join(f"'{s}'" for s in NOT_SALES)
+
+
+def apply_orders(cursor, order_ids, sign, status=None):
+    """Add (sign=1) or remove (sign=-1) orders from the rollups.
+
+    Goes into the `status` bucket, or each order's current status if None.
+    """
+    if not order_ids:
+        return
+    ids = list(order_ids)
+    placeholders = id_placeholders(ids)
+    if status is None:
+        bucket, bucket_param, by_status = "o.status", [], ", o.status"
+    else:
+        bucket, bucket_param, by_status = "%s", [status], ""
+
+    cursor.execute(f"""
+        INSERT IGNORE INTO sales_dirty_days (day)
+        SELECT DISTINCT DATE(order_date) FROM orders WHERE order_id IN ({placeholders})
+    """, ids)
+
+    cursor.execute(f"""
+        INSERT INTO sales_daily (day, status, orders, units, revenue)
+        SELECT DATE(o.order_date), {bucket}, %s * COUNT(*), %s * COALESCE(SUM(i.units), 0),
+               %s * SUM(o.total_amount)
+        FROM orders o
+        LEFT JOIN (
+            SELECT order_id, SUM(quantity) AS units
+            FROM order_items WHERE order_id IN ({placeholders})
+            GROUP BY order_id
+        ) i ON i.order_id = o.order_id
+        WHERE o.order_id IN ({placeholders})
+        GROUP BY DATE(o.order_date){by_status}
+        ON DUPLICATE KEY UPDATE
+            orders = sales_daily.orders + VALUES(orders),
+            units = sales_daily.units + VALUES(units),
+            revenue = sales_daily.revenue + VALUES(revenue)
+    """, bucket_param + [sign, sign, sign] + ids + ids)
+
+    cursor.execute(f"""
+        INSERT INTO sales_daily_product (day, product_id, status, units, revenue)
+        SELECT DATE(o.order_date), oi.product_id, {bucket},
+               %s * SUM(oi.quantity), %s * SUM(oi.quantity * oi.price)
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.order_id
+        WHERE o.order_id IN ({placeholders})
+        GROUP BY DATE(o.order_date), oi.product_id{by_status}
+        ON DUPLICATE KEY UPDATE
+            units = sales_daily_product.units + VALUES(units),
+            revenue = sales_daily_product.revenue + VALUES(revenue)
+    """, bucket_param + [sign, sign] + ids)
+
+    cursor.execute(f"""
+        INSERT INTO sales_daily_category (day, category_id, status, units, revenue)
+        SELECT DATE(o.order_date), COALESCE(p.category_id, 0), {bucket},
+               %s * SUM(oi.quantity), %s * SUM(oi.quantity * oi.price)
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.order_id
+        LEFT JOIN products p ON p.product_id = oi.product_id
+        WHERE o.order_id IN ({placeholders})
+        GROUP BY DATE(o.order_date), COALESCE(p.category_id, 0){by_status}
+        ON DUPLICATE KEY UPDATE
+            units = sales_daily_category.units + VALUES(units),
+            revenue = sales_daily_category.revenue + VALUES(revenue)
+    """, bucket_param + [sign, sign] + ids)
+
+
+def queue_rollup(cursor, order_ids, status, previous=None):
+    """Queue moving orders into the `status` bucket, in the caller's transaction.
+
+    previous is {order_id: status it left} for a status change, None for
+    new orders.
+    """
+    if not order_ids:
+        return
+    enqueue(cursor, 'sales_rollup', {
+        'orders': list(order_ids),
+        'status': status,
+        'previous': {str(order_id): old for order_id, old in (previous or {}).items()},
+    })
+
+
+@job('sales_rollup')
+def rollup_job(cursor, payload, job_id):
+    changes = {}
+    for order_id, old in payload['previous'].items():
+        changes.setdefault((old, -1), []).append(int(order_id))
+    changes.setdefault((payload['status'], 1), []).extend(payload['orders'])
+    # Buckets in a fixed order, so two rollup jobs lock rows in the same order
+    for (status, sign), ids in sorted(changes.items()):
+        apply_orders(cursor, ids, sign, status)
+    queue_compaction(cursor)
+
+
+# =====================================
+# COMPACTION INTO sales_reports
+# =====================================
+
+# report_type -> (period start of `day`, end of the period starting at `p`)
+PERIODS = {
+    'daily': ("day", "p + INTERVAL 1 DAY"),
+    'weekly': ("day - INTERVAL WEEKDAY(day) DAY", "p + INTERVAL 7 DAY"),
+    'monthly': ("day - INTERVAL (DAYOFMONTH(day) - 1) DAY", "p + INTERVAL 1 MONTH"),
+}
+
+
+def compact_days(cursor):
+    """Rewrite sales_reports for every dirty day, in the caller's transaction."""
+    cursor.execute("SELECT day FROM sales_dirty_days ORDER BY day FOR UPDATE")
+    days = [row['day'] if isinstance(row, dict) else row[0] for row in cursor.fetchall()]
+    if not days:
+        return 0
+
+    placeholders = id_placeholders(days)
+    for report_type, (period_start, period_end) in PERIODS.items():
+        # Driven by the periods, so a period whose orders were all
+        # cancelled is rewritten to zero rather than left stale
+        cursor.execute(f"""
+            INSERT INTO sales_reports (report_type, period_start, total_sales, orders, units, generated_at)
+            SELECT %s, w.p, COALESCE(SUM(s.revenue), 0), COALESCE(SUM(s.orders), 0),
+                   COALESCE(SUM(s.units), 0), NOW()
+            FROM (
+                SELECT DISTINCT {period_start} AS p
+                FROM sales_dirty_days WHERE day IN ({placeholders})
+            ) w
+            LEFT JOIN sales_daily s
+                   ON s.day >= w.p AND s.day < {period_end}
+                  AND s.status NOT IN ({_not_sales_sql()})
+            GROUP BY w.p
+            ON DUPLICATE KEY UPDATE
+                total_sales = VALUES(total_sales), orders = VALUES(orders),
+                units = VALUES(units), generated_at = VALUES(generated_at)
+        """, [report_type] + days)
+
+    cursor.execute(f"DELETE FROM sales_dirty_days WHERE day IN ({placeholders})", days)
+    return len(days)
+
+
+def compact(conn):
+    """Compact the dirty days in a transaction of its own; returns days processed."""
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        days = compact_days(cursor)
+        conn.commit()
+        return days
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def queue_compaction(cursor):
+    """Compact soon, in a job worker (one pending job however many orders change).
+
+    Only rollup jobs call this: the dedupe row it locks is shared, so it
+    stays out of request transactions.
+    """
+    enqueue(cursor, 'sales_compact', dedupe_key='sales_compact')
+
+
+@job('sales_compact')
+def compact_job(cursor, payload, job_id):
+    compact_days(cursor)
+
+
+def rebuild(conn):
+    """Recompute every rollup from orders (backfill / repair).
+
+    Run it with the job queue drained: a sales_rollup job still queued
+    would count its orders a second time.
+    """
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        for table in ('sales_daily', 'sales_daily_product', 'sales_daily_category', 'sales_reports'):
+            cursor.execute(f"DELETE FROM {table}")
+        cursor.execute("SELECT order_id FROM orders")
+        order_ids = [row[0] for row in cursor.fetchall()]
+        for start in range(0, len(order_ids), 1000):
+            apply_orders(cursor, order_ids[start:start + 1000], 1)
+        conn.commit()
+        return len(order_ids)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# =====================================
+# DASHBOARD QUERIES (O(days), not O(orders))
+# =====================================
+
+
+def dashboard_summary(cursor, days=30):
+    """Figures for admin/dashboard.html; cursor must be a dictionary cursor."""
+    days = max(1, min(days, 366))
+    today = date.today()
+    since = today - timedelta(days=days - 1)
+    week_start = today - timedelta(days=today.weekday())
+    month_start = today.replace(day=1)
+
+    cursor.execute("""
+        SELECT period_start, total_sales, orders, units
+        FROM sales_reports
+        WHERE report_type = 'daily' AND period_start >= %s
+        ORDER BY period_start
+    """, (since,))
+    daily = cursor.fetchall()
+
+    cursor.execute("""
+        SELECT report_type, total_sales, orders, units
+        FROM sales_reports
+        WHERE (report_type = 'weekly' AND period_start = %s)
+           OR (report_type = 'monthly' AND period_start = %s)
+    """, (week_start, month_start))
+    periods = {row['report_type']: row for row in cursor.fetchall()}
+
+    cursor.execute(f"""
+        SELECT s.product_id, p.title, SUM(s.units) AS units, SUM(s.revenue) AS revenue
+        FROM sales_daily_product s
+        LEFT JOIN products p ON p.product_id = s.product_id
+        WHERE s.day >= %s AND s.status NOT IN ({_not_sales_sql()})
+        GROUP BY s.product_id, p.title
+        ORDER BY revenue DESC
+        LIMIT 10
+    """, (since,))
+    top_products = cursor.fetchall()
+
+    cursor.execute(f"""
+        SELECT s.category_id, c.category_name, SUM(s.units) AS units, SUM(s.revenue) AS revenue
+        FROM sales_daily_category s
+        LEFT JOIN categories c ON c.category_id = s.category_id
+        WHERE s.day >= %s AND s.status NOT IN ({_not_sales_sql()})
+        GROUP BY s.category_id, c.category_name
+        ORDER BY revenue DESC
+    """, (since,))
+    top_categories = cursor.fetchall()
+
+    cursor.execute("""
+        SELECT status, SUM(orders) AS orders
+        FROM sales_daily
+        WHERE day >= %s
+        GROUP BY status
+        HAVING SUM(orders) > 0
+        ORDER BY orders DESC
+    """, (since,))
+    statuses = cursor.fetchall()
+
+    return {
+        'days': days,
+        'daily': daily,
+        'week': periods.get('weekly'),
+        'month': periods.get('monthly'),
+        'today': daily[-1] if daily and daily[-1]['period_start'] == today else None,
+        'top_products': top_products,
+        'top_categories': top_categories,
+        'statuses': statuses,
+        'max_daily': max((float(d['total_sales']) for d in daily), default=0.0),
+    }
+
+
+@click.command('sales-rollup')
+@click.option('--rebuild', 'full', is_flag=True, help='Recompute the rollups from all orders first.')
+@with_appcontext
+def sales_rollup_command(full):
+    """Compact dirty days into sales_reports (run from cron or by hand)."""
+    conn = get_db_connection()
+    if full:
+        click.echo(f"rolled up {rebuild(conn)} order(s)")
+    click.echo(f"compacted {compact(conn)} day(s)")
+
+
+def init_sales(app):
+    app.cli.add_command(sales_rollup_command)
@@ -0,0 +1,290 @@
+import bisect
+import re
+import unicodedata
+
+from flask import current_app, has_app_context
+from modules.index_loader import ReloadableIndex
+
+# =====================================
+# SEARCH INDEX
+# =====================================
+# In-process inverted index used instead of LIKE '%term%' scans.
+# Matching per query term, best match wins:
+#   exact token        -> weight 3
+#   token prefix       -> weight 2  (terms of 2+ characters)
+#   one edit away      -> weight 1  (terms of 4+ characters)
+# Every query term has to match for a document to be returned.
+
+EXACT, PREFIX, TYPO = 3.0, 2.0, 1.0
+MIN_PREFIX_LEN = 2
+MIN_TYPO_LEN = 4
+MAX_PREFIX_EXPANSIONS = 200
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercase, strip accents and split text into alphanumeric tokens."""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(text)
+
+
+def _deletions(token):
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def _within_one_edit(a, b):
+    """True if a and b differ by one insert, delete, substitution or swap."""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diff = [i for i in range(la) if a[i] != b[i]]
+        if len(diff) == 1:
+            return True
+        return (len(diff) == 2 and diff[1] == diff[0] + 1
+                and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]])
+    if la > lb:
+        a, b = b, a
+    # b is one character longer than a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+class SearchIndex(ReloadableIndex):
+    """Inverted index over one table, kept in sync by the write routes.
+
+    Other worker processes write to the same tables, so the index is
+    rebuilt from the database every SEARCH_INDEX_MAX_AGE seconds.
+    """
+
+    max_age_key = 'SEARCH_INDEX_MAX_AGE'
+
+    def __init__(self, name, id_field, fields, loader_sql=None):
+        # fields: {column_name: weight}; loader_sql selects id + those columns
+        self.name = name
+        self.id_field = id_field
+        self.fields = fields
+        self.label = f"Search index '{name}'"
+        super().__init__(loader_sql)
+
+    def _reset(self):
+        self._docs = {}          # doc_id -> {token: field weight}
+        self._postings = {}      # token -> {doc_id: field weight}
+        self._variants = {}      # deletion variant -> {token}
+        self._sorted_tokens = []
+        self._dirty = False
+
+    # --- maintenance -------------------------------------------------
+
+    def _doc_tokens(self, row):
+        tokens = {}
+        for field, weight in self.fields.items():
+            for token in tokenize(row.get(field)):
+                tokens[token] = max(tokens.get(token, 0), weight)
+        return tokens
+
+    def _add_token(self, token):
+        self._postings[token] = {}
+        self._dirty = True
+        if len(token) >= MIN_TYPO_LEN - 1:
+            for variant in _deletions(token):
+                self._variants.setdefault(variant, set()).add(token)
+
+    def _drop_token(self, token):
+        del self._postings[token]
+        self._dirty = True
+        if len(token) >= MIN_TYPO_LEN - 1:
+            for variant in _deletions(token):
+                tokens = self._variants.get(variant)
+                if tokens:
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._variants[variant]
+
+    def add(self, doc_id, row):
+        """Index (or re-index) one row given as a dict of field values."""
+        with self._lock:
+            self._add(doc_id, row)
+            self._note('_add', doc_id, row)
+
+    def _add(self, doc_id, row):
+        self._remove(doc_id)
+        tokens = self._doc_tokens(row)
+        self._docs[doc_id] = tokens
+        for token, weight in tokens.items():
+            if token not in self._postings:
+                self._add_token(token)
+            self._postings[token][doc_id] = weight
+
+    def _remove(self, doc_id):
+        tokens = self._docs.pop(doc_id, None)
+        if not tokens:
+            return
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                self._drop_token(token)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+            self._note('_remove', doc_id)
+
+    def _insert(self, row):
+        self._add(row[self.id_field], row)
+
+    def __len__(self):
+        return len(self._docs)
+
+    # --- loading -----------------------------------------------------
+
+    def _fresh(self):
+        return SearchIndex(self.name, self.id_field, self.fields)
+
+    def _adopt(self, fresh):
+        self._docs, self._postings = fresh._docs, fresh._postings
+        self._variants = fresh._variants
+        self._sorted_tokens, self._dirty = [], True
+
+    # --- querying ----------------------------------------------------
+
+    def _prefix_tokens(self, term):
+        if self._dirty:
+            self._sorted_tokens = sorted(self._postings)
+            self._dirty = False
+        start = bisect.bisect_left(self._sorted_tokens, term)
+        matches = []
+        for token in self._sorted_tokens[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not token.startswith(term):
+                break
+            matches.append(token)
+        return matches
+
+    def _typo_tokens(self, term):
+        candidates = set(self._variants.get(term, ()))
+        for variant in _deletions(term):
+            if variant in self._postings:
+                candidates.add(variant)
+            candidates.update(self._variants.get(variant, ()))
+        return [t for t in candidates if _within_one_edit(term, t)]
+
+    def _expand(self, term):
+        """Map a query term to {token: match weight}."""
+        matches = {}
+        if len(term) >= MIN_TYPO_LEN:
+            for token in self._typo_tokens(term):
+                matches[token] = TYPO
+        if len(term) >= MIN_PREFIX_LEN:
+            for token in self._prefix_tokens(term):
+                matches[token] = PREFIX
+        if term in self._postings:
+            matches[term] = EXACT
+        return matches
+
+    def search(self, query, limit=None):
+        """Return matching doc ids ordered by relevance (best first)."""
+        self.ensure_loaded()
+        if limit is None:
+            limit = current_app.config.get('SEARCH_MAX_RESULTS', 500) if has_app_context() else 500
+
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            expansions = [self._expand(term) for term in terms]
+            if not all(expansions):
+                return []
+            # Most selective term first; later terms then only probe its hits
+            sizes = [sum(len(self._postings[t]) for t in m) for m in expansions]
+            order = sorted(range(len(terms)), key=sizes.__getitem__)
+
+            scores = None
+            for i in order:
+                matches = expansions[i]
+                if scores is not None and len(scores) * len(matches) < sizes[i]:
+                    scores = self._probe(scores, matches)
+                else:
+                    term_scores = self._collect(matches)
+                    if scores is None:
+                        scores = term_scores
+                    else:
+                        scores = {d: s + term_scores[d] for d, s in scores.items() if d in term_scores}
+                if not scores:
+                    return []
+
+        # Highest score first, newest id first on ties (sort is stable)
+        ranked = sorted(scores, reverse=True)
+        ranked.sort(key=scores.__getitem__, reverse=True)
+        return ranked[:limit]
+
+    def _collect(self, matches):
+        """Best score per document over every token a term expanded to."""
+        scores = {}
+        for token, match_weight in matches.items():
+            for doc_id, field_weight in self._postings[token].items():
+                score = match_weight * field_weight
+                if score > scores.get(doc_id, 0):
+                    scores[doc_id] = score
+        return scores
+
+    def _probe(self, scores, matches):
+        """Like _collect, but only for documents already in `scores`."""
+        postings = [(self._postings[t], w) for t, w in matches.items()]
+        narrowed = {}
+        for doc_id, total in scores.items():
+            best = 0
+            for posting, match_weight in postings:
+                field_weight = posting.get(doc_id)
+                if field_weight and match_weight * field_weight > best:
+                    best = match_weight * field_weight
+            if best:
+                narrowed[doc_id] = total + best
+        return narrowed
+
+
+def order_by_rank(rows, ranked_ids, id_field):
+    """Sort rows fetched with `IN (...)` back into search-rank order."""
+    position = {doc_id: i for i, doc_id in enumerate(ranked_ids)}
+    return sorted(rows, key=lambda row: position.get(row[id_field], len(position)))
+
+
+def id_placeholders(ids):
+    return ','.join(['%s'] * len(ids))
+
+
+# =====================================
+# INDEXES
+# =====================================
+
+product_index = SearchIndex(
+    'products',
+    'product_id',
+    {'title': 2.0, 'author': 1.0},
+    "SELECT product_id, title, author FROM products",
+)
+
+user_index = SearchIndex(
+    'users',
+    'user_id',
+    {'name': 2.0, 'email': 1.0},
+    "SELECT user_id, name, email FROM users WHERE role = 'customer'",
+)
+
+category_index = SearchIndex(
+    'categories',
+    'category_id',
+    {'category_name': 2.0, 'description': 1.0},
+    "SELECT category_id, category_name, description FROM categories",
+)
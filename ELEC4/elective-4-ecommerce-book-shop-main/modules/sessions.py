@@ -0,0 +1,473 @@
+import mmap
+import os
+import re
+import secrets
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process dev server, the thread lock is enough
+    fcntl = None
+
+from flask import current_app, g, session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from werkzeug.local import LocalProxy
+
+from database.connection import get_db_connection
+
+# =====================================
+# SERVER-SIDE SESSIONS
+# =====================================
+# The cookie only carries a random session id; the data (user_id, role,
+# cart_count, flashes) lives in SQLite or a Redis-protocol server shared
+# by every worker. An in-process LRU in front skips the store on most
+# requests. It stays coherent across the workers on a host through a
+# small memory-mapped file of write counters (one per bucket of session
+# ids): every write or delete bumps its bucket, and a cached entry is only
+# used while its bucket still has the value it was cached under.
+# Deactivating a user deletes their sessions and bumps their buckets, so
+# every worker drops them on its next request instead of at logout. Only
+# new sessions insert rows; later writes update the row if it still
+# exists, so a request in flight during the revoke can't write it back.
+#
+# SESSION_BACKEND = 'cookie' keeps Flask's signed-cookie sessions (no
+# revocation). Redis shared by several hosts: set SESSION_LRU_SIZE = 0.
+
+_SID = re.compile(r'^[A-Za-z0-9_-]{43}$')
+
+
+def new_sid():
+    return secrets.token_urlsafe(32)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session dict that tracks reads and writes like Flask's cookie session."""
+
+    def __init__(self, initial=None, sid=None, new=False, expires=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires = expires  # server-side expiry (epoch seconds)
+        self.previous_sid = None
+        self.modified = False
+        self.accessed = False
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+    def regenerate(self):
+        """Move the data to a fresh id (on login, against session fixation)."""
+        if not self.new and self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = new_sid()
+        self.modified = True
+
+
+# =====================================
+# STORES
+# =====================================
+
+
+class SQLiteStore:
+    """Sessions in a local SQLite file (WAL), shared by the worker processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+              sid TEXT PRIMARY KEY,
+              user_id INTEGER,
+              data TEXT NOT NULL,
+              expires REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_user ON sessions (user_id)")
+
+    def _conn(self):
+        # One connection per thread, and never one inherited across fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def load(self, sid):
+        row = self._conn().execute(
+            "SELECT data, expires FROM sessions WHERE sid = ? AND expires > ?", (sid, time.time())).fetchone()
+        return row if row else None
+
+    def create(self, sid, data, user_id, expires):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO sessions (sid, user_id, data, expires) VALUES (?, ?, ?, ?)",
+            (sid, user_id, data, expires))
+
+    def update(self, sid, data, user_id, expires):
+        """Rewrite an existing session; False if it's gone (revoked, logged out)."""
+        return self._conn().execute(
+            "UPDATE sessions SET user_id = ?, data = ?, expires = ? WHERE sid = ?",
+            (user_id, data, expires, sid)).rowcount == 1
+
+    def delete(self, sid):
+        self._conn().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def revoke_user(self, user_id):
+        """Delete every session of a user; returns their ids."""
+        conn = self._conn()
+        sids = [row[0] for row in conn.execute("SELECT sid FROM sessions WHERE user_id = ?", (user_id,))]
+        conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        return sids
+
+    def sweep(self):
+        return self._conn().execute("DELETE FROM sessions WHERE expires <= ?", (time.time(),)).rowcount
+
+
+class RedisStore:
+    """Sessions in any Redis-protocol server; the server expires them."""
+
+    def __init__(self, url, prefix='bookshop:session:'):
+        import redis  # optional dependency, only needed for this backend
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def load(self, sid):
+        pipe = self._client.pipeline()
+        pipe.get(self.prefix + sid)
+        pipe.pttl(self.prefix + sid)
+        data, ttl_ms = pipe.execute()
+        if data is None:
+            return None
+        return data.decode(), time.time() + max(ttl_ms, 0) / 1000
+
+    def _save(self, sid, data, user_id, expires, existing):
+        ttl = max(1, int(expires - time.time()))
+        # XX: only overwrite a key that is still there
+        if not self._client.set(self.prefix + sid, data, ex=ttl, xx=existing):
+            return False
+        if user_id is not None:
+            pipe = self._client.pipeline()
+            pipe.sadd(f"{self.prefix}user:{user_id}", sid)
+            pipe.expire(f"{self.prefix}user:{user_id}", ttl)
+            pipe.execute()
+        return True
+
+    def create(self, sid, data, user_id, expires):
+        self._save(sid, data, user_id, expires, existing=False)
+
+    def update(self, sid, data, user_id, expires):
+        """Rewrite an existing session; False if it's gone (revoked, logged out)."""
+        return self._save(sid, data, user_id, expires, existing=True)
+
+    def delete(self, sid):
+        self._client.delete(self.prefix + sid)
+
+    def revoke_user(self, user_id):
+        """Delete every session of a user; returns their ids."""
+        key = f"{self.prefix}user:{user_id}"
+        sids = [sid.decode() for sid in self._client.smembers(key)]
+        self._client.delete(key, *[self.prefix + sid for sid in sids])
+        return sids
+
+    def sweep(self):
+        return 0
+
+
+class VersionBoard:
+    """Write counters shared by the processes on a host (memory-mapped file).
+
+    Reads are a memory access; bumps take a file lock so that a store write
+    and its bump are atomic with respect to other processes' writes.
+    """
+
+    SLOTS = 4096
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd = None
+        self._pid = None
+        fd = self._file()
+        if os.fstat(fd).st_size < self.SLOTS * 8:
+            os.ftruncate(fd, self.SLOTS * 8)
+        self._map = mmap.mmap(fd, self.SLOTS * 8)  # shared, survives fork
+
+    def _file(self):
+        # flock is per open file, so each process needs its own descriptor
+        if self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._pid = os.getpid()
+        return self._fd
+
+    def _offset(self, sid):
+        return zlib.crc32(sid.encode()) % self.SLOTS * 8
+
+    def read(self, sid):
+        return struct.unpack_from('<Q', self._map, self._offset(sid))[0]
+
+    @contextmanager
+    def locked(self):
+        """Hold while writing the store and bumping, across threads and processes."""
+        with self._thread_lock:
+            fd = self._file()
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def bump(self, sid):
+        """Invalidate cached copies of sid (call inside locked()); returns the new value."""
+        offset = self._offset(sid)
+        value = struct.unpack_from('<Q', self._map, offset)[0] + 1
+        struct.pack_into('<Q', self._map, offset, value)
+        return value
+
+
+class SessionLRU:
+    """sid -> (version, data, expires), least recently used evicted."""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, sid, version):
+        if not self.maxsize:
+            return None
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None or entry[0] != version or entry[2] <= time.time():
+                self.misses += 1
+                return None
+            self._data.move_to_end(sid)
+            self.hits += 1
+            return entry
+
+    def set(self, sid, entry):
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._data[sid] = entry
+            self._data.move_to_end(sid)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+# =====================================
+# SESSION INTERFACE
+# =====================================
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+    session_class = ServerSession
+
+    def __init__(self, store, versions, lru_size=10000, sweep_interval=600):
+        self.store = store
+        self.versions = versions
+        self.lru = SessionLRU(lru_size)
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or not _SID.match(sid):
+            return self.session_class(sid=new_sid(), new=True)
+
+        # Version read before the load: a write in between makes the entry stale
+        version = self.versions.read(sid)
+        entry = self.lru.get(sid, version)
+        if entry is None:
+            row = self.store.load(sid)
+            if row is None:
+                return self.session_class(sid=new_sid(), new=True)
+            entry = (version, row[0], row[1])
+            self.lru.set(sid, entry)
+        return self.session_class(self.serializer.loads(entry[1]), sid=sid, expires=entry[2])
+
+    def _delete(self, sid):
+        with self.versions.locked():
+            self.store.delete(sid)
+            self.versions.bump(sid)
+        self.lru.delete(sid)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.previous_sid:
+            self._delete(session.previous_sid)
+
+        if not session:
+            if not session.new:
+                self._delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        # Write when changed, or when half the lifetime has gone (sliding expiry)
+        now = time.time()
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        refresh = session.expires is None or session.expires - now < lifetime / 2
+        if session.modified or session.new or refresh:
+            data = self.serializer.dumps(dict(session))
+            expires = now + lifetime
+            with self.versions.locked():
+                if session.new or session.previous_sid:
+                    self.store.create(session.sid, data, session.get('user_id'), expires)
+                    saved = True
+                else:
+                    # Only rewrite a row that still exists: a session revoked
+                    # while this request ran must not be written back
+                    saved = self.store.update(session.sid, data, session.get('user_id'), expires)
+                if saved:
+                    version = self.versions.bump(session.sid)
+            if not saved:
+                self.lru.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+                return
+            self.lru.set(session.sid, (version, data, expires))
+            self._maybe_sweep()
+
+        if session.new or session.previous_sid or self.should_set_cookie(app, session):
+            response.set_cookie(
+                name, session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain, path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+    def _maybe_sweep(self):
+        if time.monotonic() - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = time.monotonic()
+        try:
+            self.store.sweep()
+        except Exception as e:
+            print("SESSION SWEEP ERROR:", e)
+
+    def revoke_user(self, user_id):
+        with self.versions.locked():
+            sids = self.store.revoke_user(user_id)
+            for sid in sids:
+                self.versions.bump(sid)
+        for sid in sids:
+            self.lru.delete(sid)
+        return len(sids)
+
+    def stats(self):
+        lookups = self.lru.hits + self.lru.misses
+        return {
+            'backend': type(self.store).__name__,
+            'lru_size': len(self.lru),
+            'lru_hits': self.lru.hits,
+            'lru_misses': self.lru.misses,
+            'lru_hit_ratio': round(self.lru.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# =====================================
+# LOGIN HELPERS / CURRENT USER
+# =====================================
+
+
+def login_user(user):
+    """Start a fresh session for a users row: only the id and role are kept."""
+    session.clear()
+    if hasattr(session, 'regenerate'):
+        session.regenerate()
+    session['user_id'] = user['user_id']
+    session['role'] = user['role']
+
+
+def revoke_user_sessions(user_id):
+    """Log a user out everywhere (no-op with cookie sessions)."""
+    interface = current_app.session_interface
+    if isinstance(interface, ServerSessionInterface):
+        return interface.revoke_user(user_id)
+    return 0
+
+
+def _load_current_user():
+    if 'current_user' not in g:
+        user = None
+        user_id = session.get('user_id')
+        if user_id is not None:
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT user_id, name, email, phone, address, role, status
+                FROM users WHERE user_id = %s
+            """, (user_id,))
+            user = cursor.fetchone()
+            cursor.close()
+            conn.close()
+        g.current_user = user
+    return g.current_user
+
+
+# The logged-in users row, fetched on first use in a request (None if anonymous)
+current_user = LocalProxy(_load_current_user)
+
+
+def _store_from_config(app):
+    config = app.config
+    if config['SESSION_BACKEND'] == 'redis':
+        return RedisStore(config['SESSION_REDIS_URL'])
+    return SQLiteStore(config['SESSION_SQLITE_PATH'])
+
+
+def init_sessions(app):
+    app.config.setdefault('SESSION_BACKEND', 'sqlite')
+    app.config.setdefault('SESSION_SQLITE_PATH', os.path.join(app.instance_path, 'sessions.db'))
+    app.config.setdefault('SESSION_REDIS_URL', 'redis://localhost:6379/0')
+    app.config.setdefault('SESSION_VERSIONS_PATH', os.path.join(app.instance_path, 'session-versions'))
+    app.config.setdefault('SESSION_LRU_SIZE', 10000)
+    app.jinja_env.globals['current_user'] = current_user
+    if app.config['SESSION_BACKEND'] == 'cookie':
+        return
+    for path in (app.config['SESSION_SQLITE_PATH'], app.config['SESSION_VERSIONS_PATH']):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    app.session_interface = ServerSessionInterface(
+        _store_from_config(app), VersionBoard(app.config['SESSION_VERSIONS_PATH']),
+        lru_size=app.config['SESSION_LRU_SIZE'])
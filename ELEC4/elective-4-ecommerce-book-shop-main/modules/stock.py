@@ -0,0 +1,339 @@
+import random
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from database.connection import get_db_connection
+from modules.cache import invalidate_stock
+from modules.facets import product_facets
+from modules.jobs import job, periodic
+from modules.sales import NOT_SALES
+from modules.search import id_placeholders
+
+# =====================================
+# STOCK HELPERS
+# =====================================
+# Set-based stock changes: one statement for every line of an order,
+# instead of one UPDATE per cart item. Stock is taken by checkout holds
+# (modules/holds.py) and put back by order transitions (modules/orders.py,
+# restore_stock). Every change goes through take_stocks/return_stock/
+# set_stock, which know about sharded products.
+#
+# Sharded stock: a bestseller's stock can be split over N rows of
+# product_stock_shards (`flask shard-stock <product_id> --shards N`).
+# Taking stock then locks one random shard that has enough instead of the
+# product row, so up to N transactions selling that book run at once.
+# The shards are the truth; products.stock becomes their total, refreshed
+# by a periodic job every STOCK_SHARD_SYNC_INTERVAL for the listings,
+# cart checks and facets that read it.
+
+MAX_SHARDS = 255  # products.stock_shards is a tinyint UNSIGNED
+
+_sharded = set()  # product ids this process has seen sharded (a hint, see take_stocks)
+
+
+def quantities_table(quantities):
+    """Derived table of (product_id, qty) rows for joining in one statement."""
+    rows = ' UNION ALL '.join(['SELECT %s AS product_id, %s AS qty'] * len(quantities))
+    params = [value for product_id, qty in quantities.items() for value in (product_id, qty)]
+    return f"({rows})", params
+
+
+def _spread(total, shards):
+    """Split total over shards as evenly as possible."""
+    return [total // shards + (1 if i < total % shards else 0) for i in range(shards)]
+
+
+def _take_from_shards(cursor, product_id, qty, keep):
+    """take_stocks() for one sharded product; None if it has no shards."""
+    # Consistent (non-locking) read: a candidate list, not a promise
+    cursor.execute("SELECT shard, stock FROM product_stock_shards WHERE product_id = %s", (product_id,))
+    shards = {row['shard']: row['stock'] for row in cursor.fetchall()}
+    if not shards:
+        return None
+    if sum(shards.values()) < qty + keep:
+        return False
+
+    candidates = [shard for shard, stock in shards.items() if stock >= qty]
+    random.shuffle(candidates)
+    for shard in candidates:
+        cursor.execute("""
+            UPDATE product_stock_shards SET stock = stock - %s
+            WHERE product_id = %s AND shard = %s AND stock >= %s
+        """, (qty, product_id, shard, qty))
+        if cursor.rowcount == 1:
+            return True
+
+    # No single shard has enough (nearly sold out): lock them all and
+    # take what's needed across them
+    cursor.execute("""
+        SELECT shard, stock FROM product_stock_shards
+        WHERE product_id = %s AND stock > 0
+        ORDER BY stock DESC
+        FOR UPDATE
+    """, (product_id,))
+    rows = cursor.fetchall()
+    if sum(row['stock'] for row in rows) < qty + keep:
+        return False
+    remaining = qty
+    for row in rows:
+        part = min(remaining, row['stock'])
+        cursor.execute("UPDATE product_stock_shards SET stock = stock - %s WHERE product_id = %s AND shard = %s",
+                       (part, product_id, row['shard']))
+        remaining -= part
+        if not remaining:
+            break
+    return True
+
+
+def take_stocks(cursor, quantities, keep=0):
+    """Take {product_id: qty} if at least `keep` more of each would be left.
+
+    Runs in the caller's transaction (dictionary cursor). Unsharded
+    products are taken in one UPDATE, checked by its row count; products
+    this process has seen sharded go to their shards one at a time (the
+    first time, the UPDATE misses on stock_shards = 0 and one SELECT finds
+    out). Returns False if some product hasn't enough; lines already
+    taken are not put back then, so the caller must roll back.
+    """
+    quantities = {product_id: qty for product_id, qty in sorted(quantities.items()) if qty > 0}
+    plain = {}
+    for product_id, qty in quantities.items():
+        if product_id not in _sharded:
+            plain[product_id] = qty
+            continue
+        taken = _take_from_shards(cursor, product_id, qty, keep)
+        if taken is None:
+            _sharded.discard(product_id)  # folded back into products.stock since
+            plain[product_id] = qty
+        elif not taken:
+            return False
+    if not plain:
+        return True
+
+    # stock_shards = 0 guards against a product being sharded meanwhile
+    table, params = quantities_table(plain)
+    cursor.execute(f"""
+        UPDATE products p
+        JOIN {table} q ON q.product_id = p.product_id
+        SET p.stock = p.stock - q.qty
+        WHERE p.stock_shards = 0 AND p.stock >= q.qty + %s
+    """, params + [keep])
+    updated = cursor.rowcount
+    if updated == len(plain):
+        return True
+
+    # Not enough stock, or sharded: the sharded ones are still to take
+    ids = list(plain)
+    cursor.execute(f"""
+        SELECT product_id FROM products
+        WHERE product_id IN ({id_placeholders(ids)}) AND stock_shards > 0
+    """, ids)
+    sharded = [row['product_id'] for row in cursor.fetchall()]
+    if updated != len(plain) - len(sharded):
+        return False
+    for product_id in sorted(sharded):
+        _sharded.add(product_id)
+        if not _take_from_shards(cursor, product_id, plain[product_id], keep):
+            return False
+    return True
+
+
+def take_stock(cursor, product_id, qty, keep=0):
+    """take_stocks() for one product; returns False, changing nothing, if there isn't enough."""
+    return take_stocks(cursor, {product_id: qty}, keep)
+
+
+def return_stock(cursor, quantities):
+    """Put {product_id: qty} back, each sharded product into a random shard."""
+    if not quantities:
+        return
+    ids = list(quantities)
+    cursor.execute(f"SELECT product_id, stock_shards FROM products WHERE product_id IN ({id_placeholders(ids)})", ids)
+    shard_counts = {row['product_id']: row['stock_shards'] for row in cursor.fetchall()}
+
+    sharded = {product_id: qty for product_id, qty in quantities.items() if shard_counts.get(product_id)}
+    if sharded:
+        rows = ' UNION ALL '.join(['SELECT %s AS product_id, %s AS shard, %s AS qty'] * len(sharded))
+        params = [value for product_id, qty in sharded.items()
+                  for value in (product_id, random.randrange(shard_counts[product_id]), qty)]
+        cursor.execute(f"""
+            UPDATE product_stock_shards s
+            JOIN ({rows}) q ON q.product_id = s.product_id AND q.shard = s.shard
+            SET s.stock = s.stock + q.qty
+        """, params)
+
+    plain = {product_id: qty for product_id, qty in quantities.items() if product_id not in sharded}
+    if plain:
+        table, params = quantities_table(plain)
+        cursor.execute(f"""
+            UPDATE products p
+            JOIN {table} q ON q.product_id = p.product_id
+            SET p.stock = COALESCE(p.stock, 0) + q.qty
+        """, params)
+
+
+def stock_total(cursor, product_id):
+    """Current stock of a product, summing its shards if it has any."""
+    cursor.execute("""
+        SELECT p.stock_shards, p.stock, SUM(s.stock) AS shard_total
+        FROM products p
+        LEFT JOIN product_stock_shards s ON s.product_id = p.product_id
+        WHERE p.product_id = %s
+        GROUP BY p.product_id, p.stock_shards, p.stock
+    """, (product_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return int(row['shard_total'] or 0) if row['stock_shards'] else row['stock']
+
+
+def set_stock(cursor, product_id, stock):
+    """Admin write of a sharded product's stock: rebalance it over the shards.
+
+    Call after products.stock itself was written (edit, import); a no-op
+    for products that aren't sharded.
+    """
+    cursor.execute("SELECT stock_shards FROM products WHERE product_id = %s FOR UPDATE", (product_id,))
+    row = cursor.fetchone()
+    if not row or not row['stock_shards']:
+        return
+    cursor.execute("SELECT shard FROM product_stock_shards WHERE product_id = %s FOR UPDATE", (product_id,))
+    cursor.fetchall()
+    cursor.executemany("""
+        INSERT INTO product_stock_shards (product_id, shard, stock) VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE stock = VALUES(stock)
+    """, [(product_id, shard, part) for shard, part in enumerate(_spread(int(stock or 0), row['stock_shards']))])
+
+
+def shard_stock(conn, product_id, shards):
+    """Split a product's stock over `shards` rows (0 folds them back into products.stock)."""
+    if not 0 <= shards <= MAX_SHARDS:
+        raise ValueError(f"shards must be between 0 and {MAX_SHARDS}")
+    cursor = conn.cursor(dictionary=True)
+    try:
+        conn.start_transaction()
+        cursor.execute("SELECT stock_shards FROM products WHERE product_id = %s FOR UPDATE", (product_id,))
+        if cursor.fetchone() is None:
+            conn.rollback()
+            return None
+        total = stock_total(cursor, product_id)
+        cursor.execute("DELETE FROM product_stock_shards WHERE product_id = %s", (product_id,))
+        if shards > 0:
+            cursor.executemany("""
+                INSERT INTO product_stock_shards (product_id, shard, stock) VALUES (%s, %s, %s)
+            """, [(product_id, shard, part) for shard, part in enumerate(_spread(total or 0, shards))])
+        cursor.execute("UPDATE products SET stock = %s, stock_shards = %s WHERE product_id = %s",
+                       (total, shards, product_id))
+        conn.commit()
+        return total
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def sync_stock_totals(cursor):
+    """Copy each sharded product's shard total into products.stock; returns rows changed.
+
+    The totals come from a plain read, so the shards checkouts lock are
+    never locked here. updated_at is left alone: a total catching up isn't
+    an edit, and it keys the product's card fragments and ETags.
+    """
+    cursor.execute("SELECT product_id, SUM(stock) AS total FROM product_stock_shards GROUP BY product_id")
+    totals = {row['product_id']: int(row['total']) for row in cursor.fetchall()}
+    if not totals:
+        return 0
+    table, params = quantities_table(totals)
+    cursor.execute(f"""
+        UPDATE products p
+        JOIN {table} q ON q.product_id = p.product_id
+        SET p.stock = q.qty, p.updated_at = p.updated_at
+        WHERE p.stock_shards > 0 AND NOT p.stock <=> q.qty
+    """, params)
+    # Listings and product pages pick the totals up on their cache TTL
+    return cursor.rowcount
+
+
+@periodic('sync_stock_totals', 'STOCK_SHARD_SYNC_INTERVAL', 2)
+def sync_stock_job(cursor, payload, job_id):
+    sync_stock_totals(cursor)
+
+
+def restore_stock(cursor, order_ids):
+    """Put cancelled/declined orders' quantities back, once per order.
+
+    orders.stock_restored is flipped in the caller's transaction, so an
+    order that was already restored (or isn't cancelled/declined) is
+    skipped. One statement restores every line of every order. Returns
+    {product_id: qty} restored.
+    """
+    if not order_ids:
+        return {}
+    cursor.execute(f"""
+        SELECT order_id FROM orders
+        WHERE order_id IN ({id_placeholders(order_ids)})
+          AND stock_restored = 0 AND status IN ({id_placeholders(NOT_SALES)})
+        FOR UPDATE
+    """, (*order_ids, *NOT_SALES))
+    restoring = [row['order_id'] for row in cursor.fetchall()]
+    if not restoring:
+        return {}
+    cursor.execute(f"UPDATE orders SET stock_restored = 1 WHERE order_id IN ({id_placeholders(restoring)})",
+                   restoring)
+
+    cursor.execute(f"""
+        SELECT product_id, SUM(quantity) AS qty
+        FROM order_items WHERE order_id IN ({id_placeholders(restoring)})
+        GROUP BY product_id
+    """, restoring)
+    quantities = {row['product_id']: int(row['qty']) for row in cursor.fetchall()}
+    return_stock(cursor, quantities)
+    return quantities
+
+
+def stock_restored(quantities):
+    """After the commit: this process's cached copies of restored stock.
+
+    Other processes catch up on their cache TTL and facet refresh.
+    """
+    if quantities:
+        invalidate_stock(quantities)
+        product_facets.adjust_stock(quantities)
+
+
+@job('restock_order')
+def restock_order(cursor, payload, job_id):
+    """Restore one order's stock (jobs queued before transitions did it inline)."""
+    quantities = restore_stock(cursor, [payload['order_id']])
+    return (lambda: stock_restored(quantities)) if quantities else None
+
+
+# =====================================
+# CLI
+# =====================================
+
+
+@click.command('shard-stock')
+@click.argument('product_id', type=int)
+@click.option('--shards', type=click.IntRange(0, MAX_SHARDS), default=None,
+              help='Number of shards (default STOCK_SHARDS; 0 = unshard).')
+@with_appcontext
+def shard_stock_command(product_id, shards):
+    """Split a hot product's stock over shard rows, or fold them back."""
+    if shards is None:
+        shards = current_app.config['STOCK_SHARDS']
+        if not 0 <= shards <= MAX_SHARDS:
+            raise click.ClickException(f"STOCK_SHARDS must be between 0 and {MAX_SHARDS}")
+    total = shard_stock(get_db_connection(), product_id, shards)
+    if total is None:
+        raise click.ClickException(f"no product {product_id}")
+    click.echo(f"product {product_id}: {total} in stock over {shards or 'no'} shard(s)")
+
+
+def init_stock(app):
+    app.config.setdefault('STOCK_SHARDS', 8)
+    app.config.setdefault('STOCK_SHARD_SYNC_INTERVAL', 2)
+    app.cli.add_command(shard_stock_command)
@@ -0,0 +1,85 @@
+from flask import Response, current_app, request, stream_template
+
+from database.connection import open_db_connection, release_db_connection
+from modules.search import id_placeholders
+
+# =====================================
+# STREAMED LISTINGS
+# =====================================
+# `?all=1` on the admin user, product and order listings shows every
+# matching row on one page. Instead of fetchall() + render_template, the
+# rows are read from an unbuffered cursor and fed as a generator to
+# stream_template: the page head goes out right away, rows are sent as
+# the server returns them, and memory stays flat however many rows match.
+#
+# The rows come from a connection of their own, held until the body has
+# been sent; the request's connection is handed back before streaming.
+# Nothing after the first chunk can change the status or headers, so a
+# database error mid-listing ends the page early (and is logged).
+
+
+def wants_all():
+    return request.args.get('all') == '1'
+
+
+def rank_order(column, ranked_ids):
+    """ORDER BY clause (and params) keeping search results in rank order."""
+    if not ranked_ids:
+        return f" ORDER BY {column}", []
+    return f" ORDER BY FIELD({column}, {id_placeholders(ranked_ids)})", list(ranked_ids)
+
+
+def stream_rows(query, params=()):
+    """Yield the rows of `query` as dicts, reading them in batches."""
+    conn = open_db_connection()
+    cursor = conn.cursor(dictionary=True, buffered=False)
+    exhausted = False
+    try:
+        cursor.execute(query, tuple(params))
+        size = current_app.config.get('STREAM_FETCH_SIZE', 500)
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                exhausted = True
+                return
+            yield from rows
+    except Exception as e:
+        print("STREAMED LISTING ERROR:", e)
+    finally:
+        if exhausted:
+            cursor.close()
+            conn.close()
+        else:
+            # Client went away (or the query failed) with rows still unread:
+            # closing the socket is cheaper than draining the result
+            conn.discard()
+
+
+def _coalesce(chunks, size):
+    # Jinja yields a few bytes per template statement; send bigger writes
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_listing(template_name, **context):
+    """Response that renders `template_name` while its row generator runs."""
+    release_db_connection()
+    chunks = stream_template(template_name, streamed=True, page=None, **context)
+    return Response(
+        _coalesce(chunks, current_app.config['STREAM_CHUNK_BYTES']),
+        mimetype='text/html',
+        # Tell a buffering proxy (nginx) to pass chunks straight through
+        headers={'X-Accel-Buffering': 'no'},
+    )
+
+
+def init_streaming(app):
+    app.config.setdefault('STREAM_FETCH_SIZE', 500)
+    app.config.setdefault('STREAM_CHUNK_BYTES', 16384)
@@ -0,0 +1,211 @@
+import os
+import secrets
+import shutil
+import tempfile
+import time
+
+import click
+from flask import current_app, has_app_context, flash, redirect, request, url_for
+from flask.cli import with_appcontext
+from werkzeug.exceptions import RequestEntityTooLarge
+from database.connection import get_db_connection
+from modules import images
+
+# =====================================
+# PAYMENT PROOF UPLOADS
+# =====================================
+# The proof is streamed into a spool file (size-capped) while the request
+# is read. Only once the order transaction has committed is it handed to
+# the background pool to be moved into static/img/payments and
+# thumbnailed. A failed order just deletes its spool file, and
+# `flask sweep-uploads` clears anything left behind by crashes.
+#
+# On commit the spool file is renamed to the proof's final name, so a
+# proof whose publish keeps failing can still be recognised: the
+# sweeper publishes spool files an order points at instead of deleting
+# them.
+
+PAYMENT_DIR = os.path.join('static', 'img', 'payments')
+PROOF_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'pdf'}
+PROOF_THUMB_WIDTHS = (160,)
+PUBLISH_ATTEMPTS = 3
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadRejected(Exception):
+    """The upload is too large or not an accepted file type."""
+
+
+def _config(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+
+def spool_dir():
+    path = _config('UPLOAD_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'bookshop-spool'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class SpooledUpload:
+    """An upload copied to the spool; commit() publishes it, discard() drops it."""
+
+    def __init__(self, path, ext):
+        self.path = path
+        self.ext = ext
+        self.final_name = None
+
+    def name_for(self, order_id):
+        """Unguessable public filename; call once the order id is known."""
+        self.final_name = f"pay_{order_id}_{secrets.token_hex(8)}.{self.ext}"
+        return self.final_name
+
+    def commit(self):
+        """After the DB commit: move into PAYMENT_DIR and thumbnail, off-thread."""
+        path, self.path = self.path, None
+        named = os.path.join(os.path.dirname(path), self.final_name)
+        try:
+            os.replace(path, named)
+            path = named
+        except OSError as e:
+            print(f"PAYMENT PROOF {self.final_name}: could not rename spool file {path}: {e}")
+        return images.submit(_publish, path, PAYMENT_DIR, self.final_name)
+
+    def discard(self):
+        if self.path:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+
+def spool_upload(file_storage):
+    """Stream an upload into the spool, enforcing PAYMENT_PROOF_MAX_BYTES."""
+    ext = file_storage.filename.rsplit('.', 1)[-1].lower() if '.' in file_storage.filename else ''
+    if ext not in PROOF_EXTENSIONS:
+        raise UploadRejected("Payment proof must be an image or PDF.")
+
+    max_bytes = _config('PAYMENT_PROOF_MAX_BYTES', 5 * 1024 * 1024)
+    fd, path = tempfile.mkstemp(prefix='proof-', suffix='.part', dir=spool_dir())
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: file_storage.stream.read(CHUNK_SIZE), b''):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(
+                        f"Payment proof is larger than {max_bytes / (1024 * 1024):.1f} MB.")
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    if size == 0:
+        os.remove(path)
+        raise UploadRejected("Payment proof is empty.")
+    return SpooledUpload(path, ext)
+
+
+def _publish(spool_path, folder, name, attempts=PUBLISH_ATTEMPTS):
+    """Move a proof out of the spool and thumbnail it; True once it is published."""
+    for attempt in range(1, attempts + 1):
+        try:
+            os.makedirs(folder, exist_ok=True)
+            shutil.move(spool_path, os.path.join(folder, name))
+            break
+        except Exception as e:
+            if attempt == attempts:
+                print(f"PAYMENT PROOF {name} NOT PUBLISHED ({e}); "
+                      f"left in {spool_path} for `flask sweep-uploads` to retry")
+                return False
+            time.sleep(attempt)
+
+    if images.Image is not None and not name.endswith('.pdf'):
+        try:
+            images.generate_variants(folder, name, PROOF_THUMB_WIDTHS)
+        except Exception as e:
+            print(f"Payment proof {name} thumbnail failed: {e}")
+    return True
+
+
+# =====================================
+# CLI: orphan sweeper
+# =====================================
+
+
+def _referenced_proofs():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT proof FROM payments WHERE proof IS NOT NULL
+            UNION
+            SELECT payment_proof FROM orders WHERE payment_proof IS NOT NULL
+        """)
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+        conn.close()
+
+
+@click.command('sweep-uploads')
+@click.option('--older-than', default=3600, show_default=True,
+              help='Only remove files untouched for this many seconds.')
+@click.option('--dry-run', is_flag=True, help='List what would be removed.')
+@with_appcontext
+def sweep_uploads_command(older_than, dry_run):
+    """Remove stale spool files and payment proofs no order points at.
+
+    Spool files an order points at (their publish failed) are published
+    again instead.
+    """
+    cutoff = time.time() - older_than
+    candidates = []
+    referenced = _referenced_proofs()
+
+    spool = spool_dir()
+    for name in sorted(os.listdir(spool)):
+        path = os.path.join(spool, name)
+        if name not in referenced:
+            candidates.append(path)
+        elif dry_run:
+            click.echo(f"would publish {path}")
+        elif _publish(path, PAYMENT_DIR, name, attempts=1):
+            click.echo(f"published {path}")
+        else:
+            click.echo(f"could not publish {path}", err=True)
+
+    if os.path.isdir(PAYMENT_DIR):
+        variant_dir = os.path.join(PAYMENT_DIR, images.VARIANT_DIR)
+        for name in os.listdir(PAYMENT_DIR):
+            path = os.path.join(PAYMENT_DIR, name)
+            if os.path.isfile(path) and name not in referenced:
+                candidates.append(path)
+                candidates.extend(
+                    os.path.join(variant_dir, images.variant_name(name, w, ext))
+                    for w in PROOF_THUMB_WIDTHS for ext in (None, '.webp'))
+
+    removed = 0
+    for path in candidates:
+        try:
+            if os.path.getmtime(path) > cutoff:
+                continue
+            if not dry_run:
+                os.remove(path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+        click.echo(f"{'would remove' if dry_run else 'removed'} {path}")
+    click.echo(f"{removed} file(s)")
+
+
+def _request_too_large(e):
+    """MAX_CONTENT_LENGTH hit: bounce back instead of a bare 413 page."""
+    flash("That upload is too large.", "danger")
+    return redirect(request.referrer or url_for('landing'))
+
+
+def init_uploads(app):
+    app.config.setdefault('PAYMENT_PROOF_MAX_BYTES', 5 * 1024 * 1024)
+    app.config.setdefault('UPLOAD_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'bookshop-spool'))
+    app.register_error_handler(RequestEntityTooLarge, _request_too_large)
+    app.cli.add_command(sweep_uploads_command)
@@ -0,0 +1,20 @@
+"""Production entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+gunicorn.conf.py preloads this module in the master, so the blueprints
+are registered and every template is compiled once; forked workers share
+that memory copy-on-write. The compiled bytecode is also kept on disk
+(TEMPLATE_BYTECODE_CACHE_DIR), so the next start skips the compiler.
+Per-process resources (DB pool, image and hashing pools) are created
+lazily inside each worker after the fork.
+"""
+from app import create_app
+
+app = create_app()
+
+# Compile the templates now rather than on each worker's first requests
+with app.app_context():
+    for name in app.jinja_env.list_templates():
+        if name.endswith('.html'):
+            app.jinja_env.get_template(name)